@@ -0,0 +1,241 @@
+"""
+Columnar on-disk store of 1-minute bars for long intraday history.
+One directory per day next to the database, one float32 memmap per field:
+
+    bars/2026-10-16/tickers.txt     ticker index - line i = row i of every field file
+    bars/2026-10-16/close.f32       (tickers x SLOTS_PER_DAY) matrix, NaN = no bar
+    bars/2026-10-16/open.f32 ...
+
+Column = minute since local midnight, so the place of a bar is computed, not
+searched, and "all tickers, last 60 minutes" is a view of the mapped file -
+nothing to deserialize. The fetcher is the only writer (append-only: new
+tickers take the next row, bars fill cells, a still-forming bar is
+overwritten in place). Rows are preallocated in blocks of CAPACITY_STEP, so
+files are practically never resized while mapped (Windows refuses that);
+a grow closes the writer's own maps first and only extends the files.
+Readers map the files read-only, so any number of them - also in other
+processes - share the pages through the OS page cache.
+SQLite (`ticks`) stays the source of truth; this is a copy for fast scans.
+
+    store = BarStore()
+    store.append(bars)                  # same tuples as database.save_bars
+    day = store.day(ts)                 # BarDay (read-only) or None
+    times, close = day.window('close', now - 3600, now)    # view, tickers x minutes
+"""
+import datetime
+import os
+
+import numpy as np
+
+import database
+from metrics import metrics
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume', 'change_pct')
+SLOTS_PER_DAY = 25 * 60     # Minutes since local midnight (25 h - DST change day)
+DTYPE = np.dtype('<f4')
+ROW_BYTES = SLOTS_PER_DAY * DTYPE.itemsize
+CAPACITY_STEP = 256         # Ticker rows allocated at once (~1.5 MB per field)
+INDEX_FILE = 'tickers.txt'
+
+_NAN_ROW = np.full(SLOTS_PER_DAY, np.nan, dtype=DTYPE).tobytes()
+
+
+def default_root():
+    """bars/ next to the SQLite file (resolved on use - DB_FILE may be changed at runtime)."""
+    return os.path.join(os.path.dirname(database.DB_FILE), "bars")
+
+
+def day_bounds(ts):
+    """[start, end) epoch seconds of the local day containing ts (same day cut as the fetcher)."""
+    day = datetime.datetime.fromtimestamp(ts).date()
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return int(start.timestamp()), int((start + datetime.timedelta(days=1)).timestamp())
+
+
+class BarDay:
+    """
+    One day of the store. Readers open it with mode 'r' (read-only views),
+    the writer with 'r+'. Rows follow the ticker index, columns are minutes.
+    """
+    def __init__(self, path, start, mode='r'):
+        self.path = path
+        self.start = start
+        self.mode = mode
+        self.tickers = []
+        self.rows = {}          # ticker -> row
+        self.capacity = 0       # Rows allocated in the field files
+        self._fields = {}       # name -> map of all allocated rows
+        self.refresh()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _allocated(self):
+        # Smallest field file - a grow may have been interrupted half way
+        sizes = [os.path.getsize(p) if os.path.exists(p) else 0
+                 for p in (self._file(name + '.f32') for name in FIELDS)]
+        return min(sizes) // ROW_BYTES
+
+    def refresh(self):
+        """Re-reads the ticker index and re-maps the fields if rows were added. Returns the number of tickers."""
+        with open(self._file(INDEX_FILE), encoding='utf-8') as f:
+            # Only complete lines - the writer may be appending right now
+            names = f.read().split('\n')[:-1]
+        capacity = self._allocated()
+        names = names[:capacity]    # Rows are allocated before indexing - never more names
+        if len(names) != len(self.tickers) or capacity != self.capacity or not self._fields:
+            self.tickers = names
+            self.rows = {t: i for i, t in enumerate(names)}
+            self.capacity = capacity
+            self._fields = {name: self._map(name, capacity) for name in FIELDS}
+        return len(self.tickers)
+
+    def _map(self, name, capacity):
+        if not capacity:
+            return np.full((0, SLOTS_PER_DAY), np.nan, dtype=DTYPE)
+        return np.memmap(self._file(name + '.f32'), dtype=DTYPE, mode=self.mode, shape=(capacity, SLOTS_PER_DAY))
+
+    def field(self, name):
+        """(tickers x SLOTS_PER_DAY) mapped matrix of one field."""
+        return self._fields[name][:len(self.tickers)]
+
+    def slot(self, ts):
+        """Column of the minute containing ts."""
+        return int(ts - self.start) // 60
+
+    def times(self, slots):
+        """Bar ts of the given columns."""
+        return self.start + 60 * np.asarray(slots, dtype=np.int64)
+
+    def window(self, name, since_ts, until_ts):
+        """
+        Bars with since_ts <= ts < until_ts of all tickers: (times, view).
+        The view (tickers x minutes) shares memory with the file - no copy.
+        """
+        first = min(max(0, -((self.start - since_ts) // 60)), SLOTS_PER_DAY)
+        last = min(max(first, -((self.start - until_ts) // 60)), SLOTS_PER_DAY)
+        return self.times(np.arange(first, last)), self.field(name)[:, first:last]
+
+    # --- Writer (mode 'r+') ---
+
+    def add_tickers(self, tickers):
+        """Indexes tickers not seen yet. Their rows are reset first, then the index is appended."""
+        new = [t for t in dict.fromkeys(tickers) if t not in self.rows]
+        if not new:
+            return
+        n = len(self.tickers)
+        need = n + len(new)
+        if need > self.capacity:
+            self._grow(-(-need // CAPACITY_STEP) * CAPACITY_STEP)
+        # Spare rows may hold data of an interrupted add - clear before indexing
+        for m in self._fields.values():
+            m[n:need] = np.nan
+            m.flush()
+        with open(self._file(INDEX_FILE), 'a', encoding='utf-8') as f:
+            f.write(''.join(t + '\n' for t in new))
+        self.refresh()
+
+    def _grow(self, capacity):
+        """
+        Allocates rows up to `capacity`. The files are only extended (never
+        truncated), with this object's maps closed - a mapped file can't be
+        resized on Windows. Raises OSError if another map still blocks it.
+        """
+        self.flush()
+        self._fields = {}   # Drops the maps (no views are kept by the writer)
+        try:
+            for name in FIELDS:
+                path = self._file(name + '.f32')
+                have = (os.path.getsize(path) if os.path.exists(path) else 0) // ROW_BYTES
+                if have < capacity:
+                    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                        f.seek(have * ROW_BYTES)
+                        f.write(_NAN_ROW * (capacity - have))
+        finally:
+            self.refresh()
+
+    def write(self, tickers, ts, values):
+        """
+        One bar per element: tickers (list), ts (int array), values {field: float array}.
+        If new tickers can't get rows (OSError), bars of the known ones are still written.
+        """
+        error = None
+        try:
+            self.add_tickers(tickers)
+        except OSError as e:
+            error = e
+            keep = np.array([t in self.rows for t in tickers], dtype=bool)
+            tickers = [t for t, k in zip(tickers, keep) if k]
+            ts = ts[keep]
+            values = {k: v[keep] for k, v in values.items()}
+        rows = np.fromiter((self.rows[t] for t in tickers), dtype=np.intp, count=len(tickers))
+        slots = (ts - self.start) // 60
+        for name in FIELDS:
+            self._fields[name][rows, slots] = values[name]
+        if error is not None:
+            raise error
+
+    def flush(self):
+        for m in self._fields.values():
+            if isinstance(m, np.memmap):
+                m.flush()
+
+
+class BarStore:
+    """Day directories under `root`. One writer (the fetcher) appends, readers open days read-only."""
+    def __init__(self, root=None):
+        self.root = root or default_root()
+        self._writer = None     # BarDay being written (mode 'r+')
+
+    def _path(self, start):
+        return os.path.join(self.root, datetime.date.fromtimestamp(start).isoformat())
+
+    def days(self):
+        """Stored days (ISO dates), oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.exists(os.path.join(self.root, d, INDEX_FILE)))
+
+    def day(self, ts):
+        """Read-only BarDay of the day containing ts, or None if nothing was stored that day."""
+        start, _ = day_bounds(ts)
+        path = self._path(start)
+        if not os.path.exists(os.path.join(path, INDEX_FILE)):
+            return None
+        return BarDay(path, start)
+
+    def _writer_day(self, start):
+        if self._writer is None or self._writer.start != start:
+            path = self._path(start)
+            os.makedirs(path, exist_ok=True)
+            open(os.path.join(path, INDEX_FILE), 'a').close()
+            self._writer = BarDay(path, start, mode='r+')
+        return self._writer
+
+    @metrics.timed('bars.append')
+    def append(self, bars):
+        """
+        Stores bars: tuples (ticker, ts, open, high, low, close, volume, change_pct)
+        as for database.save_bars. A re-sent (ticker, ts) replaces the stored bar.
+        """
+        bars = list(bars)
+        if not bars:
+            return
+        columns = list(zip(*bars))
+        tickers = columns[0]
+        ts = np.array(columns[1], dtype=np.int64)
+        values = {name: np.array(col, dtype=float) for name, col in zip(FIELDS, columns[2:])}
+
+        # Usually one day; a backfill over midnight is split per day
+        times, inverse = np.unique(ts, return_inverse=True)
+        starts = np.array([day_bounds(t)[0] for t in times.tolist()], dtype=np.int64)[inverse]
+        for start in np.unique(starts).tolist():
+            idx = np.flatnonzero(starts == start)
+            day = self._writer_day(start)
+            day.write([tickers[i] for i in idx.tolist()], ts[idx], {k: v[idx] for k, v in values.items()})
+            day.flush()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.flush()
+            self._writer = None
@@ -0,0 +1,416 @@
+"""
+Benchmark suite for the fetch -> persist -> render hot paths.
+
+Builds synthetic portfolios at sWIG80, full-WIG and 2,000-ticker scale in a
+temporary database and reports p50/p95 latency and peak memory per stage.
+Runs headless (Agg backend, local HTTP stub instead of Biznesradar).
+
+    python benchmark.py                      # all scales -> benchmark_results.json
+    python benchmark.py --scales swig80 --repeat 50 --output before.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+import database
+from bar_store import BarStore
+from portfolio import portfolio_from_rows
+
+SCALES = {
+    'swig80': 80,
+    'wig': 300,
+    'full2000': 2000,
+}
+
+HISTORY_BARS = 60       # Minute bars per ticker stored before the run
+SECTOR_RATE = 500.0     # Requests/s for the local stub (we measure the pipeline, not the limiter)
+
+
+def measure(fn, repeat, setup=None):
+    """Runs fn `repeat` times. Returns (latencies in ms, peak traced memory in KB)."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+
+    # Peak memory from a separate run - tracemalloc distorts timings
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak / 1024.0
+
+
+def summarize(name, scale, n, times, peak_kb):
+    arr = np.asarray(times)
+    result = {
+        'name': name,
+        'scale': scale,
+        'n': n,
+        'repeat': len(times),
+        'p50_ms': round(float(np.percentile(arr, 50)), 3),
+        'p95_ms': round(float(np.percentile(arr, 95)), 3),
+        'mean_ms': round(float(arr.mean()), 3),
+        'peak_kb': round(peak_kb, 1),
+    }
+    return result
+
+
+def skipped(name, scale, n, reason):
+    return {'name': name, 'scale': scale, 'n': n, 'skipped': reason}
+
+
+def print_result(r):
+    head = f"{r['name']:<30} {r['scale']:<9} n={r['n']:<5}"
+    if 'skipped' in r:
+        print(f"{head} SKIPPED ({r['skipped']})")
+    else:
+        print(f"{head} p50={r['p50_ms']:>9.2f} ms  p95={r['p95_ms']:>9.2f} ms  peak={r['peak_kb']:>9.1f} KB")
+
+
+# --- Fixtures ---
+
+def seed_database(portfolio, now_ts):
+    """Portfolio + sectors + HISTORY_BARS minute bars per ticker."""
+    database.init_db()
+    database.save_portfolio_snapshot(portfolio)
+    database.bulk_upsert_sectors({c['ticker']: c['sector'] for c in portfolio})
+    rng = np.random.default_rng(1)
+    bars = []
+    start = now_ts - HISTORY_BARS * 60
+    for c in portfolio:
+        closes = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.001, HISTORY_BARS)))
+        for i, close in enumerate(closes.tolist()):
+            bars.append((c['ticker'], start + i * 60, close, close, close, close, 1000.0, 0.0))
+    database.save_bars(bars)
+    BarStore().append(bars)
+
+
+class _StubProvider:
+    """Serves columns of one pre-built frame (no network, no generation cost)."""
+    name = "stub"
+
+    def __init__(self, frame, now_ts):
+        self.frame = frame
+        self.now_ts = now_ts
+        self.columns = {}
+        if frame is not None:
+            for i, symbol in enumerate(frame.columns.get_level_values(0)):
+                self.columns.setdefault(symbol, []).append(i)
+
+    def download(self, symbols, since_ts):
+        if self.frame is None:
+            return None
+        # Only the requested chunk, like a real provider
+        cols = [i for s in symbols for i in self.columns.get(s, ())]
+        return self.frame.iloc[:, cols]
+
+    def now(self):
+        return self.now_ts
+
+
+class _SectorStub(BaseHTTPRequestHandler):
+    BODY = b'<html><a href="/notowania/indeks:WIG-INFO,x">WIG-INFO</a></html>'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.BODY)))
+        self.end_headers()
+        self.wfile.write(self.BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+# --- Benchmarks ---
+
+def bench_database(scale, portfolio, repeat):
+    n = len(portfolio)
+    results = []
+    times, peak = measure(database.load_portfolio_from_db, repeat)
+    results.append(summarize('load_portfolio_from_db', scale, n, times, peak))
+
+    priced = [dict(c, price=100.0, change_pct=0.5) for c in portfolio]
+    times, peak = measure(lambda: database.save_portfolio_snapshot(priced), repeat)
+    results.append(summarize('save_portfolio_snapshot', scale, n, times, peak))
+    return results
+
+
+def bench_fetcher(scale, portfolio, repeat, now_ts):
+    from market_data import MarketDataFetcher
+    from providers import SyntheticProvider
+    from symbols import symbol_master
+
+    symbols = [symbol_master.yahoo(c['ticker']) for c in portfolio]
+    # Typical delta cycle: the last two minute bars of every symbol
+    frame = SyntheticProvider(start_ts=now_ts - 120).download(symbols, now_ts - 120)
+    frame = frame.iloc[-2:] if frame is not None and len(frame) > 2 else frame
+
+    fetcher = MarketDataFetcher(provider=_StubProvider(frame, now_ts))
+    fetcher.update_market_data() # Warm-up: cold start + state restore
+    times, peak = measure(fetcher.update_market_data, repeat)
+    return [summarize('update_market_data', scale, len(portfolio), times, peak)]
+
+
+def bench_bar_window(scale, portfolio, repeat, now_ts):
+    """All tickers, last 60 minutes of closes: mapped bar store vs SQLite rows."""
+    tickers = [c['ticker'] for c in portfolio]
+    since = now_ts - HISTORY_BARS * 60
+
+    def from_store():
+        _, close = BarStore().day(since).window('close', since, now_ts)
+        return np.nanmean(close, axis=1)
+
+    def from_sqlite():
+        return database.load_session_changes(tickers, since, now_ts)
+
+    results = []
+    for name, fn in (('bar_store.window', from_store), ('load_session_changes', from_sqlite)):
+        times, peak = measure(fn, repeat)
+        results.append(summarize(name, scale, len(portfolio), times, peak))
+    return results
+
+
+def bench_portfolio(scale, portfolio, repeat):
+    """PortfolioSnapshot build - once per published version, shared by all views."""
+    rows = [dict(c, price=100.0, change_pct=0.5) for c in portfolio]
+    times, peak = measure(lambda: portfolio_from_rows(rows), repeat)
+    return [summarize('portfolio_from_rows', scale, len(portfolio), times, peak)]
+
+
+def bench_heatmap(scale, portfolio, repeat):
+    from charts import HeatMapRenderer
+
+    rng = np.random.default_rng(2)
+    data = [dict(c, change_pct=round(float(rng.normal(0, 2)), 1)) for c in portfolio]
+    fig, ax = plt.subplots(figsize=(12, 8))
+    renderer = HeatMapRenderer(fig, ax)
+    renderer.render(portfolio_from_rows(data))
+    fig.canvas.draw()
+    state = {}
+
+    def tick():
+        # New snapshot per version - built by market_state on publish, not by the view.
+        # A third of the tickers move by 0.1 p.p. (like consecutive live updates)
+        for c in data:
+            if rng.random() < 1 / 3:
+                c['change_pct'] = round(c['change_pct'] + rng.choice((-0.1, 0.1)), 1)
+        state['portfolio'] = portfolio_from_rows(data)
+
+    def update_plot():
+        # Live frame as the render thread makes it - no full canvas.draw()
+        renderer.render(state['portfolio'])
+        renderer.frame().tobytes()
+
+    for _ in range(20):     # Builds the background/overlay and the common % line sprites
+        tick()
+        update_plot()
+    times, peak = measure(update_plot, repeat, setup=tick)
+    plt.close(fig)
+    return [summarize('HeatMapVisualizer.update_plot', scale, len(portfolio), times, peak)]
+
+
+def bench_replay_frame(scale, portfolio, repeat):
+    """One heatmap replay frame (recolor + cached overlay) -> RGBA bytes. 30 fps needs < 33 ms."""
+    from charts import HeatMapRenderer, change_colors
+
+    rng = np.random.default_rng(5)
+    fig, ax = plt.subplots(figsize=(12, 8))
+    renderer = HeatMapRenderer(fig, ax)
+    renderer.render(portfolio_from_rows([dict(c, change_pct=0.0) for c in portfolio]))
+    fig.canvas.draw()
+    n = len(renderer.tickers)
+    renderer.replay_frame(change_colors(np.zeros(n)), "Powtórka") # Builds the caches
+    colors = {}
+
+    def tick():
+        colors['rgba'] = change_colors(rng.normal(0, 2, n))
+
+    times, peak = measure(lambda: renderer.replay_frame(colors['rgba'], "Powtórka").tobytes(), repeat, setup=tick)
+    plt.close(fig)
+    return [summarize('HeatMapRenderer.replay_frame', scale, len(portfolio), times, peak)]
+
+
+def bench_render_worker(scale, portfolio, repeat):
+    """Heatmap frame through the render thread: request -> ready RGBA buffer (what the GUI waits for)."""
+    from market_state import MarketSnapshot
+    from render_worker import RenderWorker
+    from visualizer import heatmap_setup
+
+    rng = np.random.default_rng(4)
+    worker = RenderWorker('bench', heatmap_setup)
+    versions = iter(range(1, 10**6))
+    state = {}
+
+    def tick():
+        rows = tuple(dict(c, change_pct=float(rng.normal(0, 2))) for c in portfolio)
+        state['snap'] = MarketSnapshot(next(versions), rows, time.time(), portfolio=portfolio_from_rows(rows))
+
+    def frame():
+        done = threading.Event()
+        worker.request(state['snap'], (1200, 800), lambda image: done.set())
+        done.wait()
+
+    try:
+        times, peak = measure(frame, repeat, setup=tick)
+    finally:
+        worker.shutdown()
+    return [summarize('RenderWorker.frame', scale, len(portfolio), times, peak)]
+
+
+def bench_populate_tree(scale, portfolio, repeat):
+    import tkinter as tk
+    from dashboard import BaseDashboardFrame
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return [skipped('populate_tree', scale, len(portfolio), f"no display: {e}")]
+    root.withdraw()
+    try:
+        frame = BaseDashboardFrame(root)
+        tree = frame.create_treeview(frame, ("Ticker", "Sector", "Price", "Change %", "Share %"))
+        rng = np.random.default_rng(3)
+        data = [dict(c, price=100.0, change_pct=0.0) for c in portfolio]
+        state = {'portfolio': portfolio_from_rows(data)}
+        frame.populate_tree(tree, state['portfolio'], state['portfolio'].by_share)
+
+        def tick():
+            # ~10% of the universe changes price between refreshes
+            for i in rng.choice(len(data), max(1, len(data) // 10), replace=False):
+                data[i]['price'] = round(data[i]['price'] + float(rng.normal(0, 0.5)), 2)
+            state['portfolio'] = portfolio_from_rows(data)
+
+        def populate():
+            p = state['portfolio']
+            frame.populate_tree(tree, p, p.by_share)
+
+        times, peak = measure(populate, repeat, setup=tick)
+        return [summarize('populate_tree', scale, len(portfolio), times, peak)]
+    finally:
+        root.destroy()
+
+
+def bench_enrich(scale, portfolio, repeat):
+    import sectors
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _SectorStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    old_url, old_limiter = sectors.BIZNESRADAR_URL, sectors.rate_limiter
+    sectors.BIZNESRADAR_URL = f"http://127.0.0.1:{server.server_port}/notowania/{{ticker}}"
+    sectors.rate_limiter = sectors.TokenBucket(SECTOR_RATE, capacity=SECTOR_RATE)
+    try:
+        rounds = iter(range(10**6))
+        batch = []
+
+        def new_universe():
+            # Fresh, unknown tickers every round - the whole batch goes to the network
+            r = next(rounds)
+            batch[:] = [{'ticker': f"NEW{r}X{i}"} for i in range(len(portfolio))]
+
+        times, peak = measure(lambda: sectors.enrich_data_with_sectors(batch), repeat, setup=new_universe)
+        return [summarize('enrich_data_with_sectors', scale, len(portfolio), times, peak)]
+    finally:
+        sectors.BIZNESRADAR_URL, sectors.rate_limiter = old_url, old_limiter
+        server.shutdown()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, repeat, enrich_repeat):
+    from providers import synthetic_portfolio
+
+    tmp = tempfile.mkdtemp(prefix="wig_bench_")
+    results = []
+    try:
+        for scale in scales:
+            n = SCALES[scale]
+            print(f"\n=== {scale} ({n} tickers) ===")
+            database.DB_FILE = os.path.join(tmp, f"{scale}.db")
+            now_ts = int(time.time()) // 60 * 60
+            portfolio = synthetic_portfolio(n)
+            seed_database(portfolio, now_ts)
+
+            benches = [
+                lambda: bench_database(scale, portfolio, repeat),
+                lambda: bench_fetcher(scale, portfolio, repeat, now_ts),
+                lambda: bench_bar_window(scale, portfolio, repeat, now_ts),
+                lambda: bench_portfolio(scale, portfolio, repeat),
+                lambda: bench_heatmap(scale, portfolio, max(3, repeat // 4)),
+                lambda: bench_render_worker(scale, portfolio, max(3, repeat // 4)),
+                lambda: bench_replay_frame(scale, portfolio, repeat),
+                lambda: bench_populate_tree(scale, portfolio, repeat),
+                lambda: bench_enrich(scale, portfolio, enrich_repeat),
+            ]
+            for bench in benches:
+                # Keep fetcher/enrichment console chatter out of the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    rows = bench()
+                for r in rows:
+                    print_result(r)
+                results += rows
+            database.close_connections()
+    finally:
+        database.close_connections()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WIG Scalper hot path benchmarks")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=20, help="Iterations per benchmark")
+    parser.add_argument("--enrich-repeat", type=int, default=3, help="Iterations for the sector enrichment bench")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.repeat, args.enrich_repeat)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'matplotlib': matplotlib.__version__,
+            'numpy': np.__version__,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nZapisano wyniki: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+"""
+Pure matplotlib chart renderers (no Tk) shared by the GUI tabs,
+the headless exporter and the benchmarks.
+"""
+import math
+import time
+
+import matplotlib
+import matplotlib.patches as patches
+import numpy as np
+from matplotlib.collections import PatchCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgba_array
+from matplotlib.figure import Figure
+from matplotlib.transforms import IdentityTransform
+from PIL import Image
+import squarify
+
+from portfolio import sector_rows, sectors_by_share
+
+BG_COLOR = '#2b2b2b'
+
+def get_color(value):
+    """
+    Returns hex color based on percentage change (Finviz style).
+    """
+    if value is None:
+        return "#4b4b4b" 
+    if value == 0:
+        return "#4b4b4b"
+        
+    if value > 0:
+        if value >= 3.0: return "#1a9641" # Bright Green
+        elif value >= 2.0: return "#35b758"
+        elif value >= 1.0: return "#397d49"
+        else: return "#285233"
+    else:
+        if value <= -3.0: return "#d7191c" # Bright Red
+        elif value <= -2.0: return "#bd3336"
+        elif value <= -1.0: return "#962f32"
+        else: return "#5e2628"
+
+# Same buckets as get_color, vectorized: index into CHANGE_PALETTE
+CHANGE_PALETTE = to_rgba_array(["#4b4b4b",
+                                "#1a9641", "#35b758", "#397d49", "#285233",
+                                "#d7191c", "#bd3336", "#962f32", "#5e2628"])
+
+def change_colors(values):
+    """RGBA array (N x 4) for an array of % changes - NaN/0 neutral, like get_color."""
+    v = np.asarray(values, dtype=float)
+    with np.errstate(invalid='ignore'):
+        idx = np.select([v >= 3.0, v >= 2.0, v >= 1.0, v > 0, v <= -3.0, v <= -2.0, v <= -1.0, v < 0],
+                        [1, 2, 3, 4, 5, 6, 7, 8], default=0)
+    return CHANGE_PALETTE[idx]
+
+
+class HeatMapRenderer:
+    """
+    Draws the HIERARCHICAL Treemap (Sector -> Company) on a given Figure.
+    The tile layout depends only on shares and sectors, so it is cached by
+    a hash of the share vector. Artists are created once per layout and
+    later redraws only update tile colors and % labels.
+    Frames (frame, replay_frame) skip the full figure draw: only the tiles
+    are drawn over a cached background, text comes from a cached overlay
+    (sector frames, names, tickers) and live % lines from cached sprites.
+    """
+    SPRITE_CACHE = 4096     # % line images kept (a few KB each)
+
+    def __init__(self, fig, ax, title="sWIG80tr Map"):
+        self.fig = fig
+        self.ax = ax
+        self.title = title
+
+        self._layout_key = None
+        self._tickers = []      # Tile order inside the PatchCollection
+        self._tiles = None      # PatchCollection with all company tiles
+        self._colors = []       # Last applied facecolors
+        self._labels = {}       # ticker -> Text (only tiles big enough for a label)
+        self._label_text = {}   # ticker -> last shown label
+        self._timestamp = None
+        self._sector_artists = []   # Sector frames + names (drawn above the tiles)
+        self._bg_key = None         # (layout, canvas size) the background belongs to
+        self._bg = None             # Agg region: everything below the tiles
+        self._overlay_key = None    # (layout, canvas size, kind) the overlay belongs to
+        self._overlay = None        # RGBA array: frames + names + ticker labels
+        self._anchors = {}          # ticker -> label center in display pixels
+        self._sprites = {}          # (text, font size) -> (RGBA array, dx, dy) of a % line
+        self._sprite_text = None    # Text on a small transparent figure the sprites are drawn with
+
+    @staticmethod
+    def layout_key(portfolio):
+        return hash((portfolio.tickers, portfolio.sectors,
+                     portfolio.sector_code.tobytes(), portfolio.share.tobytes()))
+
+    def compute_layout(self, portfolio):
+        """
+        Two-level squarify layout over the precomputed sector groups of a PortfolioSnapshot.
+        Returns list of {'name', 'rect': (x, y, dx, dy), 'companies': [(ticker, rect), ...]}
+        """
+        share = portfolio.share
+        # 1. Sectors by total share, companies inside by share (both descending).
+        # Companies without a share get no tile (squarify needs positive sizes)
+        sector_list = []
+        for k in sectors_by_share(portfolio):
+            rows = [i for i in sector_rows(portfolio, k) if share[i] > 0]
+            if rows:
+                sector_list.append((portfolio.sectors[k], portfolio.sector_share[k], rows))
+
+        # 2. Layout Calculation
+        
+        # Canvas dimensions (0..100, 0..100)
+        X, Y, DX, DY = 0, 0, 100, 100
+        
+        # Calculate Level 1 (Sectors)
+        sector_shares = [total for _, total, _ in sector_list]
+        # Normalize to cover full canvas
+        normed_sectors = squarify.normalize_sizes(sector_shares, DX, DY)
+        sector_rects = squarify.squarify(normed_sectors, X, Y, DX, DY)
+
+        layout = []
+        for (name, _, rows), rect in zip(sector_list, sector_rects):
+            x, y, dx, dy = rect['x'], rect['y'], rect['dx'], rect['dy']
+
+            # Level 2 (Companies within Sector)
+            # Squarify inside the sector rectangle
+            comp_shares = [share[i] for i in rows]
+            normed_comps = squarify.normalize_sizes(comp_shares, dx, dy)
+            comp_rects = squarify.squarify(normed_comps, x, y, dx, dy)
+
+            layout.append({
+                'name': name,
+                'rect': (x, y, dx, dy),
+                'companies': [(portfolio.tickers[i], (r['x'], r['y'], r['dx'], r['dy']))
+                              for i, r in zip(rows, comp_rects)]
+            })
+        return layout
+
+    def render(self, portfolio, timestamp=None):
+        """
+        Draws a PortfolioSnapshot. Rebuilds artists only when the layout
+        changed, otherwise recolors. Returns False if there was nothing to draw.
+        """
+        if not any(s > 0 for s in portfolio.share):
+            return False
+
+        key = self.layout_key(portfolio)
+        if key != self._layout_key:
+            self._build(self.compute_layout(portfolio))
+            self._layout_key = key
+
+        self.recolor(dict(zip(portfolio.tickers, portfolio.change_pct)))
+        self.set_timestamp(timestamp if timestamp is not None else time.strftime("%H:%M:%S"))
+        return True
+
+    def recolor(self, changes):
+        """Updates tile colors and labels. changes: {ticker: change_pct}"""
+        colors = [get_color(changes.get(t)) for t in self._tickers]
+        if colors != self._colors:
+            self._tiles.set_facecolor(colors)
+            self._colors = colors
+
+        for ticker, text in self._labels.items():
+            pct = changes.get(ticker)
+            lbl = f"{ticker}\n{pct if pct is not None else 0.0:+.1f}%"
+            if self._label_text.get(ticker) != lbl:
+                text.set_text(lbl)
+                self._label_text[ticker] = lbl
+
+    def set_timestamp(self, text):
+        self._timestamp.set_text(f"Aktualizacja: {text}")
+
+    @property
+    def tickers(self):
+        """Tile order of the current layout (order of the colors for replay_frame)."""
+        return list(self._tickers)
+
+    def _background(self):
+        """Restores the cached background (redrawn when the layout or canvas size changed)."""
+        canvas = self.fig.canvas
+        key = (self._layout_key, canvas.get_width_height())
+        if key != self._bg_key:
+            front = [self._tiles, self._timestamp] + self._sector_artists + list(self._labels.values())
+            for artist in front:
+                artist.set_visible(False)
+            canvas.draw()
+            self._bg = canvas.copy_from_bbox(self.fig.bbox)
+            for artist in front:
+                artist.set_visible(True)
+            self._bg_key = key
+        canvas.restore_region(self._bg)
+
+    def _text_overlay(self, kind):
+        """
+        Sector frames/names and ticker labels on a transparent image, cached
+        (RGBA array, bottom row first - as draw_image takes it).
+        kind 'replay': labels show the ticker only; 'live': the ticker line of
+        the live label (its % line is drawn per frame, see frame()).
+        """
+        canvas = self.fig.canvas
+        key = (self._layout_key, canvas.get_width_height(), kind)
+        if key == self._overlay_key:
+            return self._overlay
+
+        hidden = (self.fig.patch, self.ax.patch, self.ax.title, self._tiles, self._timestamp)
+        for artist in hidden:
+            artist.set_visible(False)
+        for ticker, text in self._labels.items():
+            # Blank second line keeps the ticker where the two-line label has it
+            text.set_text(ticker if kind == 'replay' else ticker + "\n ")
+        canvas.draw()
+        self._overlay = np.asarray(canvas.buffer_rgba())[::-1].copy()
+
+        self._anchors = {ticker: tuple(round(v) for v in self.ax.transData.transform(text.get_position()))
+                         for ticker, text in self._labels.items()}
+
+        for artist in hidden:
+            artist.set_visible(True)
+        for ticker, text in self._labels.items():
+            text.set_text(self._label_text.get(ticker, ""))
+        self._overlay_key = key
+        return self._overlay
+
+    def _pct_sprite(self, pct, fontproperties):
+        """
+        Image of the % line of a live label: (RGBA array, dx, dy), or None.
+        dx, dy: lower-left corner from the label center in display pixels.
+        Shared by all labels - at most half a pixel off a full draw.
+        """
+        key = (pct, fontproperties.get_size_in_points())
+        if key in self._sprites:
+            return self._sprites[key]
+
+        if self._sprite_text is None:
+            fig = Figure(figsize=(4, 2), dpi=self.fig.dpi)
+            fig.patch.set_visible(False)
+            FigureCanvasAgg(fig)
+            self._sprite_text = fig.text(0, 0, "", color='white', ha='center', va='center', transform=IdentityTransform())
+        text = self._sprite_text
+        if text.figure.dpi != self.fig.dpi:
+            text.figure.set_dpi(self.fig.dpi)
+            self._sprites.clear()
+        renderer = text.figure.canvas.get_renderer()
+        cx, cy = renderer.width // 2, renderer.height // 2
+        text.set_fontproperties(fontproperties)
+        text.set_position((cx, cy))
+        # Blank first line - the same place as the % line under the ticker
+        text.set_text(" \n" + pct)
+        renderer.clear()
+        text.draw(renderer)
+        rgba = np.asarray(renderer.buffer_rgba())[::-1]
+        rows, cols = np.nonzero(rgba[..., 3])
+        sprite = None
+        if len(rows):
+            bottom, left = rows.min(), cols.min()
+            sprite = (rgba[bottom:rows.max() + 1, left:cols.max() + 1].copy(), int(left - cx), int(bottom - cy))
+        if len(self._sprites) >= self.SPRITE_CACHE:
+            self._sprites.clear()
+        self._sprites[key] = sprite
+        return sprite
+
+    def _draw_image(self, image, x, y):
+        renderer = self.fig.canvas.get_renderer()
+        gc = renderer.new_gc()
+        renderer.draw_image(gc, x, y, image)
+        gc.restore()
+
+    def frame(self):
+        """
+        Live frame of the state set by render(), without a full figure draw:
+        tiles and timestamp over the cached background, % lines from cached
+        sprites, then the cached text overlay. Returns a PIL RGBA image
+        (a view of the canvas buffer - valid until the next draw).
+        """
+        canvas = self.fig.canvas
+        overlay = self._text_overlay('live')
+        self._background()
+        self.ax.draw_artist(self._tiles)
+        self.ax.draw_artist(self._timestamp)
+
+        for ticker, text in self._labels.items():
+            pct = self._label_text.get(ticker, "").partition("\n")[2]
+            if not pct:
+                continue
+            sprite = self._pct_sprite(pct, text.get_fontproperties())
+            if sprite is not None:
+                image, dx, dy = sprite
+                x, y = self._anchors[ticker]
+                self._draw_image(image, x + dx, y + dy)
+        self._draw_image(overlay, 0, 0)
+        return Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+
+    def replay_frame(self, colors, timestamp):
+        """
+        Fast frame for scrubbing/playback: only the tile colors change.
+        colors: RGBA array in `tickers` order. Labels show tickers only (no %),
+        so no text is laid out per frame - the cached overlay is drawn over
+        the tiles. Returns the frame as a PIL RGBA image (view, like frame()).
+        """
+        canvas = self.fig.canvas
+        overlay = self._text_overlay('replay')
+        self._tiles.set_facecolor(colors)
+        self._colors = None # Live recolor() must reapply its colors
+        self._background()
+        self.ax.draw_artist(self._tiles)
+        self._timestamp.set_text(timestamp)
+        self.ax.draw_artist(self._timestamp)
+        self._draw_image(overlay, 0, 0)
+        return Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+
+    def _build(self, layout):
+        self.ax.clear()
+        self.ax.set_facecolor(BG_COLOR)
+        self.ax.axis('off')
+        
+        # Set limits manually since manual patches depend on it
+        self.ax.set_xlim(0, 100)
+        self.ax.set_ylim(0, 100)
+
+        self._tickers = []
+        self._colors = []
+        self._labels = {}
+        self._label_text = {}
+        self._sector_artists = []
+        self._bg_key = None
+        self._overlay_key = None
+        tile_patches = []
+        sector_patches = []
+
+        for sec in layout:
+            x, y, dx, dy = sec['rect']
+
+            # Sector Border - subtle frame around nested items
+            sector_patches.append(patches.Rectangle((x, y), dx, dy))
+
+            # --- Draw Sector Label (Top Left) ---
+            # dynamic font size based on sector size
+            # Show label even if smaller, just scale font or clip
+            if dx > 1 or dy > 1: # Practically always
+                # Calculate reasonable font size
+                lbl_size = min(12, int(dx/2)) 
+                lbl_size = max(8, lbl_size)
+                
+                self._sector_artists.append(self.ax.text(x + 0.5, y + dy - 0.5, sec['name'], 
+                             color='white', fontsize=lbl_size, fontweight='bold', ha='left', va='top', zorder=20,
+                             bbox=dict(facecolor='black', alpha=0.4, edgecolor='none', pad=2)))
+
+            for ticker, (cx, cy, cdx, cdy) in sec['companies']:
+                self._tickers.append(ticker)
+                tile_patches.append(patches.Rectangle((cx, cy), cdx, cdy))
+
+                # Label
+                if cdx > 3 and cdy > 3:
+                    fsize = 8 if cdx < 6 else 10
+                    self._labels[ticker] = self.ax.text(
+                        cx + cdx/2, cy + cdy/2, "",
+                        color='white', fontsize=fsize, fontweight='bold', ha='center', va='center')
+
+        # One collection for all tiles - recoloring is a single set_facecolor call
+        self._tiles = PatchCollection(tile_patches, linewidth=1, edgecolor=BG_COLOR, facecolor="#4b4b4b")
+        self.ax.add_collection(self._tiles)
+        sector_frames = PatchCollection(sector_patches, linewidth=2, edgecolor='#1a1a1a', facecolor='none', zorder=10)
+        self.ax.add_collection(sector_frames)
+        self._sector_artists.append(sector_frames)
+
+        # Static Title Top Center
+        self.ax.set_title(self.title, fontsize=16, color='white', fontweight='bold', pad=10)
+        
+        # Dynamic Timestamp Bottom Right (using Axes coordinates 0..1)
+        # 1.0, 0.0 is bottom right. We offset slightly up.
+        self._timestamp = self.ax.text(0.99, 0.01, "", 
+                     transform=self.ax.transAxes,
+                     color='#aaaaaa', fontsize=10, ha='right', va='bottom',
+                     bbox=dict(facecolor='black', alpha=0.5, edgecolor='none', pad=2))
+
+
+# --- HELPER: Shared Colors ---
+def get_sector_colors(sectors_list):
+    """
+    Returns a dictionary {sector_name: hex_color} using tab20.
+    sectors_list should be sorted by size/importance.
+    """
+    cmap = matplotlib.colormaps["tab20"]
+    colors = {}
+    for i, sector in enumerate(sectors_list):
+        # Cycle through 20 colors
+        colors[sector] = cmap(i % 20)
+    return colors
+
+# --- HELPER: Donut chart data ---
+TOP_N = 10
+
+def top_companies_pie(portfolio):
+    """Top N companies by share + "Inne". Returns (labels, sizes, colors)."""
+    share = portfolio.share
+    top_comps = portfolio.by_share[:TOP_N]
+    
+    labels = [portfolio.tickers[i] for i in top_comps]
+    sizes = [share[i] for i in top_comps]
+        
+    # Unique colors for every company (User request: "każda spółka inny kolor")
+    cmap = matplotlib.colormaps["tab20"]
+    colors = [cmap(i) for i in range(len(sizes))]
+    
+    rest_share = sum(share[i] for i in portfolio.by_share[TOP_N:])
+    if rest_share > 0:
+        labels.append("Inne")
+        sizes.append(rest_share)
+        colors.append("#a0a0a0") # Lighter/Brighter Grey
+    return labels, sizes, colors
+
+def sector_pie(portfolio):
+    """Total share per sector, largest first. Returns (labels, sizes, colors)."""
+    order = sectors_by_share(portfolio)
+    labels = [portfolio.sectors[k] for k in order]
+    sizes = [portfolio.sector_share[k] for k in order]
+    
+    sector_colors = get_sector_colors(labels)
+    colors = [sector_colors.get(x, "#a0a0a0") for x in labels]
+    return labels, sizes, colors
+
+
+class DonutChart:
+    """
+    Donut (pie + center circle) on a given Axes.
+    Remembers the fingerprint of the last rendered data and skips identical
+    redraws; when only the sizes changed, wedges and labels are updated in place.
+    """
+    STARTANGLE = 140
+    LABEL_DISTANCE = 1.1
+    PCT_DISTANCE = 0.85
+
+    def __init__(self, ax, title):
+        self.ax = ax
+        self.title = title
+        self._fingerprint = None
+        self._wedges = None
+        self._texts = None
+        self._autotexts = None
+
+    def render(self, labels, sizes, colors):
+        """Returns True if the Axes changed and the canvas needs a redraw."""
+        fingerprint = (tuple(labels), tuple(sizes), tuple(colors))
+        if fingerprint == self._fingerprint:
+            return False
+
+        if self._wedges is not None and len(self._wedges) == len(sizes):
+            self._update(labels, sizes, colors)
+        else:
+            self._build(labels, sizes, colors)
+        self._fingerprint = fingerprint
+        return True
+
+    def _build(self, labels, sizes, colors):
+        self.ax.clear()
+        self._wedges, self._texts, self._autotexts = self.ax.pie(
+            sizes, labels=labels, autopct='%1.1f%%',
+            startangle=self.STARTANGLE,
+            textprops=dict(color="white", fontsize=8),
+            labeldistance=self.LABEL_DISTANCE,
+            pctdistance=self.PCT_DISTANCE,
+            colors=colors
+        )
+        self.ax.set_title(self.title, color='white', fontweight='bold')
+        self.ax.add_artist(patches.Circle((0,0),0.70,fc=BG_COLOR))
+
+    def _update(self, labels, sizes, colors):
+        # Same geometry as Axes.pie (counterclockwise from STARTANGLE)
+        total = float(sum(sizes)) or 1.0
+        theta1 = self.STARTANGLE
+        for i, size in enumerate(sizes):
+            frac = size / total
+            theta2 = theta1 + 360.0 * frac
+            wedge = self._wedges[i]
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            wedge.set_facecolor(colors[i])
+
+            thetam = math.radians((theta1 + theta2) / 2.0)
+            x, y = math.cos(thetam), math.sin(thetam)
+            label = self._texts[i]
+            label.set_text(labels[i])
+            label.set_position((self.LABEL_DISTANCE * x, self.LABEL_DISTANCE * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+
+            pct = self._autotexts[i]
+            pct.set_text('%1.1f%%' % (100.0 * frac))
+            pct.set_position((self.PCT_DISTANCE * x, self.PCT_DISTANCE * y))
+            theta1 = theta2
+
+class ContributionBars:
+    """
+    Horizontal bars: each sector's contribution to the index return [p.p.],
+    green up / red down. Skips identical redraws like DonutChart.
+    """
+    MAX_BARS = 12
+
+    def __init__(self, ax, title="Wkład sektorów"):
+        self.ax = ax
+        self.title = title
+        self._fingerprint = None
+
+    def render(self, level):
+        """level: IndexLevel or None. Returns True if the Axes changed."""
+        if level is None:
+            return False
+        items = level.contributions[:self.MAX_BARS]
+        fingerprint = (tuple((s, round(v, 4)) for s, v in items), round(level.index_return, 4))
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+
+        ax = self.ax
+        ax.clear()
+        ax.set_facecolor(BG_COLOR)
+        # Largest contribution on top
+        labels = [s for s, _ in items][::-1]
+        values = [v for _, v in items][::-1]
+        ax.barh(range(len(values)), values, color=['#1a9641' if v >= 0 else '#d7191c' for v in values])
+        ax.set_yticks(range(len(values)), labels, color='white', fontsize=8)
+        ax.axvline(0, color='#aaaaaa', linewidth=0.8)
+        ax.tick_params(axis='x', colors='#aaaaaa', labelsize=8)
+        for side in ('top', 'right', 'left'):
+            ax.spines[side].set_visible(False)
+        ax.spines['bottom'].set_color('#555555')
+        ax.set_title(f"{self.title}: indeks {level.index_return:+.2f}%", color='white', fontweight='bold')
+        ax.set_xlabel("p.p.", color='#aaaaaa', fontsize=8)
+        return True
+
+
+# --- Figures (no pyplot - safe outside the Tk main thread) ---
+
+def new_heatmap_figure(figsize=(12, 8)):
+    """Figure + Axes styled like the Heatmap tab."""
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    fig.patch.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+    # Adjust margins to maximize map size
+    # title space at top=0.94, date space at bottom=0.02
+    fig.subplots_adjust(left=0.00, right=1.00, top=0.94, bottom=0.00)
+    return fig, ax
+
+def new_donut_figure(figsize=(5, 4)):
+    """Figure + Axes styled like the dashboard donut charts."""
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    fig.patch.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+    return fig, ax
+
+def new_bars_figure(figsize=(5, 3)):
+    """Figure + Axes for the sector contribution bars (room for sector names on the left)."""
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    fig.patch.set_facecolor(BG_COLOR)
+    ax.set_facecolor(BG_COLOR)
+    fig.subplots_adjust(left=0.38, right=0.96, top=0.88, bottom=0.14)
+    return fig, ax
@@ -1,14 +1,20 @@
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from database import load_portfolio_from_db
+from market_state import get_market_snapshot
+from charts import (DonutChart, ContributionBars, top_companies_pie, sector_pie,
+                    new_donut_figure, new_bars_figure)
+from metrics import metrics
+from render_worker import RenderWorker, ChartImage
 
 # --- STYLING CONSTANTS ---
 BG_COLOR = "#2b2b2b"
 FG_COLOR = "#ffffff"
 ROW_EVEN_BG = "#333333"
 ROW_ODD_BG = "#2b2b2b"
+FLASH_UP_BG = "#1e5631"
+FLASH_DOWN_BG = "#6b1f21"
+FLASH_MS = 800
+STALE_FG = "#8a8a8a"
 
 class BaseDashboardFrame(ttk.Frame):
     """Helper class for common dashboard functions"""
@@ -33,45 +39,152 @@ class BaseDashboardFrame(ttk.Frame):
         # Tags for striping
         tree.tag_configure('odd', background=ROW_ODD_BG, foreground=FG_COLOR)
         tree.tag_configure('even', background=ROW_EVEN_BG, foreground=FG_COLOR)
+        # Flash tags are configured last, so they take priority over striping
+        tree.tag_configure('flash_up', background=FLASH_UP_BG, foreground=FG_COLOR)
+        tree.tag_configure('flash_down', background=FLASH_DOWN_BG, foreground=FG_COLOR)
+        # Price not refreshed (download failures / no bars) - greyed out
+        tree.tag_configure('stale', foreground=STALE_FG)
         
         return tree
 
-    def create_figure(self, parent):
-        fig, ax = plt.subplots(figsize=(5, 4))
-        fig.patch.set_facecolor(BG_COLOR)
-        ax.set_facecolor(BG_COLOR)
-        
-        canvas = FigureCanvasTkAgg(fig, master=parent)
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        return fig, ax, canvas
-
-    def populate_tree(self, tree, data):
-        # Clear old
-        for item in tree.get_children():
-            tree.delete(item)
-            
-        for i, c in enumerate(data):
-            tag = 'even' if i % 2 == 0 else 'odd'
-            tree.insert("", tk.END, values=(
-                c.get('ticker', ''),
-                c.get('sector', ''),
-                f"{c.get('price', 0.0):.2f}",
-                f"{c.get('change_pct', 0.0):+.2f}%",
-                f"{c.get('share', 0.0):.2f}%"
-            ), tags=(tag,))
-
-# --- HELPER: Shared Colors ---
-def get_sector_colors(sectors_list):
-    """
-    Returns a dictionary {sector_name: hex_color} using tab20.
-    sectors_list should be sorted by size/importance.
-    """
-    cmap = plt.get_cmap("tab20")
-    colors = {}
-    for i, sector in enumerate(sectors_list):
-        # Cycle through 20 colors
-        colors[sector] = cmap(i % 20)
-    return colors
+    def create_donut(self, parent, name, title, pie):
+        """Donut chart rendered on its own worker thread; pie(portfolio) -> (labels, sizes, colors)."""
+        def setup():
+            fig, ax = new_donut_figure(figsize=(5, 4))
+            donut = DonutChart(ax, title)
+            return fig, lambda snap: donut.render(*pie(snap.portfolio))
+
+        chart = ChartImage(parent, RenderWorker(name, setup), width=500, height=400, bg=BG_COLOR)
+        chart.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        return chart
+
+    def create_contribution_bars(self, parent, name):
+        """Sector contributions to the index return (snapshot.index), rendered on a worker thread."""
+        def setup():
+            fig, ax = new_bars_figure(figsize=(5, 3))
+            bars = ContributionBars(ax)
+            return fig, lambda snap: bars.render(snap.index)
+
+        chart = ChartImage(parent, RenderWorker(name, setup), width=500, height=300, bg=BG_COLOR)
+        chart.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        return chart
+
+    def format_row(self, portfolio, i):
+        p = portfolio
+        return (
+            p.tickers[i],
+            p.sectors[p.sector_code[i]],
+            f"{p.price[i]:.2f}",
+            f"{p.change_pct[i]:+.2f}%",
+            f"{p.share[i]:.2f}%"
+        )
+
+    def stale_caption(self, title, portfolio):
+        """Table title with the number of companies whose price isn't fresh."""
+        stale = sum(portfolio.stale)
+        return f"{title}  (nieaktualne: {stale})" if stale else title
+
+    def _tree_state(self, tree):
+        """Per-tree index: ticker -> item id, last shown values, current row order."""
+        states = self.__dict__.setdefault('_tree_states', {})
+        key = str(tree)
+        if key not in states:
+            states[key] = {'index': {}, 'values': {}, 'prices': {}, 'tags': {}, 'order': [], 'flash': {}}
+        return states[key]
+
+    def populate_tree(self, tree, portfolio, order):
+        """Company table: rows of a PortfolioSnapshot in `order` (row indexes, e.g. portfolio.by_share)."""
+        p = portfolio
+        self.update_tree(tree, [p.tickers[i] for i in order], [self.format_row(p, i) for i in order],
+                         prices=[p.price[i] for i in order],
+                         stale={p.tickers[i] for i in order if p.stale[i]})
+
+    def update_tree(self, tree, keys, rows, prices=None, stale=()):
+        """
+        Incremental update: only changed cells are rewritten and rows are
+        moved only when the sort order changed. Keeps scroll and selection.
+        keys: row ids in display order, rows: cell tuples,
+        prices: flash a row when its price moved (optional), stale: keys shown greyed out.
+        """
+        state = self._tree_state(tree)
+        index, values, last_prices = state['index'], state['values'], state['prices']
+
+        new_order = list(keys)
+        new_set = set(new_order)
+
+        # 1. Removed rows
+        for ticker in [t for t in index if t not in new_set]:
+            tree.delete(index.pop(ticker))
+            values.pop(ticker, None)
+            last_prices.pop(ticker, None)
+            state['tags'].pop(ticker, None)
+            state['flash'].pop(ticker, None)
+        current = [t for t in state['order'] if t in new_set]
+
+        # 2. Changed cells / new rows
+        flashed = {}
+        for pos, (ticker, row) in enumerate(zip(new_order, rows)):
+            price = prices[pos] if prices is not None else None
+            iid = index.get(ticker)
+            if iid is None:
+                index[ticker] = tree.insert("", tk.END, values=row)
+                values[ticker] = row
+                last_prices[ticker] = price
+                current.append(ticker)
+                continue
+
+            old = values[ticker]
+            if old == row:
+                continue
+            for col, (before, after) in enumerate(zip(old, row)):
+                if before != after:
+                    tree.set(iid, col, after)
+            values[ticker] = row
+
+            last = last_prices[ticker]
+            if price is not None and last is not None and price != last:
+                flashed[ticker] = 'flash_up' if price > last else 'flash_down'
+            last_prices[ticker] = price
+
+        # 3. Reorder only if the order actually changed
+        if current != new_order:
+            for pos, ticker in enumerate(new_order):
+                if current[pos] != ticker:
+                    tree.move(index[ticker], "", pos)
+                    current.remove(ticker)
+                    current.insert(pos, ticker)
+        state['order'] = new_order
+
+        # 4. Striping + flash + staleness tags (Tk tags are per row, not per cell)
+        for pos, ticker in enumerate(new_order):
+            stripe = ('even' if pos % 2 == 0 else 'odd',)
+            if ticker in stale:
+                stripe += ('stale',)
+            if ticker in flashed:
+                tags = stripe + (flashed[ticker],)
+            elif ticker in state['flash']:
+                tags = stripe + (state['flash'][ticker][1],)
+            else:
+                tags = stripe
+            if state['tags'].get(ticker) != tags:
+                tree.item(index[ticker], tags=tags)
+                state['tags'][ticker] = tags
+
+        if flashed:
+            token = object()
+            for ticker, tag in flashed.items():
+                state['flash'][ticker] = (token, tag)
+            self.after(FLASH_MS, lambda: self._clear_flash(tree, token))
+
+    def _clear_flash(self, tree, token):
+        state = self._tree_state(tree)
+        for ticker, (t, _) in list(state['flash'].items()):
+            if t is not token:
+                continue # Flashed again in the meantime - newer timer clears it
+            del state['flash'][ticker]
+            tags = tuple(tag for tag in state['tags'].get(ticker, ()) if not tag.startswith('flash'))
+            tree.item(state['index'][ticker], tags=tags)
+            state['tags'][ticker] = tags
 
 # --- TAB 1: Index Composition (Chart Left + Table Right) ---
 class IndexTab(BaseDashboardFrame):
@@ -87,14 +200,15 @@ class IndexTab(BaseDashboardFrame):
         left_frame = ttk.Frame(paned)
         paned.add(left_frame, weight=1)
         
-        self.fig, self.ax, self.canvas = self.create_figure(left_frame)
+        self.chart = self.create_donut(left_frame, 'index', "Top 10 Spółek", top_companies_pie)
+        self.rendered_version = None
 
         # Right: Table
         right_frame = ttk.Frame(paned)
         paned.add(right_frame, weight=2)
         
-        img_label = ttk.Label(right_frame, text="Tabela Spółek", background=BG_COLOR, foreground="white", font=('Helvetica', 12, 'bold'))
-        img_label.pack(pady=5)
+        self.title_label = ttk.Label(right_frame, text="Tabela Spółek", background=BG_COLOR, foreground="white", font=('Helvetica', 12, 'bold'))
+        self.title_label.pack(pady=5)
         
         cols = ("Ticker", "Sector", "Price", "Change %", "Share %")
         self.tree = self.create_treeview(right_frame, cols)
@@ -106,57 +220,17 @@ class IndexTab(BaseDashboardFrame):
         self.update_view()
 
     def update_view(self):
-        data = load_portfolio_from_db()
-        if not data: return
-        
-        # 1. Tree: Sorted by Share Desc
-        data_sorted = sorted(data, key=lambda x: x.get('share', 0), reverse=True)
-        self.populate_tree(self.tree, data_sorted)
-        
-        # 2. Chart: Top 10 Companies (Colored by SECTOR)
-        self.ax.clear()
-        
-        # Identify Sectors and Colors first to be consistent
-        # We need the full sector list to generate the "canonical" colors
-        all_sectors = {}
-        for c in data:
-            sec = c.get('sector', 'Inne')
-            all_sectors[sec] = all_sectors.get(sec, 0) + c.get('share', 0)
-        
-        sorted_sector_names = [x[0] for x in sorted(all_sectors.items(), key=lambda x: x[1], reverse=True)]
-        sector_colors = get_sector_colors(sorted_sector_names)
-        
-        top_n = 10
-        top_comps = data_sorted[:top_n]
-        rest_comps = data_sorted[top_n:]
-        
-        labels = []
-        sizes = []
-        
-        for c in top_comps:
-            labels.append(c['ticker'])
-            sizes.append(c.get('share', 0))
-            
-        # Unique colors for every company (User request: "każda spółka inny kolor")
-        cmap = plt.get_cmap("tab20")
-        colors = [cmap(i) for i in range(len(sizes))]
-        
-        rest_share = sum(c.get('share', 0) for c in rest_comps)
-        if rest_share > 0:
-            labels.append("Inne")
-            sizes.append(rest_share)
-            colors.append("#a0a0a0") # Lighter/Brighter Grey
-            
-        self.ax.pie(
-            sizes, labels=labels, autopct='%1.1f%%',
-            startangle=140,
-            textprops=dict(color="white", fontsize=8),
-            pctdistance=0.85,
-            colors=colors
-        )
-        self.ax.set_title("Top 10 Spółek", color='white', fontweight='bold')
-        self.ax.add_artist(plt.Circle((0,0),0.70,fc=BG_COLOR))
-        self.canvas.draw()
+        snap = get_market_snapshot()
+        portfolio = snap.portfolio
+        if not portfolio.tickers or snap.version == self.rendered_version: return
+        
+        # 1. Tree: Sorted by Share Desc (order precomputed in the snapshot)
+        self.populate_tree(self.tree, portfolio, portfolio.by_share)
+        self.title_label.config(text=self.stale_caption("Tabela Spółek", portfolio))
+        
+        # 2. Chart: Top 10 Companies - rendered off the Tk thread, redrawn only when shares changed
+        self.chart.render(snap)
+        self.rendered_version = snap.version
 
 
 # --- TAB 2: Sectors (Sector Chart + Table) ---
@@ -173,14 +247,16 @@ class SectorsTab(BaseDashboardFrame):
         left_frame = ttk.Frame(paned)
         paned.add(left_frame, weight=1)
         
-        self.fig, self.ax, self.canvas = self.create_figure(left_frame)
+        self.chart = self.create_donut(left_frame, 'sectors', "Struktura Sektorowa", sector_pie)
+        self.contrib_chart = self.create_contribution_bars(left_frame, 'contributions')
+        self.rendered_version = None
 
         # Right: Table
         right_frame = ttk.Frame(paned)
         paned.add(right_frame, weight=2)
 
-        lbl = ttk.Label(right_frame, text="Spółki wg Sektorów", background=BG_COLOR, foreground="white", font=('Helvetica', 12, 'bold'))
-        lbl.pack(pady=5)
+        self.title_label = ttk.Label(right_frame, text="Spółki wg Sektorów", background=BG_COLOR, foreground="white", font=('Helvetica', 12, 'bold'))
+        self.title_label.pack(pady=5)
         
         cols = ("Ticker", "Sector", "Price", "Change %", "Share %")
         self.tree = self.create_treeview(right_frame, cols)
@@ -192,38 +268,73 @@ class SectorsTab(BaseDashboardFrame):
         self.update_view()
 
     def update_view(self):
-        data = load_portfolio_from_db()
-        if not data: return
-        
-        # 1. Chart: Sectors
-        self.ax.clear()
-        sectors = {}
-        for c in data:
-            sec = c.get('sector', 'Inne')
-            sectors[sec] = sectors.get(sec, 0) + c.get('share', 0)
-        
-        sorted_sectors_items = sorted(sectors.items(), key=lambda x: x[1], reverse=True)
-        sorted_sector_names = [x[0] for x in sorted_sectors_items]
-        
-        sector_colors = get_sector_colors(sorted_sector_names)
-        
-        labels = sorted_sector_names
-        sizes = [x[1] for x in sorted_sectors_items]
-        colors = [sector_colors.get(x, "#a0a0a0") for x in labels]
-        
-        self.ax.pie(
-            sizes, labels=labels, autopct='%1.1f%%',
-            startangle=140,
-            textprops=dict(color="white", fontsize=8),
-            pctdistance=0.85,
-            colors=colors
-        )
-        self.ax.set_title("Struktura Sektorowa", color='white', fontweight='bold')
-        self.ax.add_artist(plt.Circle((0,0),0.70,fc=BG_COLOR))
-        self.canvas.draw()
-        
-        # 2. Tree: Sorted by Sector, then Share
-        # Sort key tuple: (Sector Name, Share Descending)
-        # Note: to sort share desc inside sector, we negate share
-        data_sorted = sorted(data, key=lambda x: (x.get('sector', 'ZZZ'), -x.get('share', 0)))
-        self.populate_tree(self.tree, data_sorted)
+        snap = get_market_snapshot()
+        portfolio = snap.portfolio
+        if not portfolio.tickers or snap.version == self.rendered_version: return
+        
+        # 1. Charts: Sectors + their contributions to the index move - rendered off the Tk thread,
+        # redrawn only when shares/sectors (contributions) changed
+        self.chart.render(snap)
+        self.contrib_chart.render(snap)
+        
+        # 2. Tree: Sorted by Sector, then Share Descending (order precomputed in the snapshot)
+        self.populate_tree(self.tree, portfolio, portfolio.by_sector)
+        self.title_label.config(text=self.stale_caption("Spółki wg Sektorów", portfolio))
+        self.rendered_version = snap.version
+
+
+# --- TAB 4: Diagnostics (pipeline timings from metrics.py) ---
+class DiagnosticsTab(BaseDashboardFrame):
+    # Stages of one fetch cycle, in pipeline order
+    CYCLE_STAGES = ('fetch.download', 'fetch.parse', 'fetch.publish', 'fetch.db_write')
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.pack(fill=tk.BOTH, expand=True)
+
+        self.summary_label = ttk.Label(self, text="Brak pomiarów", background=BG_COLOR, foreground="white", font=('Helvetica', 12, 'bold'))
+        self.summary_label.pack(pady=5)
+
+        cols = ("Metric", "Count", "Last", "p50", "p95", "Max")
+        self.tree = self.create_treeview(self, cols)
+        for col in cols:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=90, anchor=tk.E)
+        self.tree.column("Metric", width=260, anchor=tk.W)
+
+        self.update_view()
+
+    @staticmethod
+    def _fmt(name, value):
+        if value is None:
+            return ""
+        if name.endswith('_size'):
+            return f"{value:.0f}"
+        return f"{value * 1000:.1f} ms" # Timings are stored in seconds
+
+    def update_view(self):
+        snap = metrics.snapshot()
+        # Rows are keyed by metric name
+        names, rows = [], []
+        for name, st in sorted(snap['stats'].items()):
+            cells = (str(st['count']),) + tuple(self._fmt(name, st.get(k)) for k in ('last', 'p50', 'p95', 'max'))
+            names.append(name)
+            rows.append((name,) + cells)
+        for name, value in sorted(snap['counters'].items()):
+            names.append(name)
+            rows.append((name, str(value), "", "", "", ""))
+        for name, value in sorted(snap['gauges'].items()):
+            names.append(name)
+            rows.append((name, "", f"{value:.3g}", "", "", ""))
+        self.update_tree(self.tree, names, rows)
+
+        # Which stage eats the cycle: share of the mean cycle time
+        cycle = snap['stats'].get('fetch.cycle')
+        if cycle and cycle.get('mean'):
+            parts = [f"{name.split('.')[-1]} {snap['stats'][name]['mean'] / cycle['mean']:.0%}"
+                     for name in self.CYCLE_STAGES if snap['stats'].get(name, {}).get('mean') is not None]
+            lag = snap['stats'].get('gui.loop_lag', {}).get('p95')
+            text = f"Cykl pobierania p50 {cycle['p50'] * 1000:.0f} ms  |  " + ", ".join(parts)
+            if lag is not None:
+                text += f"  |  blokada GUI p95 {lag * 1000:.0f} ms"
+            self.summary_label.config(text=text)
@@ -1,21 +1,290 @@
 
 import sqlite3
 import datetime
+import json
 import os
+import time
+import queue
+import threading
+import atexit
+import contextlib
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from index_engine import UNKNOWN_SECTOR
+from metrics import metrics
 
 DB_FILE = r"C:\Users\WneQ\Desktop\wig\wig_data.db"
 
+# Tuned PRAGMAs applied to every connection
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',   # 256 MB
+    'PRAGMA cache_size=-16000',     # ~16 MB
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+)
+
+# Max number of queued write jobs grouped into one transaction
+WRITE_BATCH_SIZE = 64
+
+# Idle read connections kept open; extra ones (more threads reading at once) are closed after use
+READ_POOL_SIZE = 4
+
+# How often a waiting writer caller checks that the writer thread is still alive [s]
+WRITE_LIVENESS_SECONDS = 1.0
+
+# Universe (index) used when none is given - the original single portfolio
+DEFAULT_UNIVERSE = "sWIG80"
+
+def _open_connection(db_file):
+    conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 def get_connection():
-    """Returns a connection to the SQLite database."""
+    """Returns a new connection to the SQLite database (caller closes it)."""
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# --- CONNECTION MANAGER ---
+
+class DatabaseWriter(threading.Thread):
+    """
+    Single writer thread. Receives write jobs on a queue and groups
+    everything that is pending into one transaction.
+    A job is a callable taking a cursor; each runs in its own SAVEPOINT,
+    so one failing job doesn't roll back the others.
+    The connection is opened by the caller (errors surface there, not in
+    the thread). If the thread dies, pending and later jobs fail with `error`.
+    """
+    def __init__(self, conn):
+        super().__init__(name="DatabaseWriter")
+        self.daemon = True
+        self.conn = conn
+        self.jobs = queue.Queue()
+        self.error = None           # Set when the thread died - no more writes
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        future = Future()
+        with self._lock:
+            if self.error is not None:
+                raise sqlite3.OperationalError(f"DatabaseWriter is dead: {self.error}")
+            self.jobs.put((job, future))
+        return future
+
+    def stop(self):
+        self.jobs.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            self._loop(self.conn)
+        except BaseException as e:
+            print(f"[DB] Wątek zapisu zakończony błędem: {e}")
+            with self._lock:
+                self.error = e
+            self._fail_pending(e)
+        finally:
+            self.conn.close()
+
+    def _fail_pending(self, error):
+        while True:
+            try:
+                item = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and not item[1].done():
+                item[1].set_exception(sqlite3.OperationalError(f"DatabaseWriter is dead: {error}"))
+
+    def _loop(self, conn):
+        running = True
+        while running:
+            batch = [self.jobs.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in batch:
+                running = False
+                batch = [b for b in batch if b is not None]
+            if not batch:
+                continue
+
+            metrics.observe('db.write_batch_size', len(batch))
+            metrics.set_gauge('db.write_queue', self.jobs.qsize())
+            txn_t0 = time.perf_counter()
+            done = []
+            c = conn.cursor()
+            try:
+                c.execute('BEGIN IMMEDIATE')
+                for job, future in batch:
+                    c.execute('SAVEPOINT job')
+                    try:
+                        # save_bars.<locals>.job -> db.job.save_bars
+                        with metrics.timed('db.job.' + getattr(job, '__qualname__', 'job').split('.')[0]):
+                            result = job(c)
+                        c.execute('RELEASE job')
+                        done.append((future, result, None))
+                    except Exception as e:
+                        c.execute('ROLLBACK TO job')
+                        c.execute('RELEASE job')
+                        done.append((future, None, e))
+                c.execute('COMMIT')
+            except Exception as e:
+                # Transaction itself failed (disk full, locked...) - fail the whole batch
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                done = [(future, None, e) for _, future in batch]
+                metrics.incr('db.write_errors')
+            metrics.observe('db.write_txn', time.perf_counter() - txn_t0)
+
+            # Results are published only after COMMIT, so waiters see committed data
+            for future, result, error in done:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+class ConnectionManager:
+    """
+    Small pool of read connections + one DatabaseWriter.
+    Readers never block the writer thanks to WAL. A read borrows a pooled
+    connection for one query, so short-lived threads (replay loads, startup)
+    don't leave connections behind.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._idle = []             # Pooled read connections (at most READ_POOL_SIZE)
+        self._closed = False
+        self._writer = None
+
+    @contextlib.contextmanager
+    def reader(self):
+        """Borrows a read connection for the duration of the with-block."""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = _open_connection(self.db_file)
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                if not self._closed and len(self._idle) < READ_POOL_SIZE:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def write(self, job, wait=True):
+        with self._lock:
+            if self._writer is None:
+                # Opened here, so a bad path / permissions raise in the caller
+                self._writer = DatabaseWriter(_open_connection(self.db_file))
+                self._writer.start()
+            writer = self._writer
+            future = writer.submit(job)
+        if wait:
+            return self._wait(writer, future)
+        return future
+
+    @staticmethod
+    def _wait(writer, future):
+        while True:
+            try:
+                return future.result(timeout=WRITE_LIVENESS_SECONDS)
+            except FutureTimeout:
+                if not writer.is_alive() and not future.done():
+                    raise sqlite3.OperationalError(f"DatabaseWriter is dead: {writer.error}")
+
+    def close(self):
+        with self._lock:
+            writer, self._writer = self._writer, None
+            idle, self._idle = self._idle, []
+            self._closed = True
+        if writer is not None:
+            writer.stop()
+        for conn in idle:
+            conn.close()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    """Returns the ConnectionManager for the current DB_FILE."""
+    global _manager
+    with _manager_lock:
+        if _manager is None or _manager.db_file != DB_FILE:
+            if _manager is not None:
+                _manager.close()
+            _manager = ConnectionManager(DB_FILE)
+        return _manager
+
+def close_connections():
+    """Flushes pending writes and closes all managed connections."""
+    global _manager
+    with _manager_lock:
+        manager, _manager = _manager, None
+    if manager is not None:
+        manager.close()
+
+atexit.register(close_connections)
+
+def _read(sql, params=()):
+    with get_manager().reader() as conn:
+        return conn.execute(sql, params).fetchall()
+
+def _write(job, wait=True):
+    return get_manager().write(job, wait=wait)
+
+
+# Reference data copied into a fresh offline database (no bars, no prices)
+REFERENCE_TABLES = ('companies', 'symbols', 'universe_members')
+
+def copy_reference_data(src_file):
+    """
+    Seeds an empty database (no index compositions yet) with the reference
+    tables of `src_file`: sectors, symbol master, index compositions.
+    Bars and prices are never copied. Returns the number of copied rows.
+    """
+    if not os.path.exists(src_file) or os.path.abspath(src_file) == os.path.abspath(DB_FILE):
+        return 0
+    if _read('SELECT COUNT(*) AS n FROM universe_members')[0]['n']:
+        return 0
+    conn = _open_connection(DB_FILE)
+    try:
+        # ATTACH can't run inside the writer's transaction - own connection
+        conn.execute('ATTACH DATABASE ? AS src', (src_file,))
+        copied = 0
+        conn.execute('BEGIN IMMEDIATE')
+        for table in REFERENCE_TABLES:
+            src_cols = {r[1] for r in conn.execute(f'PRAGMA src.table_info({table})')}
+            cols = ", ".join(r[1] for r in conn.execute(f'PRAGMA main.table_info({table})') if r[1] in src_cols)
+            if cols:
+                copied += conn.execute(f'INSERT OR IGNORE INTO main.{table} ({cols}) SELECT {cols} FROM src.{table}').rowcount
+        conn.execute('COMMIT')
+        conn.execute('DETACH DATABASE src')
+    finally:
+        conn.close()
+    return copied
+
 def init_db():
     """Initializes the database tables if they don't exist."""
-    conn = get_connection()
-    c = conn.cursor()
+    # WAL (PRAGMAS) ustawia połączenie pisarza - czytelnicy (GUI)
+    # nie blokują zapisu z wątku pobierania danych
+    _write(_create_schema)
+
+def _create_schema(c):
     # Tabela sektorów (Baza Wiedzy)
     c.execute('''
         CREATE TABLE IF NOT EXISTS companies (
@@ -24,6 +293,14 @@ def init_db():
             updated_at TIMESTAMP
         )
     ''')
+
+    # Metadane (np. wersja zasianych danych statycznych)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
     
     # Tabela składu portfela (Cache Portfela)
     c.execute('''
@@ -47,34 +324,127 @@ def init_db():
     except sqlite3.OperationalError:
         pass
 
-    conn.commit()
-    conn.close()
+    # Słownik symboli (symbol master): nazwa GPW <-> symbol Yahoo <-> ISIN
+    # yahoo NULL = domyślny symbol "<gpw>.WA"; indices rozdzielone średnikiem
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS symbols (
+            gpw TEXT PRIMARY KEY,
+            yahoo TEXT UNIQUE,
+            isin TEXT UNIQUE,
+            sector TEXT,
+            indices TEXT,
+            updated_at TIMESTAMP
+        )
+    ''')
+
+    # Nazwane uniwersa (indeksy: sWIG80, WIG20, mWIG40, WIG...) - każdy z własnymi wagami
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS universe_members (
+            universe TEXT NOT NULL,
+            ticker TEXT NOT NULL,
+            share REAL,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (universe, ticker)
+        ) WITHOUT ROWID
+    ''')
+
+    # Migracja: dotychczasowy pojedynczy portfel staje się uniwersum sWIG80
+    c.execute('SELECT 1 FROM universe_members LIMIT 1')
+    if c.fetchone() is None:
+        c.execute('''
+            INSERT INTO universe_members (universe, ticker, share, updated_at)
+            SELECT ?, ticker, share, updated_at FROM portfolio
+        ''', (DEFAULT_UNIVERSE,))
+
+    # Historia notowań intraday (append-only, szereg czasowy)
+    # ts = epoch seconds (UTC). Klucz (ticker, ts) jest jednocześnie indeksem
+    # pokrywającym - tabela WITHOUT ROWID jest przechowywana w tym porządku.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ticks (
+            ticker TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume REAL,
+            change_pct REAL,
+            PRIMARY KEY (ticker, ts)
+        ) WITHOUT ROWID
+    ''')
+
+    # Poziom indeksu przy każdym barze: ważona zmiana % i wkłady sektorów (JSON {sektor: p.p.})
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS index_ticks (
+            universe TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            index_return REAL,
+            weight REAL,
+            contributions TEXT,
+            PRIMARY KEY (universe, ts)
+        ) WITHOUT ROWID
+    ''')
+
+    # Ostatnie notowanie każdej znanej spółki. Dla każdego tickera jedno wyszukanie
+    # po kluczu (ticker, ts) - koszt nie rośnie z długością historii (GROUP BY po
+    # całej tabeli ticks skanował ją w całości). Stara definicja jest zastępowana.
+    c.execute('DROP VIEW IF EXISTS latest_ticks')
+    c.execute('''
+        CREATE VIEW latest_ticks AS
+        SELECT t.ticker, t.ts, t.open, t.high, t.low, t.close, t.volume, t.change_pct
+        FROM (SELECT ticker FROM universe_members UNION SELECT ticker FROM companies) k
+        JOIN ticks t ON t.ticker = k.ticker AND t.ts = (
+            SELECT lt.ts FROM ticks lt WHERE lt.ticker = k.ticker ORDER BY lt.ts DESC LIMIT 1)
+    ''')
+
+def _parse_timestamp(value):
+    """Parses a TIMESTAMP column stored by the default sqlite3 adapter."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+    except ValueError:
+        # Try alternative format if microsecond assumes diff
+        try:
+            return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+
+def get_meta(key):
+    """Returns a value from the meta table or None."""
+    rows = _read('SELECT value FROM meta WHERE key = ?', (key,))
+    if rows:
+        return rows[0]['value']
+    return None
+
+def set_meta(key, value):
+    """Saves a value to the meta table."""
+    def job(c):
+        c.execute('''
+            INSERT INTO meta (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value
+        ''', (key, value))
+    _write(job)
 
 def get_sector_from_db(ticker):
     """Retrieves the sector for a given ticker from the database."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT sector FROM companies WHERE ticker = ?', (ticker,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return row['sector']
+    rows = _read('SELECT sector FROM companies WHERE ticker = ?', (ticker,))
+    if rows:
+        return rows[0]['sector']
     return None
 
+@metrics.timed('db.load_all_sectors')
+def load_all_sectors():
+    """
+    Loads the whole sector knowledge base in one query.
+    Returns {ticker: (sector, updated_at datetime or None)}
+    """
+    rows = _read('SELECT ticker, sector, updated_at FROM companies')
+    return {r['ticker']: (r['sector'], _parse_timestamp(r['updated_at'])) for r in rows}
+
 def save_sector_to_db(ticker, sector):
     """Saves or updates the sector for a given ticker."""
-    conn = get_connection()
-    c = conn.cursor()
-    now = datetime.datetime.now()
-    c.execute('''
-        INSERT INTO companies (ticker, sector, updated_at) 
-        VALUES (?, ?, ?)
-        ON CONFLICT(ticker) DO UPDATE SET
-            sector=excluded.sector,
-            updated_at=excluded.updated_at
-    ''', (ticker, sector, now))
-    conn.commit()
-    conn.close()
+    bulk_upsert_sectors({ticker: sector})
 
 def bulk_upsert_sectors(data_dict):
     """
@@ -84,100 +454,281 @@ def bulk_upsert_sectors(data_dict):
     if not data_dict:
         return
         
-    conn = get_connection()
-    c = conn.cursor()
     now = datetime.datetime.now()
     
     # Prepare list of tuples for executemany
     params = [(ticker, sector, now) for ticker, sector in data_dict.items()]
     
-    c.executemany('''
-        INSERT INTO companies (ticker, sector, updated_at) 
-        VALUES (?, ?, ?)
-        ON CONFLICT(ticker) DO UPDATE SET
-            sector=excluded.sector,
-            updated_at=excluded.updated_at
-    ''', params)
+    def job(c):
+        c.executemany('''
+            INSERT INTO companies (ticker, sector, updated_at) 
+            VALUES (?, ?, ?)
+            ON CONFLICT(ticker) DO UPDATE SET
+                sector=excluded.sector,
+                updated_at=excluded.updated_at
+        ''', params)
     
-    conn.commit()
-    conn.close()
+    _write(job)
+
+# --- SYMBOL MASTER ---
+
+@metrics.timed('db.load_symbols')
+def load_symbols():
+    """Returns all symbol master rows: dicts {'gpw', 'yahoo', 'isin', 'sector', 'indices'}."""
+    rows = _read('SELECT gpw, yahoo, isin, sector, indices FROM symbols')
+    return [dict(r) for r in rows]
+
+def upsert_symbols(rows):
+    """
+    Inserts or replaces symbol master entries (keyed by GPW name) in one transaction.
+    rows: iterable of tuples (gpw, yahoo, isin, sector, indices)
+    """
+    params = [tuple(r) + (datetime.datetime.now(),) for r in rows]
+    if not params:
+        return
+
+    def job(c):
+        # Zwolnienie starych symboli/ISIN aktualizowanych spółek - zamiana symboli
+        # między dwiema spółkami nie łamie UNIQUE w trakcie zapisu
+        c.executemany('UPDATE symbols SET yahoo = NULL, isin = NULL WHERE gpw = ?',
+                      [(p[0],) for p in params])
+        c.executemany('''
+            INSERT INTO symbols (gpw, yahoo, isin, sector, indices, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(gpw) DO UPDATE SET
+                yahoo=excluded.yahoo,
+                isin=excluded.isin,
+                sector=excluded.sector,
+                indices=excluded.indices,
+                updated_at=excluded.updated_at
+        ''', params)
+
+    _write(job)
 
 # --- PORTFOLIO FUNCTIONS ---
 
-def save_portfolio_snapshot(data_list):
+def save_portfolio_snapshot(data_list, wait=True, universe=DEFAULT_UNIVERSE):
     """
-    Saves the full portfolio list to DB.
-    Replaces existing cache (we assume we want the current state).
+    Saves the current state of one universe (index) to DB.
+    Composition (share) is upserted only where it changed, prices are
+    appended to the `ticks` history instead of overwriting the cache.
     data_list: list of dicts {'ticker': ..., 'share': ..., 'price': ..., 'change_pct': ...}
+    Optional keys: 'open', 'high', 'low', 'volume', 'ts' (epoch seconds),
+    'stale' (True = price not refreshed, skipped in history).
+    Companies missing from data_list are removed from the universe only.
+    wait=False queues the write and returns immediately.
     """
-    conn = get_connection()
-    c = conn.cursor()
     now = datetime.datetime.now()
-    
-    # Clear old portfolio cache - we only want current state
-    c.execute('DELETE FROM portfolio')
-    
-    params = []
+    now_ts = int(time.time())
+
+    share_params = []
+    tick_params = []
     for item in data_list:
-        params.append((
-            item['ticker'], 
-            item.get('share', 0.0), 
-            item.get('price', 0.0), 
-            item.get('change_pct', 0.0), 
-            now
+        share_params.append((universe, item['ticker'], item.get('share', 0.0), now))
+
+        price = item.get('price', 0.0)
+        if not price or item.get('stale'):
+            continue # Brak nowego notowania - nie dopisujemy starej ceny do historii
+        tick_params.append((
+            item['ticker'],
+            int(item.get('ts') or now_ts),
+            item.get('open'),
+            item.get('high'),
+            item.get('low'),
+            price,
+            item.get('volume'),
+            item.get('change_pct', 0.0)
         ))
-        
-    c.executemany('''
-        INSERT INTO portfolio (ticker, share, price, change_pct, updated_at)
-        VALUES (?, ?, ?, ?, ?)
+
+    def job(c):
+        # Skład indeksu: zapis tylko gdy udział faktycznie się zmienił
+        c.executemany('''
+            INSERT INTO universe_members (universe, ticker, share, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(universe, ticker) DO UPDATE SET
+                share=excluded.share,
+                updated_at=excluded.updated_at
+            WHERE universe_members.share IS NOT excluded.share
+        ''', share_params)
+
+        # Spółki, które wypadły ze składu
+        tickers = {p[1] for p in share_params}
+        c.execute('SELECT ticker FROM universe_members WHERE universe = ?', (universe,))
+        removed = [(universe, r['ticker']) for r in c.fetchall() if r['ticker'] not in tickers]
+        if removed:
+            c.executemany('DELETE FROM universe_members WHERE universe = ? AND ticker = ?', removed)
+
+        # Historia: tylko INSERT (append-only), duplikat (ticker, ts) jest pomijany
+        c.executemany('''
+            INSERT OR IGNORE INTO ticks (ticker, ts, open, high, low, close, volume, change_pct)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', tick_params)
+
+    _write(job, wait=wait)
+
+def _load_members(universe=None):
+    """Universe members joined with sectors and the latest tick (all universes if None)."""
+    # Fallback to legacy portfolio price columns for DBs without tick history yet.
+    where, params = ('WHERE m.universe = ?', (universe,)) if universe else ('', ())
+    rows = _read(f'''
+        SELECT m.universe, m.ticker, m.share,
+               COALESCE(l.close, p.price) AS price,
+               COALESCE(l.change_pct, p.change_pct) AS change_pct,
+               c.sector
+        FROM universe_members m
+        LEFT JOIN latest_ticks l ON l.ticker = m.ticker
+        LEFT JOIN portfolio p ON m.ticker = p.ticker
+        LEFT JOIN companies c ON m.ticker = c.ticker
+        {where}
     ''', params)
-    
-    conn.commit()
-    conn.close()
 
-def load_portfolio_from_db():
-    """
-    Loads portfolio from DB and joins with sectors.
-    Returns list of dicts: {'ticker', 'share', 'sector', 'price', 'change_pct'}
-    """
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Left join to get sectors if available
-    c.execute('''
-        SELECT p.ticker, p.share, p.price, p.change_pct, c.sector 
-        FROM portfolio p
-        LEFT JOIN companies c ON p.ticker = c.ticker
-    ''')
-    rows = c.fetchall()
-    conn.close()
-    
-    result = []
+    result = {}
     for r in rows:
-        result.append({
+        result.setdefault(r['universe'], []).append({
             'ticker': r['ticker'],
             'share': r['share'],
             'price': r['price'] if r['price'] else 0.0,
             'change_pct': r['change_pct'] if r['change_pct'] else 0.0,
-            'sector': r['sector'] if r['sector'] else 'Inne / Nieznany'
+            'sector': r['sector'] if r['sector'] else UNKNOWN_SECTOR
         })
     return result
 
+@metrics.timed('db.load_portfolio_from_db')
+def load_portfolio_from_db(universe=DEFAULT_UNIVERSE):
+    """
+    Loads one universe from DB and joins with sectors and the latest tick.
+    Returns list of dicts: {'ticker', 'share', 'sector', 'price', 'change_pct'}
+    """
+    return _load_members(universe).get(universe, [])
+
+@metrics.timed('db.load_universes')
+def load_universes():
+    """All universes in one query: {universe: [rows like load_portfolio_from_db]}"""
+    return _load_members()
+
+def save_bars(bars, wait=True):
+    """
+    Stores intraday bars in `ticks`.
+    bars: iterable of tuples (ticker, ts, open, high, low, close, volume, change_pct)
+    The newest bar may still be forming, so a bar re-sent with the same
+    (ticker, ts) replaces the stored one instead of being ignored.
+    """
+    params = list(bars)
+    if not params:
+        return
+
+    def job(c):
+        c.executemany('''
+            INSERT INTO ticks (ticker, ts, open, high, low, close, volume, change_pct)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(ticker, ts) DO UPDATE SET
+                open=excluded.open,
+                high=excluded.high,
+                low=excluded.low,
+                close=excluded.close,
+                volume=excluded.volume,
+                change_pct=excluded.change_pct
+        ''', params)
+
+    _write(job, wait=wait)
+
+def save_index_bars(rows, wait=True):
+    """
+    Stores index levels in `index_ticks`.
+    rows: iterable of tuples (universe, ts, index_return, weight, contributions_json)
+    Like bars, the level of a still-forming bar is replaced when re-sent.
+    """
+    params = [r for r in rows if r[1] is not None]
+    if not params:
+        return
+
+    def job(c):
+        c.executemany('''
+            INSERT INTO index_ticks (universe, ts, index_return, weight, contributions)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(universe, ts) DO UPDATE SET
+                index_return=excluded.index_return,
+                weight=excluded.weight,
+                contributions=excluded.contributions
+        ''', params)
+
+    _write(job, wait=wait)
+
+@metrics.timed('db.load_index_history')
+def load_index_history(universe=DEFAULT_UNIVERSE, since_ts=None):
+    """
+    Returns the index level history of one universe (oldest first).
+    List of dicts: {'ts', 'index_return', 'weight', 'contributions': {sector: p.p.}}
+    """
+    rows = _read('''
+        SELECT ts, index_return, weight, contributions
+        FROM index_ticks
+        WHERE universe = ? AND ts >= ?
+        ORDER BY ts
+    ''', (universe, since_ts or 0))
+    return [dict(r, contributions=json.loads(r['contributions'] or '{}')) for r in rows]
+
+@metrics.timed('db.get_last_bar_times')
+def get_last_bar_times(tickers, until_ts=None):
+    """
+    Returns {ticker: ts of the newest stored bar} for the given tickers.
+    Bars after until_ts (e.g. stamped by a fast-forwarded clock) are ignored.
+    One PK lookup per ticker - doesn't grow with the stored history.
+    """
+    rows = _read('''
+        SELECT k.value AS ticker,
+               (SELECT t.ts FROM ticks t WHERE t.ticker = k.value AND t.ts <= ?
+                ORDER BY t.ts DESC LIMIT 1) AS ts
+        FROM json_each(?) k
+    ''', (int(until_ts) if until_ts is not None else 2**62, json.dumps(sorted(set(tickers)))))
+    return {r['ticker']: r['ts'] for r in rows if r['ts'] is not None}
+
+@metrics.timed('db.get_day_opens')
+def get_day_opens(tickers, since_ts):
+    """Returns {ticker: open of the first bar at or after since_ts} (session open) for the given tickers."""
+    rows = _read('''
+        SELECT k.value AS ticker,
+               (SELECT t.open FROM ticks t WHERE t.ticker = k.value AND t.ts >= ?
+                ORDER BY t.ts LIMIT 1) AS open
+        FROM json_each(?) k
+    ''', (since_ts, json.dumps(sorted(set(tickers)))))
+    return {r['ticker']: r['open'] for r in rows if r['open']}
+
+@metrics.timed('db.load_session_changes')
+def load_session_changes(tickers, since_ts, until_ts):
+    """
+    Bars of many tickers in [since_ts, until_ts) for replay.
+    Returns (ticker, ts, change_pct) rows ordered by ts.
+    """
+    tickers = list(tickers)
+    if not tickers:
+        return []
+    marks = ",".join("?" * len(tickers))
+    return [tuple(r) for r in _read(f'''
+        SELECT ticker, ts, change_pct
+        FROM ticks
+        WHERE ticker IN ({marks}) AND ts >= ? AND ts < ?
+        ORDER BY ts
+    ''', (*tickers, since_ts, until_ts))]
+
+def get_last_tick_ts(tickers=None):
+    """ts of the newest stored bar (of the given tickers) or None."""
+    if tickers is None:
+        return _read('SELECT MAX(ts) AS ts FROM ticks')[0]['ts']
+    tickers = list(tickers)
+    if not tickers:
+        return None
+    marks = ",".join("?" * len(tickers))
+    return _read(f'SELECT MAX(ts) AS ts FROM ticks WHERE ticker IN ({marks})', tickers)[0]['ts']
+
 def get_last_portfolio_date():
     """Returns the datetime of the last portfolio update or None."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT MAX(updated_at) as last_date FROM portfolio')
-    row = c.fetchone()
-    conn.close()
+    tick_row = _read('SELECT MAX(ts) as last_ts FROM ticks')[0]
+    row = _read('SELECT MAX(updated_at) as last_date FROM universe_members')[0]
+
+    if tick_row and tick_row['last_ts']:
+        return datetime.datetime.fromtimestamp(tick_row['last_ts'])
     
-    if row and row['last_date']:
-        try:
-            return datetime.datetime.strptime(row['last_date'], "%Y-%m-%d %H:%M:%S.%f")
-        except ValueError:
-            # Try alternative format if microsecond assumes diff
-            try:
-                return datetime.datetime.strptime(row['last_date'], "%Y-%m-%d %H:%M:%S")
-            except:
-                return None
+    if row:
+        return _parse_timestamp(row['last_date'])
     return None
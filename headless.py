@@ -0,0 +1,165 @@
+"""
+Headless mode: renders the heatmap and donut charts with Agg (no Tk window)
+to PNG/SVG on every new data version, optionally serving them over HTTP.
+"""
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from charts import (HeatMapRenderer, DonutChart, ContributionBars, new_heatmap_figure, new_donut_figure,
+                    new_bars_figure, top_companies_pie, sector_pie)
+from market_state import market_state, get_market_snapshot
+from metrics import metrics
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+class ChartRenderer:
+    """
+    Renders the dashboard charts on Agg figures.
+    Output is cached by (data version, chart, format), so repeated
+    requests for the same market state cost nothing.
+    """
+    CHARTS = ('heatmap', 'index', 'sectors', 'contributions')
+
+    def __init__(self, cache_size=32, dpi=100):
+        self.dpi = dpi
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock() # Figures aren't thread-safe - one render at a time
+
+        fig, ax = new_heatmap_figure()
+        self._figures = {'heatmap': fig}
+        self._heatmap = HeatMapRenderer(fig, ax)
+
+        fig, ax = new_donut_figure()
+        self._figures['index'] = fig
+        self._index = DonutChart(ax, "Top 10 Spółek")
+
+        fig, ax = new_donut_figure()
+        self._figures['sectors'] = fig
+        self._sectors = DonutChart(ax, "Struktura Sektorowa")
+
+        fig, ax = new_bars_figure()
+        self._figures['contributions'] = fig
+        self._contributions = ContributionBars(ax)
+
+        for fig in self._figures.values():
+            FigureCanvasAgg(fig)
+
+    def render(self, chart, snapshot, fmt='png'):
+        """Returns the chart as bytes in the given format."""
+        if chart not in self._figures:
+            raise ValueError(f"Unknown chart: {chart}")
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        key = (snapshot.version, chart, fmt)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+            data = snapshot.portfolio
+            render_t0 = time.perf_counter()
+            if chart == 'heatmap':
+                stamp = time.strftime("%H:%M:%S", time.localtime(snapshot.published_at or time.time()))
+                self._heatmap.render(data, timestamp=stamp)
+            elif chart == 'index':
+                self._index.render(*top_companies_pie(data))
+            elif chart == 'contributions':
+                self._contributions.render(snapshot.index)
+            else:
+                self._sectors.render(*sector_pie(data))
+
+            fig = self._figures[chart]
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt, dpi=self.dpi, facecolor=fig.get_facecolor())
+            output = buf.getvalue()
+            metrics.observe(f'render.{chart}.{fmt}', time.perf_counter() - render_t0)
+
+            self._cache[key] = output
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return output
+
+    def export(self, snapshot, out_dir, formats=('png',)):
+        """Writes every chart to out_dir/<chart>.<fmt>. Returns the written paths."""
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for chart in self.CHARTS:
+            for fmt in formats:
+                path = os.path.join(out_dir, f"{chart}.{fmt}")
+                tmp = path + ".tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(self.render(chart, snapshot, fmt))
+                # Atomic swap - readers (web server, bot) never see a half-written file
+                os.replace(tmp, path)
+                paths.append(path)
+        return paths
+
+
+def make_handler(renderer):
+    """HTTP handler serving /<chart>.<fmt> for the latest snapshot from the render cache."""
+    class ChartHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.split('?', 1)[0].strip('/')
+            chart, _, fmt = name.partition('.')
+            if chart not in ChartRenderer.CHARTS or fmt not in CONTENT_TYPES:
+                self.send_error(404, "Available: " + ", ".join(
+                    f"/{c}.{f}" for c in ChartRenderer.CHARTS for f in CONTENT_TYPES))
+                return
+            snap = get_market_snapshot()
+            if not snap.rows:
+                self.send_error(503, "No market data yet")
+                return
+            body = renderer.render(chart, snap, fmt)
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[fmt])
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", f'"{snap.version}"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return ChartHandler
+
+
+def run_headless(out_dir=None, formats=('png',), port=None):
+    """
+    Main loop of the headless mode: waits for new data versions published by
+    MarketDataFetcher and exports the charts. Blocks until Ctrl+C.
+    """
+    renderer = ChartRenderer()
+    server = None
+    if port:
+        server = ThreadingHTTPServer(('0.0.0.0', port), make_handler(renderer))
+        threading.Thread(target=server.serve_forever, daemon=True, name="ChartServer").start()
+        print(f">>> [HEADLESS] Wykresy dostępne pod http://localhost:{port}/heatmap.png")
+
+    version = 0
+    try:
+        while True:
+            snap = market_state.wait_for_version(version, timeout=1.0)
+            if snap.version == version:
+                continue
+            version = snap.version
+            if out_dir and snap.rows:
+                t0 = time.perf_counter()
+                renderer.export(snap, out_dir, formats)
+                print(f">>> [HEADLESS] v{version}: wykresy zapisane w {out_dir} "
+                      f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.shutdown()
@@ -0,0 +1,115 @@
+"""
+Live index level: weighted index return (share x change %) and per-sector
+contributions, kept up to date incrementally - a tick of one company costs
+O(1), not a pass over the whole index.
+
+    engine = IndexEngine(rows)          # rows: company dicts with share/sector/change_pct
+    engine.update('PKN', 1.25, ts)      # new change % of one company
+    level = engine.level()              # IndexLevel for the dashboards / DB
+"""
+import json
+import math
+from collections import namedtuple
+
+UNKNOWN_SECTOR = "Inne / Nieznany"  # Sector of companies without a known one (the value sectors/database store)
+RESYNC_EVERY = 50000    # Full recomputation after this many updates (float drift)
+
+# index_return: weighted change of the index [%]
+# contributions: ((sector, contribution in p.p.), ...) largest absolute first;
+#   contributions add up to index_return
+# weight: total share of the companies [%]; count: number of companies
+# ts: newest bar ts that went into the level (None before the first tick)
+IndexLevel = namedtuple('IndexLevel', ['index_return', 'contributions', 'weight', 'count', 'ts'])
+
+
+def _change(value):
+    # No quote yet (None/NaN) counts as no change
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 0.0
+    return float(value)
+
+
+class IndexEngine:
+    """Weighted index return and sector contributions of one universe."""
+    def __init__(self, rows=()):
+        self.reset(rows)
+
+    def reset(self, rows):
+        """Full rebuild - on composition, weight or sector changes."""
+        self._weights = {}      # ticker -> share
+        self._sectors = {}      # ticker -> sector
+        self._changes = {}      # ticker -> change_pct included in the sums
+        for r in rows:
+            ticker = r['ticker']
+            self._weights[ticker] = float(r.get('share') or 0.0)
+            self._sectors[ticker] = r.get('sector') or UNKNOWN_SECTOR
+            self._changes[ticker] = _change(r.get('change_pct'))
+        self.ts = None
+        self._resync()
+
+    def _resync(self):
+        self._total_weight = sum(self._weights.values())
+        self._weighted = 0.0    # sum of share * change_pct
+        self._by_sector = {}    # sector -> sum of share * change_pct
+        for ticker, weight in self._weights.items():
+            part = weight * self._changes[ticker]
+            self._weighted += part
+            sector = self._sectors[ticker]
+            self._by_sector[sector] = self._by_sector.get(sector, 0.0) + part
+        self._updates = 0
+
+    def __contains__(self, ticker):
+        return ticker in self._weights
+
+    def update(self, ticker, change_pct, ts=None):
+        """New change % of one company. Returns False if it isn't in the index or nothing changed."""
+        weight = self._weights.get(ticker)
+        if weight is None:
+            return False
+        if ts is not None and (self.ts is None or ts > self.ts):
+            self.ts = ts
+        change_pct = _change(change_pct)
+        old = self._changes[ticker]
+        if change_pct == old:
+            return False
+        self._changes[ticker] = change_pct
+        delta = weight * (change_pct - old)
+        self._weighted += delta
+        sector = self._sectors[ticker]
+        self._by_sector[sector] += delta
+
+        self._updates += 1
+        if self._updates >= RESYNC_EVERY:
+            self._resync()
+        return True
+
+    @property
+    def index_return(self):
+        if not self._total_weight:
+            return 0.0
+        return self._weighted / self._total_weight
+
+    def contributions(self):
+        """{sector: contribution in p.p.} - sums to index_return."""
+        if not self._total_weight:
+            return {}
+        return {s: v / self._total_weight for s, v in self._by_sector.items()}
+
+    def level(self):
+        contributions = sorted(self.contributions().items(), key=lambda x: abs(x[1]), reverse=True)
+        return IndexLevel(self.index_return, tuple(contributions), self._total_weight,
+                          len(self._weights), self.ts)
+
+
+def header_text(universe, level, top=3):
+    """One-line ticker for the window header: index return + top sector contributions."""
+    if level is None:
+        return f"{universe}  --"
+    parts = "   ".join(f"{s} {v:+.2f} p.p." for s, v in level.contributions[:top])
+    return f"{universe}  {level.index_return:+.2f}%" + (f"   |   {parts}" if parts else "")
+
+
+def to_db_row(universe, level):
+    """IndexLevel -> index_ticks row (universe, ts, index_return, weight, contributions JSON)."""
+    return (universe, level.ts, level.index_return, level.weight,
+            json.dumps({s: round(v, 6) for s, v in level.contributions}, ensure_ascii=False))
@@ -1,60 +1,189 @@
 import time
+_T0 = time.perf_counter() # Start of the startup-time breakdown
+
+import argparse
+import csv
+import os
+import queue
 import sys
-import tkinter as tk
-from tkinter import ttk
 import threading
 
-# Modules
-# Modules
-from database import init_db, save_portfolio_snapshot, load_portfolio_from_db, get_last_portfolio_date, bulk_upsert_sectors
-# from scheduler import should_update_portfolio # scheduler.py deleted
-from sectors import enrich_data_with_sectors
-# from fetch_gpw_debug import fetch_gpw_shares # fetch_gpw_debug.py deleted
-from market_data import MarketDataFetcher
-from visualizer import HeatMapVisualizer # Now a Tkinter Frame
+# Modules - only the light ones. Tk, matplotlib, pandas (fetcher) and
+# requests/bs4 (sectors) are imported where they are first needed.
+import database
+from database import init_db, save_portfolio_snapshot, load_universes, copy_reference_data, DEFAULT_UNIVERSE
+from market_state import market_state, get_market_snapshot
+from index_engine import header_text
+from metrics import metrics, start_prometheus_writer
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="WIG Scalper - System Handlowy")
+    parser.add_argument("--provider", choices=["yfinance", "replay", "synthetic"], default="yfinance",
+                        help="Źródło notowań (replay/synthetic działają bez sieci)")
+    parser.add_argument("--replay-file", help="Plik CSV/Parquet z nagranymi barami (dla --provider replay)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Przyspieszenie czasu dla replay/synthetic")
+    parser.add_argument("--data-dir",
+                        help="Katalog na bazę i magazyn barów (domyślnie: baza produkcyjna dla yfinance, "
+                             "osobny katalog <provider>_offline dla replay/synthetic)")
+    parser.add_argument("--interval", type=float, default=30, help="Odstęp między cyklami pobierania w trakcie sesji [s]")
+    parser.add_argument("--headless", action="store_true",
+                        help="Bez okna Tk: renderuj wykresy (Agg) do plików przy każdej nowej wersji danych")
+    parser.add_argument("--out", default="charts", help="Katalog na wykresy w trybie --headless")
+    parser.add_argument("--formats", default="png", help="Formaty wykresów, np. png,svg")
+    parser.add_argument("--port", type=int, help="Serwuj wykresy przez HTTP na tym porcie (tryb --headless)")
+    parser.add_argument("--universe", default=DEFAULT_UNIVERSE, help="Indeks wyświetlany na starcie (np. sWIG80, WIG20, mWIG40)")
+    parser.add_argument("--import-universe", nargs=2, action="append", metavar=("NAZWA", "PLIK_CSV"), default=[],
+                        help="Zapisz skład indeksu z pliku CSV (kolumny: ticker, share) przed startem")
+    parser.add_argument("--import-symbols", metavar="PLIK_CSV",
+                        help="Import słownika symboli (kolumny: gpw, yahoo, isin, sector, indices) przed startem")
+    parser.add_argument("--metrics-file", help="Zapisuj metryki w formacie Prometheus (textfile collector) do tego pliku")
+    return parser.parse_args(argv)
+
+def import_universe(name, path):
+    """Loads an index composition (ticker, share) from CSV into the universe `name`."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = [{'ticker': r['ticker'].strip().upper(), 'share': float(r['share'])}
+                for r in csv.DictReader(f) if r.get('ticker')]
+    save_portfolio_snapshot(rows, universe=name)
+    print(f">>> [DB] Indeks {name}: zapisano {len(rows)} spółek z {path}")
+
+DB_NAME = "wig_data.db"
+
+def select_data_dir(args):
+    """
+    Points the database (and bars/ next to it) at the run's data directory.
+    Offline providers get their own directory by default - their bars (future
+    timestamps with --speed, replayed prices) must never reach the live data.
+    Returns the live database file (source of reference data for a fresh one).
+    """
+    live_db = database.DB_FILE
+    data_dir = args.data_dir
+    if data_dir is None and args.provider != "yfinance":
+        data_dir = os.path.join(os.path.dirname(live_db), f"{args.provider}_offline")
+    if data_dir is not None:
+        os.makedirs(data_dir, exist_ok=True)
+        database.DB_FILE = os.path.join(data_dir, DB_NAME)
+    return live_db
+
+class StartupProfile:
+    """Startup-time breakdown: named phases measured from process start."""
+    def __init__(self, t0):
+        self.t0 = self.last = t0
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        metrics.observe(f'startup.{name}', now - self.last)
+        self.last = now
+
+    def report(self, label):
+        total = time.perf_counter() - self.t0
+        parts = ", ".join(f"{name} {dt * 1000:.0f} ms" for name, dt in self.phases)
+        print(f">>> [STARTUP] {label}: {total * 1000:.0f} ms ({parts})")
+
+def start_fetcher(args, universes, on_started=None):
+    """Imports the fetcher stack (pandas, numpy, providers) and starts MarketDataFetcher."""
+    t0 = time.perf_counter()
+    from providers import make_provider
+    from market_data import MarketDataFetcher
+    metrics.observe('startup.fetcher_import', time.perf_counter() - t0)
+
+    provider = make_provider(args.provider, path=args.replay_file, speed=args.speed)
+    print(f">>> [THREAD] Data provider: {provider.name}")
+    fetcher = MarketDataFetcher(interval=args.interval, provider=provider)
+    fetcher.load_universes(universes)
+    fetcher.start()
+    if on_started:
+        on_started(fetcher, time.perf_counter() - t0)
+    return fetcher
 
 def main():
+    args = parse_args()
+    profile = StartupProfile(_T0)
+    profile.mark("importy")
     print("--- Start Systemu WIG Scalper (Tkinter + Threading) ---")
     
     # 1. Init DB
+    live_db = select_data_dir(args)
     init_db()
+    if database.DB_FILE != live_db:
+        print(f">>> [DB] Baza tego uruchomienia: {database.DB_FILE}")
+        copied = copy_reference_data(live_db)
+        if copied:
+            print(f">>> [DB] Skopiowano dane referencyjne (składy, sektory, symbole): {copied} wierszy z {live_db}")
+    if args.import_symbols:
+        from symbols import symbol_master, SymbolConflictError
+        try:
+            n = symbol_master.import_csv(args.import_symbols)
+            print(f">>> [DB] Słownik symboli: zaimportowano {n} wpisów z {args.import_symbols}")
+        except SymbolConflictError as e:
+            print(f"!!! [CRITICAL] Import odrzucony - {e}")
+            sys.exit(1)
+    for name, path in args.import_universe:
+        import_universe(name, path)
+
+    # All universes in one query - shared by the GUI (market_state) and the fetcher
+    universes = load_universes()
+    if universes:
+        market_state.publish_universes(universes)
+    market_state.select_universe(args.universe)
     
-    # 2. Logic (Check Updates) 
-    # Legacy scheduler/fetch logic removed as files were cleaned up.
-    # The application now relies on existing DB data or Manual triggers (future).
-    # If DB is empty, user might need to run a seed script or we can re-implement
-    # a basic fetcher here if critical. For now, assuming data exists or thread will handle price updates.
-    
-    # Check data integrity
-    if not load_portfolio_from_db():
+    # Check data integrity (cold start: DB -> shared market state)
+    portfolio = get_market_snapshot().portfolio
+    if not portfolio.tickers:
         print("!!! [CRITICAL] No data in DB.")
         sys.exit(1)
+    profile.mark("baza")
 
-    # 3. Start Data Thread (Producer)
-    print(">>> [THREAD] Starting MarketDataFetcher...")
-    
     # --- RESTORE CONSOLE OUTPUT ---
     # User wants to see the loaded data
-    loaded_data = load_portfolio_from_db()
-    if loaded_data:
-        print(f"\n{'='*60}")
-        print(f"{'TICKER':<15} | {'SECTOR':<30} | {'SHARE':<10}")
-        print(f"{'-'*60}")
-        # Sort by share desc
-        sorted_data = sorted(loaded_data, key=lambda x: x.get('share', 0), reverse=True)
-        for row in sorted_data:
-            t = row.get('ticker', '')
-            s = row.get('sector', 'N/A')
-            sh = row.get('share', 0.0)
-            print(f"{t:<15} | {s:<30} | {sh:<10.2f}%")
-        print(f"{'='*60}\n")
-        print(f">>> Loaded {len(loaded_data)} companies.")
+    print(f"\n{'='*60}")
+    print(f"{'TICKER':<15} | {'SECTOR':<30} | {'SHARE':<10}")
+    print(f"{'-'*60}")
+    # Sorted by share desc (order precomputed in the snapshot)
+    for i in portfolio.by_share:
+        t = portfolio.tickers[i]
+        s = portfolio.sectors[portfolio.sector_code[i]]
+        sh = portfolio.share[i]
+        print(f"{t:<15} | {s:<30} | {sh:<10.2f}%")
+    print(f"{'='*60}\n")
+    print(f">>> Loaded {len(portfolio.tickers)} companies ({market_state.universe}).")
     # ------------------------------
 
-    fetcher = MarketDataFetcher(interval=30)
-    fetcher.start()
+    if args.metrics_file:
+        start_prometheus_writer(args.metrics_file)
+        print(f">>> [METRICS] Prometheus: {args.metrics_file}")
+
+    # 2. Start Data Thread (Producer)
+    print(">>> [THREAD] Starting MarketDataFetcher...")
+    if args.headless:
+        fetcher = start_fetcher(args, universes)
+        profile.mark("fetcher")
+        profile.report("Czas startu (headless)")
+        from headless import run_headless
+        print(">>> [HEADLESS] Rendering without GUI (Ctrl+C to stop)...")
+        run_headless(out_dir=args.out, formats=tuple(args.formats.split(',')), port=args.port)
+        fetcher.stop()
+        return
+
+    # GUI: the fetcher stack (pandas) loads in the background while the window comes up
+    fetchers = []
+    def on_fetcher_started(fetcher, elapsed):
+        fetchers.append(fetcher)
+        print(f">>> [STARTUP] Fetcher gotowy w tle: {elapsed * 1000:.0f} ms")
+
+    def launch_fetcher():
+        try:
+            start_fetcher(args, universes, on_started=on_fetcher_started)
+        except Exception as e:
+            print(f"!!! [CRITICAL] MarketDataFetcher nie wystartował: {e}")
+    threading.Thread(target=launch_fetcher, name="FetcherStart", daemon=True).start()
+
+    # 3. Start GUI (Consumer)
+    import tkinter as tk
+    from tkinter import ttk
 
-    # 4. Start GUI (Consumer)
     root = tk.Tk()
     root.title("WIG Scalper - System Handlowy")
     root.geometry("1400x900")
@@ -83,53 +212,160 @@ def main():
                     relief="flat")
     style.map("Dark.Treeview.Heading", background=[("active", "#333333")])
     
+    # --- UNIVERSE SWITCH ---
+    toolbar = tk.Frame(root, bg="#2b2b2b")
+    toolbar.pack(fill=tk.X, padx=10, pady=(8, 0))
+    tk.Label(toolbar, text="Indeks:", bg="#2b2b2b", fg="white", font=('Helvetica', 10, 'bold')).pack(side=tk.LEFT)
+    universe_var = tk.StringVar(value=market_state.universe)
+    universe_box = ttk.Combobox(toolbar, textvariable=universe_var, state="readonly", width=12,
+                                values=sorted(universes))
+    universe_box.pack(side=tk.LEFT, padx=5)
+
+    # Index ticker: weighted return of the selected index + sectors driving it
+    index_label = tk.Label(toolbar, text="", bg="#2b2b2b", fg="white", font=('Helvetica', 11, 'bold'))
+    index_label.pack(side=tk.LEFT, padx=15)
+
+    def update_index_header():
+        snap = market_state.snapshot()
+        level = snap.index
+        fg = "white" if level is None or level.index_return == 0 else ("#35b758" if level.index_return > 0 else "#e0474a")
+        index_label.config(text=header_text(snap.universe, level), fg=fg)
+    update_index_header()
+
     # --- TABS LAYOUT ---
     notebook = ttk.Notebook(root)
     notebook.pack(fill=tk.BOTH, expand=True)
+
+    # Tabs are built (with their Figures) the first time they are selected
+    def build_index(parent):
+        from dashboard import IndexTab
+        return IndexTab(parent)
+
+    def build_sectors(parent):
+        from dashboard import SectorsTab
+        return SectorsTab(parent)
+
+    def build_heatmap(parent):
+        from visualizer import HeatMapVisualizer
+        return HeatMapVisualizer(parent)
+
+    def build_diagnostics(parent):
+        from dashboard import DiagnosticsTab
+        return DiagnosticsTab(parent)
+
+    # (title, builder, refresh method, metric, follows data versions)
+    TABS = [
+        ("Skład Indeksu", build_index, 'update_view', 'gui.index.update_view', True),
+        ("Sektory", build_sectors, 'update_view', 'gui.sectors.update_view', True),
+        ("Heatmapa", build_heatmap, 'update_plot', 'gui.heatmap.update_plot', True),
+        ("Diagnostyka", build_diagnostics, 'update_view', None, False),
+    ]
+    tab_frames = []
+    for title, *_ in TABS:
+        frame = ttk.Frame(notebook)
+        notebook.add(frame, text=title)
+        ttk.Label(frame, text="Ładowanie...", background="#2b2b2b", foreground="white").pack(pady=20)
+        tab_frames.append(frame)
+    views = {}
+    shown_versions = {} # tab index -> data version it last showed
+
+    def ensure_tab(index):
+        """Builds the tab on first use. Returns True if it was built now."""
+        if index in views:
+            return False
+        for child in tab_frames[index].winfo_children():
+            child.destroy() # Placeholder
+        with metrics.timed(f'gui.build_tab.{index}'):
+            views[index] = TABS[index][1](tab_frames[index])
+        return True
     
-    # Imports
-    from visualizer import HeatMapVisualizer
-    from dashboard import IndexTab, SectorsTab
-    
-    # Tab 1: Skład Indeksu
-    tab1 = ttk.Frame(notebook)
-    notebook.add(tab1, text="Skład Indeksu")
-    index_frame = IndexTab(tab1)
-    
-    # Tab 2: Sektory
-    tab2 = ttk.Frame(notebook)
-    notebook.add(tab2, text="Sektory")
-    sectors_frame = SectorsTab(tab2)
-    
-    # Tab 3: Heatmapa
-    tab3 = ttk.Frame(notebook)
-    notebook.add(tab3, text="Heatmapa")
-    viz_frame = HeatMapVisualizer(tab3)
-    
-    # Periodic GUI Update Loop
-    def update_gui_loop():
-        # Update current tab content
+    def refresh_current_tab():
+        """Redraws the visible tab - data tabs only when their version is behind."""
         current_tab = notebook.index(notebook.select())
+        _, _, method, metric, versioned = TABS[current_tab]
+        version = market_state.version
+        if versioned and shown_versions.get(current_tab) == version:
+            return
         
         try:
-            if current_tab == 0:
-                index_frame.update_view()
-            elif current_tab == 1:
-                sectors_frame.update_view()
-            elif current_tab == 2:
-                viz_frame.update_plot()
+            if not ensure_tab(current_tab): # Constructor already rendered the current data
+                refresh = getattr(views[current_tab], method)
+                if metric:
+                    with metrics.timed(metric):
+                        refresh()
+                else:
+                    refresh()
+            shown_versions[current_tab] = version
         except Exception as e:
             print(f"GUI Error: {e}")
-        
-        root.after(5000, update_gui_loop)
 
-    # Start the loop
-    root.after(1000, update_gui_loop)
+    # Fetcher -> GUI: every new data version lands in a thread-safe queue.
+    # A cheap after() timer drains it; bursts collapse into one redraw.
+    DRAIN_MS = 50
+    new_versions = queue.SimpleQueue()
+    market_state.add_listener(new_versions.put)
+
+    def drain_versions():
+        latest = None
+        while True:
+            try:
+                latest = new_versions.get_nowait()
+            except queue.Empty:
+                break
+        if latest is not None:
+            update_index_header()
+            refresh_current_tab()
+            metrics.observe('gui.update_latency', max(0.0, time.time() - latest.published_at))
+        root.after(DRAIN_MS, drain_versions)
+
+    # Diagnostics has no data version - refreshed on a timer, only while visible
+    DIAGNOSTICS_MS = 2000
+    def refresh_diagnostics():
+        if not TABS[notebook.index(notebook.select())][4]:
+            refresh_current_tab()
+        root.after(DIAGNOSTICS_MS, refresh_diagnostics)
+
+    # Switching universes bumps the snapshot version - the visible view redraws at once
+    def on_universe_selected(event=None):
+        market_state.select_universe(universe_var.get())
+        update_index_header()
+        refresh_current_tab()
+    universe_box.bind("<<ComboboxSelected>>", on_universe_selected)
+
+    # First window first, then the first tab (matplotlib import + first render)
+    def on_first_map(event):
+        if event.widget is not root or getattr(on_first_map, 'done', False):
+            return
+        on_first_map.done = True
+        profile.mark("okno")
+        def first_tab():
+            # Bound only now - notebook.add() queues a tab change that would build the tab before the window shows
+            notebook.bind("<<NotebookTabChanged>>", lambda event: refresh_current_tab())
+            refresh_current_tab()
+            root.update_idletasks()
+            profile.mark("pierwsza zakładka")
+            profile.report("Czas startu")
+        root.after(1, first_tab)
+    root.bind("<Map>", on_first_map, add="+")
+
+    # Start the loops
+    root.after(DRAIN_MS, drain_versions)
+    root.after(DIAGNOSTICS_MS, refresh_diagnostics)
+
+    # Main loop responsiveness: how late a short timer fires = how long Tk was blocked
+    # (includes pasting frames from the render workers)
+    LAG_PROBE_MS = 100
+    def probe_loop_lag(expected):
+        metrics.observe('gui.loop_lag', max(0.0, time.perf_counter() - expected))
+        root.after(LAG_PROBE_MS, probe_loop_lag, time.perf_counter() + LAG_PROBE_MS / 1000)
+    root.after(LAG_PROBE_MS, probe_loop_lag, time.perf_counter() + LAG_PROBE_MS / 1000)
 
     # Handle Close
     def on_closing():
         print(">>> Closing App...")
-        fetcher.stop()
+        market_state.remove_listener(new_versions.put)
+        for fetcher in fetchers:
+            fetcher.stop()
         root.destroy()
         sys.exit(0)
 
@@ -1,196 +1,532 @@
+import datetime
+import itertools
 import threading
 import time
-import yfinance as yf
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from providers import YFinanceProvider
+from scheduler import PollingScheduler
+from metrics import metrics
+from symbols import symbol_master
 # Import existing logic - respecting user's "database.py" rule
-from database import load_portfolio_from_db, save_portfolio_snapshot
-
-# Manual mapping for sWIG80 companies where GPW Benchmark name != Yahoo Ticker
-# Migrated from fetch_gpw_debug.py
-TICKER_MAPPING = {
-    'MLPGROUP': 'MLG',
-    'SNIEZKA': 'SKA',
-    'AGORA': 'AGO',
-    'BLOOBER': 'BLO',
-    'CREEPYJAR': 'CRJ',
-    'COGNOR': 'COG',
-    'AMBRA': 'AMB',
-    'MERCATOR': 'MRC',
-    'XTPL': 'XTP',
-    'MABION': 'MAB',
-    'MLSYSTEM': 'MLS',
-    'COLUMBUS': 'CLC',
-    'PEKABEX': 'PBX',
-    'WITTCHEN': 'WTN',
-    'ERBUD': 'ERB',
-    'CIGAMES': 'CIG',
-    'VOTUM': 'VOT',
-    'VIGOPHOTN': 'VGO',
-    'ASTARTA': 'AST',
-    'WAWEL': 'WWL',
-    'ECHO': 'ECH',
-    'OPONEO.PL': 'OPN',
-    'TOYA': 'TOA',
-    'AMICA': 'AMC',
-    'SYGNITY': 'SGN',
-    'BIOTON': 'BIO',
-    'ONDE': 'OND',
-    'ACAUTOGAZ': 'ACG',
-    'WIELTON': 'WLT',
-    'ARCTIC': 'ATC',
-    'SNTVERSE': 'SNT',
-    'MOSTALZAB': 'MSZ',
-    'MEDICALG': 'MDG',
-    'STALEXP': 'STX',
-    'UNIMOT': 'UNT',
-    'QUERCUS': 'QRS',
-    'KOGENERA': 'KGN',
-    'COMP': 'CMP',
-    'MENNICA': 'MNC',
-    'SANOK': 'SNK',
-    'BORYSZEW': 'BRS',
-    'ELEKTROTI': 'ELT',
-    'DADELO': 'DAD',
-    'SELENAFM': 'SEL',
-    'CAPTORTX': 'CTX',
-    'ARLEN': 'ARA',
-    'SCPFL': 'SCP',
-    'PLAYWAY': 'PLW',
-    'BIOCELTIX': 'BCX',
-    'FORTE': 'FTE',
-    'ZEPAK': 'ZEP',
-    'TARCZYNSKI': 'TAR',
-    'MCI': 'MCI',
-    'APATOR': 'APT',
-    'STALPROD': 'STP',
-    'CLNPHARMA': 'CLN',
-    'GREENX': 'GRX',
-    'RYVU': 'RVU',
-    'DECORA': 'DCR',
-    'GRENEVIA': 'GEA',
-    'ATAL': '1AT', 
-    'ENTER': 'ENT',
-    'FERRO': 'FRO',
-    'SELVITA': 'SLV',
-    'DATAWALK': 'DAT',
-    'VRG': 'VRG',
-    'ASSECOBS': 'ABS',
-    'MURAPOL': 'APR', 
-    'POLIMEXMS': 'PXM',
-    'ARCHICOM': 'ARH',
-    'SHOPER': 'SHO',
-    'TORPOL': 'TOR',
-    'RAINBOW': 'RBW',
-    'PURE': 'PUR',
-    'TIM': 'TIM',
-    'VOXEL': 'VOX',
-    'MANGATA': 'MGT',
-    'GRODNO': 'GRN',
-    
-    # Corrections based on errors
-    'CREOTECH': 'CRI',
-    'AILLERON': 'ALL',
-    'BOGDANKA': 'LWB',
-    'PCCROKITA': 'PCR',
-    'BUMECH': 'BMC',
-    'UNIBEP': 'UNI',
-    'MURAPOL': 'MUR',
-}
+from database import save_bars, save_index_bars, get_last_bar_times, get_day_opens, load_universes
+from market_state import market_state
+from index_engine import IndexEngine, to_db_row
+from bar_store import BarStore
+
+# Intraday bars
+BAR_INTERVAL = "1m"
+BAR_SECONDS = 60
+# Gap warning threshold - more than this since the last complete bar
+GAP_SECONDS = 5 * BAR_SECONDS
+# A symbol whose last bar is this much older than the newest bar in the batch is "stale"
+STALE_SECONDS = 15 * BAR_SECONDS
+
+BAR_FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+# Chunked parallel downloads. Chunk size adapts so one chunk takes about
+# CHUNK_TARGET_SECONDS - big enough to amortize request overhead, small
+# enough to keep all workers busy.
+DOWNLOAD_WORKERS = 4
+CHUNK_SIZE = 50
+CHUNK_MIN, CHUNK_MAX = 10, 200
+CHUNK_TARGET_SECONDS = 2.0
+
+# Result of extract_quotes. Per-symbol arrays are aligned with `symbols`
+# (NaN where the symbol had no valid bar). `bars` is the long format of all
+# valid bars: dict of equal-length arrays 'sym' (index into symbols), 'ts',
+# 'open', 'high', 'low', 'close', 'volume', 'change_pct'.
+QuoteBatch = namedtuple('QuoteBatch', [
+    'symbols', 'ts', 'open', 'high', 'low', 'close', 'volume',
+    'day_open', 'change_pct', 'bars', 'missing', 'stale'
+])
+
+def unique_tickers(companies):
+    """Tickers of company dicts without duplicates (same company in several universes)."""
+    return list(dict.fromkeys(c['ticker'] for c in companies))
+
+def split_chunks(symbols, chunk_size):
+    """Splits symbols into ceil(n / chunk_size) chunks of near-equal size."""
+    n = len(symbols)
+    if n == 0:
+        return []
+    count = -(-n // max(1, chunk_size))
+    size, extra = divmod(n, count)
+    chunks, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(symbols[start:end])
+        start = end
+    return chunks
+
+def session_start_ts(now=None):
+    """Epoch seconds of the start of the current trading day (local midnight)."""
+    now = now or datetime.datetime.now()
+    return int(datetime.datetime.combine(now.date(), datetime.time.min).timestamp())
+
+def _field_matrix(data, field, symbols):
+    """(time x symbol) float matrix of one field, columns ordered like `symbols`."""
+    if data.columns.nlevels > 1:
+        mat = data.xs(field, axis=1, level=1)
+    else:
+        # Single-symbol download comes back flat
+        mat = data[[field]].set_axis(symbols[:1], axis=1)
+    return mat.reindex(columns=symbols).to_numpy(dtype=float)
+
+def _index_to_epoch(index):
+    """Epoch seconds of a DatetimeIndex (tz-aware or naive UTC), independent of its unit."""
+    if not isinstance(index, pd.DatetimeIndex):
+        return np.asarray(index, dtype=np.int64)
+    if index.tz is not None:
+        index = index.tz_convert(None)
+    return np.asarray((index - pd.Timestamp(0)) // pd.Timedelta(seconds=1), dtype=np.int64)
+
+def extract_quotes(data, symbols, day_open=None):
+    """
+    Vectorized extraction from a yf.download frame (MultiIndex symbol/field).
+    Finds the last valid bar of every symbol at once and computes change %
+    against `day_open` (array aligned with symbols; NaN = use the first bar
+    of this batch). Returns a QuoteBatch.
+    """
+    symbols = list(symbols)
+    n = len(symbols)
+    if data is None or data.empty or n == 0:
+        empty = np.full(n, np.nan)
+        bars = {k: np.empty(0) for k in ('open', 'high', 'low', 'close', 'volume', 'change_pct')}
+        bars['sym'] = np.empty(0, dtype=np.intp)
+        bars['ts'] = np.empty(0, dtype=np.int64)
+        return QuoteBatch(symbols, empty, empty, empty, empty, empty, empty,
+                          empty if day_open is None else np.asarray(day_open, dtype=float),
+                          empty, bars, symbols, [])
+
+    o, h, l, c, v = (_field_matrix(data, f, symbols) for f in BAR_FIELDS)
+    ts = _index_to_epoch(data.index)
+
+    valid = ~np.isnan(c)
+    has_bar = valid.any(axis=0)
+    cols = np.arange(n)
+    t = len(ts)
+    last_idx = t - 1 - np.argmax(valid[::-1], axis=0)
+    first_idx = np.argmax(valid, axis=0)
+
+    def last_of(mat):
+        return np.where(has_bar, mat[last_idx, cols], np.nan)
+
+    if day_open is None:
+        day_open = np.full(n, np.nan)
+    day_open = np.asarray(day_open, dtype=float).copy()
+    need_open = np.isnan(day_open) & has_bar
+    day_open[need_open] = o[first_idx, cols][need_open]
+    safe_open = np.where(day_open > 0, day_open, np.nan)
+
+    last_ts = np.where(has_bar, ts[last_idx], np.nan)
+    close = last_of(c)
+    change_pct = np.nan_to_num((close - safe_open) / safe_open * 100.0, nan=0.0)
+
+    # Long format of all valid bars (time-major, so per symbol it stays sorted by ts)
+    t_i, s_i = np.nonzero(valid)
+    bar_change = np.nan_to_num((c[t_i, s_i] - safe_open[s_i]) / safe_open[s_i] * 100.0, nan=0.0)
+    bars = {
+        'sym': s_i,
+        'ts': ts[t_i],
+        'open': o[t_i, s_i],
+        'high': h[t_i, s_i],
+        'low': l[t_i, s_i],
+        'close': c[t_i, s_i],
+        'volume': np.nan_to_num(v[t_i, s_i]),
+        'change_pct': bar_change,
+    }
+
+    missing = [symbols[i] for i in np.flatnonzero(~has_bar)]
+    newest = np.nanmax(last_ts) if has_bar.any() else np.nan
+    stale = [symbols[i] for i in np.flatnonzero(has_bar & (last_ts < newest - STALE_SECONDS))]
+
+    return QuoteBatch(symbols, last_ts, last_of(o), last_of(h), last_of(l), close, last_of(v),
+                      day_open, change_pct, bars, missing, stale)
+
+class FreshnessTracker:
+    """
+    Per-ticker data freshness: when the last bar arrived and how many
+    downloads in a row brought nothing. Feeds the fast retry path and the
+    staleness flag shown in the dashboards.
+    """
+    def __init__(self):
+        self.last_ok = {}   # ticker -> provider time of the last successful download
+        self.failures = {}  # ticker -> consecutive downloads without a bar
+
+    def record(self, ok, failed, now):
+        for t in ok:
+            self.last_ok[t] = now
+            self.failures[t] = 0
+        for t in failed:
+            self.failures[t] = self.failures.get(t, 0) + 1
+
+    def retry_candidates(self, tickers, max_failures):
+        """Tickers that failed recently but haven't used up their fast retries."""
+        return [t for t in tickers if 0 < self.failures.get(t, 0) <= max_failures]
+
+    def is_stale(self, bar_ts, market_ts):
+        """Bar older than STALE_SECONDS relative to the newest bar of the whole universe."""
+        return not bar_ts or (market_ts is not None and bar_ts < market_ts - STALE_SECONDS)
+
 
 class MarketDataFetcher(threading.Thread):
-    def __init__(self, interval=30):
+    # Fast retry of failed/stale symbols between full cycles
+    RETRY_SECONDS = 5
+    MAX_FAST_RETRIES = 3
+
+    def __init__(self, interval=30, provider=None):
         super().__init__()
         self.interval = interval
+        # Source of bars: yfinance by default, replay/synthetic for offline runs
+        self.provider = provider or YFinanceProvider(BAR_INTERVAL)
         self.daemon = True # Ends when main program ends
         self.running = True
-        self.lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # Poll often during the session, back off on errors, sleep when GPW is closed
+        self.scheduler = PollingScheduler(session_interval=interval,
+                                          market_hours=getattr(self.provider, 'market_hours', True))
+        self.lock = threading.Lock()   # Guards chunk_size (tuned from the download pool threads)
+        # Working copy of all universes (indices) - loaded from DB once (cold start),
+        # then kept in memory and published to market_state every cycle.
+        # A company in several universes has one dict per universe (own share),
+        # but is downloaded and stored only once.
+        self.universes = {}         # universe -> list of company dicts
+        self.current_data = []      # all company dicts of all universes
+        self.ticker_map = None      # Yahoo symbol -> company dicts (built from current_data)
+        self.index_engines = {}     # universe -> IndexEngine (weighted return, sector contributions)
+        # Delta fetching state
+        self.session_start = None   # Start of the trading day the state belongs to
+        self.last_bar_ts = {}       # ticker -> ts of the newest stored bar
+        self.day_open = {}          # ticker -> session open (for change %)
+        self.fetched_until = None   # All bars up to this ts are stored
+        self.backfilled = set()     # Tickers with today's session already backfilled
+        self.freshness = FreshnessTracker()
+        self.bar_store = BarStore() # Columnar copy of the bars for long-history readers
+        self.chunk_size = CHUNK_SIZE
+        self.pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="Download")
 
     def run(self):
         print("[MarketDataFetcher] Wątek startuje...")
         while self.running:
+            started = time.monotonic()
             try:
-                self.update_market_data()
+                ok = self.update_market_data() is not False
             except Exception as e:
                 print(f"[MarketDataFetcher] Błąd: {e}")
-            
-            time.sleep(self.interval)
+                ok = False
+            duration = time.monotonic() - started
+            metrics.observe('fetch.cycle', duration)
+            metrics.incr('fetch.cycles_ok' if ok else 'fetch.cycles_failed')
+
+            delay = self.scheduler.next_delay(duration, ok, self.provider.now())
+            metrics.set_gauge('fetch.next_delay_seconds', delay)
+            if delay >= 60:
+                print(f"[MarketDataFetcher] Następne pobranie za {delay / 60:.0f} min "
+                      f"(faza: {self.scheduler.phase(self.provider.now())}, błędy z rzędu: {self.scheduler.failures}).")
+            if self._wait_and_retry(delay, retry=ok):
+                break
+
+    def _wait_and_retry(self, delay, retry=True):
+        """
+        Sleeps until the next full cycle. Meanwhile failed/stale symbols are
+        re-requested every RETRY_SECONDS. Returns True when stop() was called.
+        """
+        deadline = time.monotonic() + delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            pending = retry and self._retry_candidates()
+            # Event instead of sleep - stop() wakes the thread immediately
+            if self._stop_event.wait(min(remaining, self.RETRY_SECONDS) if pending else remaining):
+                return True
+            if pending and deadline - time.monotonic() > self.RETRY_SECONDS:
+                try:
+                    self.retry_failed()
+                except Exception as e:
+                    print(f"[MarketDataFetcher] Błąd ponowienia: {e}")
+
+    def _ticker_map(self):
+        """All universes grouped by Yahoo symbol (de-duplicated): "ABC.WA" -> list of company dicts."""
+        # Prepared once per universe load - cycles only read it
+        if self.ticker_map is None:
+            ticker_map = {}
+            for c in self.current_data:
+                ticker_map.setdefault(symbol_master.yahoo(c['ticker']), []).append(c)
+            self.ticker_map = ticker_map
+        return self.ticker_map
 
     def update_market_data(self):
-        # 1. Load current portfolio from DB (buffer)
-        # We need the tickers.
-        current_data = load_portfolio_from_db()
+        """One full fetch cycle. Returns False when the download failed."""
+        # 1. Current universes (in memory after the first cycle)
+        if not self.current_data:
+            self.load_universes()
+        current_data = self.current_data
         if not current_data:
             print("[MarketDataFetcher] Pusty portfel w bazie. Czekam...")
-            return
+            return True
 
-        print(f"[MarketDataFetcher] Pobieranie cen dla {len(current_data)} spółek...")
-        
         # 2. Prepare Tickers for YFinance
-        # Use simple map logic or the advanced ONE from fetch_gpw_debug if accessible, 
-        # but better to keep self-contained logic here for speed or reuse.
-        # We will reuse the mapping we defined in fetch_gpw_debug.py by importing it.
-        
-        yf_tickers = []
-        ticker_map = {} # "ABC.WA" -> list of company dicts
-
-        for c in current_data:
-            raw_ticker = c['ticker']
-            
-            if raw_ticker in TICKER_MAPPING:
-                base = TICKER_MAPPING[raw_ticker]
-            else:
-                base = raw_ticker
-            
-            yf_ticker = f"{base}.WA"
-            yf_tickers.append(yf_ticker)
-            
-            if yf_ticker not in ticker_map:
-                ticker_map[yf_ticker] = []
-            ticker_map[yf_ticker].append(c)
-
-        # 3. Batch Download
+        ticker_map = self._ticker_map()
+        print(f"[MarketDataFetcher] Pobieranie cen dla {len(ticker_map)} spółek "
+              f"({len(self.universes)} indeksów, {len(current_data)} pozycji)...")
+
+        # 3. Delta Download - only bars newer than what we already have
+        self._load_bar_state()
         try:
-            # interval='1d' is standard, maybe '1m' if user wants super live but '1d' gives correct Today Change % usually
-            # '1d' is safer for change from open.
-            data = yf.download(yf_tickers, period="1d", group_by='ticker', threads=True, progress=False)
-            
-            updated_count = 0
-            
-            for yf_tick, company_list in ticker_map.items():
-                price = 0.0
-                change_pct = 0.0
-                
-                try:
-                    if len(yf_tickers) > 1:
-                        df = data[yf_tick]
-                    else:
-                        df = data
-                        
-                    if not df.empty:
-                        last_row = df.iloc[-1]
-                        price = float(last_row['Close'])
-                        open_price = float(last_row['Open'])
-                        
-                        if open_price > 0:
-                            change_pct = ((price - open_price) / open_price) * 100.0
-                            updated_count += 1
-                except Exception:
-                    pass
-                
-                # Update in memory objects
-                for c in company_list:
-                    # Only update if we got a valid price, or keep old? 
-                    # If fetch fails, better keep old than 0. 
-                    if price > 0:
-                        c['price'] = price
-                        c['change_pct'] = change_pct
-            
-            # 4. Save back to DB
-            # We use save_portfolio_snapshot to dump the updated state
-            save_portfolio_snapshot(current_data)
-            print(f"[MarketDataFetcher] Zaktualizowano ceny dla {updated_count} spółek.")
-            
+            with metrics.timed('fetch.download'):
+                data = self._download_new_bars(ticker_map)
+        except Exception as e:
+            print(f"[MarketDataFetcher] Błąd pobierania ({self.provider.name}): {e}")
+            self.freshness.record((), unique_tickers(current_data), self.provider.now())
+            self._publish_freshness()
+            return False
+
+        updated_count, bars, batch = self._apply_bars(data, ticker_map, advance=True)
+        print(f"[MarketDataFetcher] Zaktualizowano ceny dla {updated_count} spółek ({len(bars)} barów, "
+              f"brak danych: {len(batch.missing)}, nieaktualne: {len({c['ticker'] for c in current_data if c['stale']})}).")
+        return True
+
+    def _retry_candidates(self):
+        # After MAX_FAST_RETRIES misses a ticker waits for full cycles (illiquid / suspended)
+        return self.freshness.retry_candidates(unique_tickers(self.current_data),
+                                               self.MAX_FAST_RETRIES)
+
+    def retry_failed(self):
+        """
+        Fast path between full cycles: re-requests only failed/stale symbols,
+        starting from their own last stored bar. Returns the number of updated tickers.
+        """
+        candidates = set(self._retry_candidates())
+        if not candidates or self.session_start is None:
+            return 0
+        ticker_map = {s: cs for s, cs in self._ticker_map().items()
+                      if any(c['ticker'] in candidates for c in cs)}
+        since = min((self.last_bar_ts.get(t) or self.session_start) for t in candidates)
+        since = max(since, self.session_start)
+        metrics.incr('fetch.retries')
+        try:
+            with metrics.timed('fetch.retry_download'):
+                data = self._download(list(ticker_map), since)
         except Exception as e:
-            print(f"[MarketDataFetcher] Błąd yfinance: {e}")
+            print(f"[MarketDataFetcher] Ponowienie nieudane ({len(ticker_map)} spółek): {e}")
+            self.freshness.record((), candidates, self.provider.now())
+            return 0
+        updated_count, bars, _ = self._apply_bars(data, ticker_map, advance=False)
+        print(f"[MarketDataFetcher] Ponowienie: {updated_count}/{len(ticker_map)} spółek uzupełnionych ({len(bars)} barów).")
+        return updated_count
+
+    def _apply_bars(self, data, ticker_map, advance):
+        """
+        Applies downloaded bars to the working copy, records freshness,
+        publishes and persists. `advance` moves the delta cursor (full cycles only -
+        a retry of a few lagging symbols must not skip bars of the others).
+        """
+        parse_t0 = time.perf_counter()
+        # 4. Vectorized extraction of all symbols at once
+        symbols = list(ticker_map)
+        day_open = np.array([self.day_open.get(ticker_map[s][0]['ticker'], np.nan) for s in symbols], dtype=float)
+        last_ts = np.array([self.last_bar_ts.get(ticker_map[s][0]['ticker']) or 0 for s in symbols], dtype=np.int64)
+        batch = extract_quotes(data, symbols, day_open)
+
+        # Bars not stored yet (the last stored one may still be forming - re-sent)
+        b = batch.bars
+        keep = b['ts'] >= last_ts[b['sym']]
+        bar_rows = zip(*(b[k][keep].tolist() for k in ('sym', 'ts', 'open', 'high', 'low', 'close', 'volume', 'change_pct')))
+        bars = []
+        tickers = [unique_tickers(ticker_map[s]) for s in symbols]
+        for s, ts, o, h, l, close, v, ch in bar_rows:
+            for t in tickers[s]:
+                bars.append((t, ts, o, h, l, close, v, ch))
+
+        # Update in memory objects - only symbols with a new bar, others keep the old price
+        updated = np.flatnonzero(~np.isnan(batch.close))
+        ok, failed = [], []
+        for i in updated.tolist():
+            row = {
+                'price': float(batch.close[i]),
+                'change_pct': float(batch.change_pct[i]),
+                'open': float(batch.open[i]),
+                'high': float(batch.high[i]),
+                'low': float(batch.low[i]),
+                'volume': float(np.nan_to_num(batch.volume[i])),
+                'ts': int(batch.ts[i]),
+            }
+            for c in ticker_map[symbols[i]]:
+                c.update(row)
+            for t in tickers[i]:
+                self.day_open[t] = float(batch.day_open[i])
+                self.last_bar_ts[t] = row['ts']
+                ok.append(t)
+        for i in np.flatnonzero(np.isnan(batch.close)).tolist():
+            failed.extend(tickers[i])
+        self.freshness.record(ok, failed, self.provider.now())
+        metrics.incr('fetch.symbols_ok', len(ok))
+        metrics.incr('fetch.symbols_failed', len(failed))
+        if ok or failed:
+            metrics.set_gauge('fetch.success_ratio', len(ok) / (len(ok) + len(failed)))
+
+        updated_count = len(updated)
+        if advance:
+            # The newest bar may still be forming - it will be re-fetched next cycle
+            newest_ts = max(self.fetched_until or 0, int(np.nanmax(batch.ts))) if updated_count else self.fetched_until
+            self.fetched_until = newest_ts
+
+        # Index level per bar - O(new bars), oldest first (backfilled minutes get their own level)
+        index_rows = self._update_index(bars)
+        metrics.observe('fetch.parse', time.perf_counter() - parse_t0)
+
+        # 5. Publish to the GUI first, then persist (append-only bar history)
+        with metrics.timed('fetch.publish'):
+            self._publish_freshness()
+        with metrics.timed('fetch.db_write'):
+            save_bars(bars)
+            save_index_bars(index_rows)
+        try:
+            self.bar_store.append(bars)
+        except OSError as e:
+            # SQLite already has the bars - the columnar copy is best effort
+            print(f"[MarketDataFetcher] Błąd zapisu bar_store: {e}")
+        metrics.incr('fetch.bars_written', len(bars))
+        return updated_count, bars, batch
+
+    def _update_index(self, bars):
+        """Feeds new bars to the index engines. Returns index_ticks rows - one per universe and bar ts."""
+        rows = []
+        for ts, group in itertools.groupby(sorted(bars, key=lambda b: b[1]), key=lambda b: b[1]):
+            touched = set()
+            for bar in group:
+                ticker, change_pct = bar[0], bar[7]
+                for name, engine in self.index_engines.items():
+                    if ticker in engine:
+                        engine.update(ticker, change_pct, ts)
+                        touched.add(name)
+            rows.extend(to_db_row(name, self.index_engines[name].level()) for name in sorted(touched))
+        return rows
+
+    def _publish_freshness(self):
+        """Stamps staleness info on the working copy and publishes it."""
+        market_ts = max(self.last_bar_ts.values(), default=None)
+        for c in self.current_data:
+            t = c['ticker']
+            c['stale'] = self.freshness.is_stale(self.last_bar_ts.get(t), market_ts)
+            c['fail_count'] = self.freshness.failures.get(t, 0)
+            c['last_update'] = self.freshness.last_ok.get(t)
+        metrics.set_gauge('fetch.stale_tickers', len({c['ticker'] for c in self.current_data if c['stale']}))
+        levels = {name: engine.level() for name, engine in self.index_engines.items()}
+        market_state.publish_universes(self.universes, index_levels=levels)
+
+    def load_universes(self, universes=None):
+        """
+        (Re)loads all universes into the working copy - from DB, or from
+        `universes` already loaded at startup (rows are copied, not shared).
+        """
+        if universes is None:
+            universes = load_universes()
+        self.universes = {name: [dict(r) for r in rows] for name, rows in universes.items()}
+        self.index_engines = {name: IndexEngine(rows) for name, rows in self.universes.items()}
+        self.current_data = [c for rows in self.universes.values() for c in rows]
+        self.ticker_map = None
+        return self.universes
+
+    def _load_bar_state(self):
+        """On the first cycle of a trading day: restore per-ticker bar state from DB."""
+        start = session_start_ts(datetime.datetime.fromtimestamp(self.provider.now()))
+        if self.session_start == start:
+            return
+        self.session_start = start
+        self.backfilled = set()
+        tickers = {c['ticker'] for c in self.current_data}
+        # Bars stamped after "now" (e.g. by a fast-forwarded offline clock) must not
+        # move the delta cursor into the future
+        self.last_bar_ts = get_last_bar_times(tickers, until_ts=self.provider.now())
+        self.day_open = get_day_opens(tickers, start)
+        today = {t: ts for t, ts in self.last_bar_ts.items() if ts >= start}
+        # Spółki z dzisiejszymi barami w bazie (restart w trakcie dnia) nie wymagają
+        # pełnego backfillu - wystarczy dociągnąć od ostatniego zapisanego baru
+        self.backfilled.update(today)
+        self.fetched_until = max(today.values()) if today else None
+
+    def _download_new_bars(self, ticker_map):
+        """
+        Downloads 1-minute bars: a delta since `fetched_until` for tickers we
+        already track today, and a full-session backfill for new tickers
+        (first cycle of the day, restart, newly added companies).
+        Returns one yf.download-shaped frame (MultiIndex symbol/field) or None.
+        """
+        delta, backfill = [], []
+        for yf_tick, company_list in ticker_map.items():
+            if all(c['ticker'] in self.backfilled for c in company_list):
+                delta.append(yf_tick)
+            else:
+                backfill.append(yf_tick)
+
+        frames = []
+        if delta:
+            since = self.fetched_until or self.session_start
+            gap = self.provider.now() - since
+            if gap > GAP_SECONDS:
+                # Gap detection: przerwa w pobieraniu (restart, brak sieci) - start od
+                # ostatniego kompletnego baru wypełnia lukę w tym samym zapytaniu
+                print(f"[MarketDataFetcher] Luka w danych ({int(gap)} s) - dociągam brakujące bary...")
+            frames.append(self._download(delta, since))
+        if backfill:
+            print(f"[MarketDataFetcher] Backfill sesji dla {len(backfill)} spółek...")
+            frames.append(self._download(backfill, self.session_start))
+            for yf_tick in backfill:
+                self.backfilled.update(c['ticker'] for c in ticker_map[yf_tick])
+        frames = [f for f in frames if f is not None and not f.empty]
+        if not frames:
+            return None
+        # Delta and backfill cover disjoint symbols - align them on one time index
+        return frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+
+    def _download(self, symbols, since_ts):
+        """
+        Downloads symbols in near-equal chunks on the worker pool and joins
+        the frames. A failed chunk only makes its symbols missing (they go to
+        the fast retry path); the call raises only when every chunk failed.
+        """
+        chunks = split_chunks(list(symbols), self.chunk_size)
+        if len(chunks) <= 1:
+            return self._download_chunk(symbols, since_ts)
+
+        futures = [self.pool.submit(self._download_chunk, chunk, since_ts) for chunk in chunks]
+        frames, errors = [], []
+        for chunk, future in zip(chunks, futures):
+            try:
+                frames.append(future.result())
+            except Exception as e:
+                metrics.incr('fetch.chunk_errors')
+                print(f"[MarketDataFetcher] Błąd paczki ({len(chunk)} spółek): {e}")
+                errors.append(e)
+        if len(errors) == len(chunks):
+            raise errors[0]
+        frames = [f for f in frames if f is not None and not f.empty]
+        if not frames:
+            return None
+        return frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+
+    def _download_chunk(self, symbols, since_ts):
+        t0 = time.perf_counter()
+        frame = self.provider.download(symbols, since_ts)
+        elapsed = time.perf_counter() - t0
+        metrics.observe('fetch.chunk', elapsed)
+        # Tune the chunk size (tiny chunks say little about throughput)
+        if len(symbols) >= CHUNK_MIN and elapsed > 0:
+            ideal = CHUNK_TARGET_SECONDS * len(symbols) / elapsed
+            # Chunks finish on several pool threads - read-modify-write under the lock
+            with self.lock:
+                self.chunk_size = int(min(CHUNK_MAX, max(CHUNK_MIN, 0.7 * self.chunk_size + 0.3 * ideal)))
+                chunk_size = self.chunk_size
+            metrics.set_gauge('fetch.chunk_size', chunk_size)
+        return frame
 
     def stop(self):
         self.running = False
+        self._stop_event.set()
+        self.pool.shutdown(wait=False)
+        self.bar_store.close()
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from database import load_portfolio_from_db, DEFAULT_UNIVERSE
+from index_engine import IndexEngine
+from portfolio import portfolio_from_rows, EMPTY_PORTFOLIO
+
+# Immutable view of the market at one point in time for the selected universe.
+# rows: tuple of read-only dicts {'ticker', 'share', 'sector', 'price', 'change_pct', ...}
+# index: IndexLevel of the universe (weighted return + sector contributions) or None
+# portfolio: PortfolioSnapshot of the rows (columns + precomputed orders) for the views
+MarketSnapshot = namedtuple('MarketSnapshot', ['version', 'rows', 'published_at', 'universe', 'index', 'portfolio'],
+                            defaults=(DEFAULT_UNIVERSE, None, EMPTY_PORTFOLIO))
+
+EMPTY_SNAPSHOT = MarketSnapshot(0, (), None)
+
+
+def _freeze(rows):
+    return tuple(MappingProxyType(dict(r)) for r in rows)
+
+
+class MarketState:
+    """
+    Thread-safe in-process store of the current market data.
+    MarketDataFetcher publishes all universes (indices), GUI views read
+    snapshots of the selected one. Every publish or universe switch bumps
+    a monotonically increasing version, so views can tell whether anything
+    changed since their last render. Listeners are told about each new
+    version (GUI wake-up instead of polling).
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._snapshot = EMPTY_SNAPSHOT
+        self._universes = {}                # universe -> frozen rows
+        self._index = {}                    # universe -> IndexLevel
+        self._portfolios = {}               # universe -> PortfolioSnapshot
+        self._selected = DEFAULT_UNIVERSE
+        self._listeners = []
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def universe(self):
+        return self._selected
+
+    def snapshot(self):
+        """Returns the current MarketSnapshot (never mutated afterwards)."""
+        # Reading a single attribute is atomic - no lock needed for readers
+        return self._snapshot
+
+    def add_listener(self, callback):
+        """callback(snapshot) is called after every new version, on the publishing thread - keep it cheap."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _bump(self):
+        # Caller holds the condition
+        rows = self._universes.get(self._selected, ())
+        self._snapshot = MarketSnapshot(self._snapshot.version + 1, rows, time.time(), self._selected,
+                                        self._index.get(self._selected),
+                                        self._portfolios.get(self._selected, EMPTY_PORTFOLIO))
+        self._cond.notify_all()
+        return self._snapshot
+
+    def _notify(self, snap):
+        # Outside the lock - listeners may read the state
+        for callback in list(self._listeners):
+            try:
+                callback(snap)
+            except Exception as e:
+                print(f"[MarketState] Listener error: {e}")
+        return snap
+
+    def publish(self, rows, universe=None):
+        """Stores a frozen copy of one universe's rows (selected if None) and returns the snapshot."""
+        return self.publish_universes({universe or self._selected: rows})
+
+    def publish_universes(self, by_universe, index_levels=None):
+        """
+        Stores frozen copies of several universes at once: {universe: rows}.
+        index_levels: {universe: IndexLevel}; computed from the rows when not given.
+        """
+        frozen = {name: _freeze(rows) for name, rows in by_universe.items()}
+        if index_levels is None:
+            index_levels = {name: IndexEngine(rows).level() for name, rows in frozen.items()}
+        # Built once per publish, shared by all views
+        portfolios = {name: portfolio_from_rows(rows) for name, rows in frozen.items()}
+        with self._cond:
+            self._universes.update(frozen)
+            self._index.update(index_levels)
+            self._portfolios.update(portfolios)
+            snap = self._bump()
+        return self._notify(snap)
+
+    def select_universe(self, universe):
+        """Switches the universe seen by snapshot() - no restart, no refetch."""
+        if universe not in self._universes:
+            # Not published by the fetcher yet - cold start from SQLite
+            rows = load_portfolio_from_db(universe)
+            level = IndexEngine(rows).level()
+            portfolio = portfolio_from_rows(rows)
+            with self._cond:
+                if universe not in self._universes:
+                    self._universes[universe] = _freeze(rows)
+                    self._index[universe] = level
+                    self._portfolios[universe] = portfolio
+        with self._cond:
+            self._selected = universe
+            snap = self._bump()
+        return self._notify(snap)
+
+    def wait_for_version(self, version, timeout=None):
+        """Blocks until a snapshot newer than `version` is published."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._snapshot.version > version, timeout)
+            return self._snapshot
+
+    def load_from_db(self):
+        """Cold start: publishes the persisted selected universe if nothing was published yet."""
+        if self._snapshot.version == 0:
+            universe = self._selected
+            data = load_portfolio_from_db(universe)
+            if data:
+                snap = None
+                with self._cond:
+                    # Fetcher may have published in the meantime - it wins
+                    if self._snapshot.version == 0:
+                        self._universes.setdefault(universe, tuple(MappingProxyType(r) for r in data))
+                        self._index.setdefault(universe, IndexEngine(data).level())
+                        self._portfolios.setdefault(universe, portfolio_from_rows(data))
+                        snap = self._bump()
+                if snap is not None:
+                    self._notify(snap)
+        return self._snapshot
+
+
+# Shared instance used by the fetcher and the GUI
+market_state = MarketState()
+
+def get_market_snapshot():
+    """Returns the latest snapshot, loading it from SQLite on cold start."""
+    snap = market_state.snapshot()
+    if snap.version == 0:
+        snap = market_state.load_from_db()
+    return snap
@@ -0,0 +1,172 @@
+"""
+In-process metrics: rolling buffers of timings/values, counters and gauges.
+Shown in the Diagnostics tab and optionally exported as a Prometheus text file.
+
+    from metrics import metrics
+    with metrics.timed('fetch.download'):
+        ...
+    metrics.incr('fetch.cycles_ok')
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+
+BUFFER_SIZE = 512           # Samples kept per metric
+PROMETHEUS_PREFIX = "wig_scalper_"
+
+
+class RollingStat:
+    """Last BUFFER_SIZE samples of one metric plus lifetime count/sum."""
+    def __init__(self, maxlen=BUFFER_SIZE):
+        self.samples = deque(maxlen=maxlen)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        if not self.samples:
+            return {'count': self.count, 'sum': self.total}
+        ordered = sorted(self.samples)
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'last': float(self.samples[-1]),
+            'mean': sum(ordered) / len(ordered),
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'max': float(ordered[-1]),
+        }
+
+
+def percentile(ordered, q):
+    """q-th percentile of a sorted list, linear interpolation (same as numpy's default)."""
+    pos = (len(ordered) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return float(ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo))
+
+
+class _Timer(ContextDecorator):
+    """Context manager / decorator recording elapsed seconds into a metric."""
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def _recreate_cm(self):
+        # Decorated functions run concurrently - fresh timer per call
+        return _Timer(self.registry, self.name)
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._t0
+        self.registry.observe(self.name, self.elapsed)
+        if exc_type is not None:
+            self.registry.incr(self.name + '.errors')
+        return False
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store for three kinds of metrics:
+    - timings/observations (rolling buffer -> p50/p95/max), seconds for timings,
+    - counters (monotonic totals),
+    - gauges (last value).
+    """
+    def __init__(self, maxlen=BUFFER_SIZE):
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._counters = {}
+        self._gauges = {}
+        self.started_at = time.time()
+
+    def observe(self, name, value):
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = RollingStat(self.maxlen)
+            stat.add(value)
+
+    def timed(self, name):
+        return _Timer(self, name)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        """{'stats': {name: summary}, 'counters': {...}, 'gauges': {...}}"""
+        with self._lock:
+            stats = {name: s.summary() for name, s in self._stats.items()}
+            return {'stats': stats, 'counters': dict(self._counters), 'gauges': dict(self._gauges)}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (summaries, counters, gauges)."""
+        snap = self.snapshot()
+        lines = []
+        for name, s in sorted(snap['stats'].items()):
+            metric = _prom_name(name)
+            lines.append(f"# TYPE {metric} summary")
+            for q in ('p50', 'p95'):
+                if q in s:
+                    lines.append(f'{metric}{{quantile="0.{q[1:]}"}} {s[q]:.6g}')
+            lines.append(f"{metric}_sum {s['sum']:.6g}")
+            lines.append(f"{metric}_count {s['count']}")
+        for name, value in sorted(snap['counters'].items()):
+            metric = _prom_name(name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in sorted(snap['gauges'].items()):
+            metric = _prom_name(name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Atomic write, so node_exporter's textfile collector never reads half a file."""
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+def _prom_name(name):
+    return PROMETHEUS_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+# Shared registry for the whole application
+metrics = MetricsRegistry()
+
+
+def start_prometheus_writer(path, interval=15.0):
+    """Daemon thread rewriting the Prometheus text file every `interval` seconds."""
+    def loop():
+        while True:
+            try:
+                metrics.write_prometheus(path)
+            except OSError as e:
+                print(f"[Metrics] Nie można zapisać {path}: {e}")
+            time.sleep(interval)
+    thread = threading.Thread(target=loop, daemon=True, name="PrometheusWriter")
+    thread.start()
+    return thread
@@ -0,0 +1,82 @@
+"""
+Immutable column-oriented view of one universe (index) for the GUI views.
+Built once per market_state version from the published rows - tables,
+donuts, the heatmap and the console dump read the same arrays and the
+precomputed orders instead of re-sorting and re-grouping lists of dicts.
+
+    p = snapshot.portfolio
+    for i in p.by_share:                        # largest share first
+        p.tickers[i], p.share[i], p.change_pct[i]
+    for k, name in enumerate(p.sectors):        # sectors by name
+        rows = sector_rows(p, k)                # members, largest share first
+
+Numeric columns are read-only memoryviews over stdlib arrays: numpy wraps
+them without a copy (np.frombuffer(p.change_pct)), but isn't imported here
+(cold start stays light).
+"""
+from array import array
+from collections import namedtuple
+
+from index_engine import UNKNOWN_SECTOR
+
+# Columns (one entry per company, order of the source rows):
+#   tickers: tuple of str; sector_code: index into sectors (sorted names)
+#   share, price, change_pct: float; stale: 1 if the price isn't fresh
+# Orders (row indexes):
+#   by_share: share descending
+#   by_sector: sector name, then share descending; sector k is
+#     by_sector[sector_offsets[k]:sector_offsets[k + 1]]
+#   sector_share: total share of sector k
+PortfolioSnapshot = namedtuple('PortfolioSnapshot', [
+    'tickers', 'sectors', 'sector_code', 'share', 'price', 'change_pct', 'stale',
+    'by_share', 'by_sector', 'sector_offsets', 'sector_share',
+])
+
+
+def _column(typecode, values):
+    return memoryview(array(typecode, values)).toreadonly()
+
+
+def portfolio_from_rows(rows):
+    """Builds a PortfolioSnapshot from company dicts {'ticker', 'sector', 'share', 'price', 'change_pct', 'stale'}."""
+    tickers = tuple(r['ticker'] for r in rows)
+    sector_names = [r.get('sector') or UNKNOWN_SECTOR for r in rows]
+    sectors = tuple(sorted(set(sector_names)))
+    code = {name: k for k, name in enumerate(sectors)}
+    sector_code = [code[name] for name in sector_names]
+    share = [float(r.get('share') or 0.0) for r in rows]
+
+    # Stable sorts - ties keep the source order (same as sorting the dicts)
+    n = len(tickers)
+    by_share = sorted(range(n), key=lambda i: -share[i])
+    by_sector = sorted(range(n), key=lambda i: (sector_code[i], -share[i]))
+    offsets = [0] * (len(sectors) + 1)
+    totals = [0.0] * len(sectors)
+    for i in range(n):
+        offsets[sector_code[i] + 1] += 1
+        totals[sector_code[i]] += share[i]
+    for k in range(len(sectors)):
+        offsets[k + 1] += offsets[k]
+
+    return PortfolioSnapshot(
+        tickers, sectors, _column('i', sector_code),
+        _column('d', share),
+        _column('d', (float(r.get('price') or 0.0) for r in rows)),
+        _column('d', (float(r.get('change_pct') or 0.0) for r in rows)),
+        _column('b', (1 if r.get('stale') else 0 for r in rows)),
+        _column('i', by_share), _column('i', by_sector),
+        _column('i', offsets), _column('d', totals),
+    )
+
+
+EMPTY_PORTFOLIO = portfolio_from_rows(())
+
+
+def sector_rows(portfolio, k):
+    """Row indexes of sector k, largest share first (a view - no copy)."""
+    return portfolio.by_sector[portfolio.sector_offsets[k]:portfolio.sector_offsets[k + 1]]
+
+
+def sectors_by_share(portfolio):
+    """Sector codes, largest total share first."""
+    return sorted(range(len(portfolio.sectors)), key=lambda k: -portfolio.sector_share[k])
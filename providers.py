@@ -0,0 +1,210 @@
+import datetime
+import os
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Every provider returns frames shaped like yf.download(..., group_by='ticker'):
+# UTC DatetimeIndex of 1-minute bars, MultiIndex columns (symbol, field).
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+BAR_SECONDS = 60
+
+
+def bars_to_frame(df, symbols):
+    """
+    Long format (symbol, ts, open, high, low, close, volume) -> yf.download shape.
+    Symbols without rows get all-NaN columns, like yfinance does.
+    """
+    if df.empty:
+        return None
+    wide = df.pivot_table(index='ts', columns='symbol',
+                          values=['open', 'high', 'low', 'close', 'volume'], aggfunc='last')
+    wide = wide.swaplevel(0, 1, axis=1)
+    wide.columns = pd.MultiIndex.from_tuples([(s, f.capitalize()) for s, f in wide.columns])
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([list(symbols), FIELDS]))
+    wide.index = pd.to_datetime(wide.index, unit='s', utc=True)
+    return wide
+
+
+class MarketDataProvider:
+    """
+    Source of intraday bars for MarketDataFetcher.
+    download(symbols, since_ts) returns all 1-minute bars with ts >= since_ts
+    (yf.download shape) or None. now() is the provider clock - replay and
+    synthetic providers run on virtual time. market_hours tells the
+    scheduler whether to follow the GPW session calendar.
+    """
+    name = "base"
+    market_hours = True
+
+    def download(self, symbols, since_ts):
+        raise NotImplementedError
+
+    def now(self):
+        return time.time()
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Live data from Yahoo Finance."""
+    name = "yfinance"
+
+    def __init__(self, interval="1m"):
+        self.interval = interval
+
+    def download(self, symbols, since_ts):
+        import yfinance as yf # Heavy import - only when this provider is actually used
+        start = pd.Timestamp(since_ts, unit='s', tz='UTC').to_pydatetime()
+        return yf.download(symbols, start=start, interval=self.interval,
+                           group_by='ticker', threads=True, progress=False)
+
+
+class _VirtualClock:
+    """Clock starting at start_ts and running `speed` times faster than real time."""
+    def __init__(self, start_ts, speed=1.0):
+        self.start_ts = start_ts
+        self.speed = speed
+        self.t0 = time.monotonic()
+
+    def now(self):
+        return self.start_ts + (time.monotonic() - self.t0) * self.speed
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Streams recorded bars from a CSV or Parquet file at 1x or accelerated speed.
+    Expected columns: symbol (Yahoo symbol, e.g. "CDR.WA"; `ticker` also
+    accepted), ts (epoch seconds or datetime), open, high, low, close, volume.
+    Bars become visible when the virtual clock passes their timestamp.
+    """
+    name = "replay"
+    market_hours = False # Recording plays whenever it's started
+
+    def __init__(self, path, speed=1.0, loop=False):
+        if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path)
+        df.columns = [c.lower() for c in df.columns]
+        if 'symbol' not in df.columns:
+            df = df.rename(columns={'ticker': 'symbol'})
+        if not pd.api.types.is_numeric_dtype(df['ts']):
+            # Unit-independent (pandas may parse to s/ms/us/ns resolution)
+            dt = pd.to_datetime(df['ts'], utc=True)
+            df['ts'] = (dt - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+        if 'volume' not in df.columns:
+            df['volume'] = 0.0
+        self.bars = df.sort_values('ts').reset_index(drop=True)
+        self.first_ts = int(self.bars['ts'].iloc[0])
+        self.last_ts = int(self.bars['ts'].iloc[-1])
+        self.loop = loop
+        self.clock = _VirtualClock(self.first_ts, speed)
+        self._ts = self.bars['ts'].to_numpy()
+
+    def symbols(self):
+        return sorted(self.bars['symbol'].unique())
+
+    def now(self):
+        now = self.clock.now()
+        if self.loop and now > self.last_ts:
+            # Start the recording again from the beginning
+            self.clock = _VirtualClock(self.first_ts, self.clock.speed)
+            now = self.first_ts
+        return now
+
+    def download(self, symbols, since_ts):
+        # ts is sorted - binary search instead of scanning the whole recording
+        lo = np.searchsorted(self._ts, since_ts, side='left')
+        hi = np.searchsorted(self._ts, self.now(), side='right')
+        window = self.bars.iloc[lo:hi]
+        window = window[window['symbol'].isin(symbols)]
+        return bars_to_frame(window, symbols)
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Deterministic geometric random walk for any requested symbol.
+    The path of a symbol depends only on (seed, symbol), so runs are
+    reproducible and every symbol is available without network access.
+    """
+    name = "synthetic"
+    market_hours = False
+
+    def __init__(self, seed=42, speed=1.0, volatility=0.0015, start_ts=None):
+        self.seed = seed
+        self.volatility = volatility
+        # Default: today's 09:00 local time, so the whole session is replayed
+        if start_ts is None:
+            start_ts = int(datetime.datetime.combine(datetime.date.today(), datetime.time(9)).timestamp())
+        self.origin = start_ts - start_ts % BAR_SECONDS
+        self.clock = _VirtualClock(self.origin, speed)
+        self._paths = {} # symbol -> cumulative log-returns per minute
+
+    def now(self):
+        return self.clock.now()
+
+    def _path(self, symbol, minutes):
+        path = self._paths.get(symbol)
+        if path is None or len(path) < minutes:
+            rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode())])
+            # Extend in big chunks so the path is generated rarely
+            size = max(minutes, 2 * len(path) if path is not None else 512)
+            steps = rng.normal(0.0, self.volatility, size)
+            path = np.cumsum(steps)
+            self._paths[symbol] = path
+        return path
+
+    def _base_price(self, symbol):
+        return 5.0 + (zlib.crc32(symbol.encode()) ^ self.seed) % 20000 / 100.0
+
+    def download(self, symbols, since_ts):
+        end_min = int((self.now() - self.origin) // BAR_SECONDS)
+        start_min = max(0, int((since_ts - self.origin) // BAR_SECONDS))
+        if end_min < start_min or not symbols:
+            return None
+
+        minutes = np.arange(start_min, end_min + 1)
+        index = pd.to_datetime(self.origin + minutes * BAR_SECONDS, unit='s', utc=True)
+        columns = {}
+        for symbol in symbols:
+            base = self._base_price(symbol)
+            path = self._path(symbol, end_min + 2)
+            close = base * np.exp(path[minutes + 1])
+            open_ = base * np.exp(path[minutes])
+            spread = np.abs(close - open_) * 0.5
+            columns[(symbol, 'Open')] = open_
+            columns[(symbol, 'High')] = np.maximum(open_, close) + spread
+            columns[(symbol, 'Low')] = np.minimum(open_, close) - spread
+            columns[(symbol, 'Close')] = close
+            columns[(symbol, 'Volume')] = np.full(len(minutes), 1000.0)
+        return pd.DataFrame(columns, index=index)
+
+
+def synthetic_portfolio(n_tickers, seed=42):
+    """
+    Portfolio of N synthetic companies {'ticker', 'share', 'sector'} with
+    shares summing to 100 - for load tests together with SyntheticProvider.
+    """
+    rng = np.random.default_rng(seed)
+    weights = rng.pareto(1.5, n_tickers) + 0.05
+    weights = weights / weights.sum() * 100.0
+    sectors = ['Banki', 'IT', 'Gaming', 'Budownictwo', 'Medycyna', 'Energetyka',
+               'Przemysł', 'Handel', 'Nieruchomości', 'Spożywczy', 'Chemia', 'Media']
+    return [
+        {'ticker': f"SYN{i:04d}", 'share': float(w), 'sector': sectors[i % len(sectors)]}
+        for i, w in enumerate(weights)
+    ]
+
+
+def make_provider(name="yfinance", path=None, speed=1.0):
+    """Builds a provider from CLI-style options: yfinance | replay | synthetic."""
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "replay":
+        if not path:
+            raise ValueError("Replay provider needs a CSV/Parquet file (--replay-file)")
+        return ReplayProvider(path, speed=speed)
+    if name == "synthetic":
+        return SyntheticProvider(speed=speed)
+    raise ValueError(f"Unknown provider: {name}")
@@ -0,0 +1,168 @@
+"""
+Off-main-thread chart rendering. Each chart owns a RenderWorker: a single
+render thread with its own Agg Figure that turns a market snapshot into a
+ready RGBA image. The Tk side (ChartImage) only pastes finished images, so
+squarify, artist updates and canvas.draw() never run inside the Tk loop.
+Charts of different tabs render in parallel on their own threads.
+"""
+import queue
+import threading
+import time
+import tkinter as tk
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image, ImageTk
+
+from metrics import metrics
+
+# RGBA pixels (bytes, row-major) of one rendered frame
+RenderedImage = namedtuple('RenderedImage', ['width', 'height', 'rgba', 'version'])
+
+
+class RenderWorker:
+    """
+    Renders one chart on a dedicated thread.
+    `setup()` runs on that thread and returns (figure, draw); draw(job)
+    updates the artists and returns False when nothing changed, True when
+    the figure must be drawn, or a finished PIL image (composed frames).
+    A job is usually a MarketSnapshot; anything with a `version` works.
+    Requests are coalesced - while a frame is being drawn only the newest
+    request is kept, so a slow render never builds up a backlog.
+    """
+    def __init__(self, name, setup):
+        self.name = name
+        self.setup = setup
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"render-{name}")
+        self._lock = threading.Lock()
+        self._pending = None    # (snapshot, size, callback) - newest request only
+        self._busy = False
+        self._fig = None
+        self._draw = None
+
+    @property
+    def busy(self):
+        return self._busy
+
+    def request(self, snapshot, size, callback):
+        """Queues a render of `snapshot` at size (w, h) px; callback(image) runs on the render thread."""
+        with self._lock:
+            self._pending = (snapshot, size, callback)
+            if self._busy:
+                return
+            self._busy = True
+        self._pool.submit(self._run)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                job, self._pending = self._pending, None
+                if job is None:
+                    self._busy = False
+                    return
+            snapshot, size, callback = job
+            try:
+                with metrics.timed(f'render.{self.name}'):
+                    image = self.render(snapshot, size)
+            except Exception as e:
+                print(f"[Render] {self.name}: {e}")
+                continue
+            if image is not None:
+                callback(image)
+
+    def render(self, snapshot, size):
+        """Draws `snapshot` at (w, h) px. Returns a RenderedImage, or None when the shown frame is still current."""
+        if self._fig is None:
+            self._fig, self._draw = self.setup()
+            FigureCanvasAgg(self._fig)
+
+        dpi = self._fig.get_dpi()
+        width, height = size
+        resized = (width, height) != self._fig.canvas.get_width_height()
+        if resized:
+            self._fig.set_size_inches(width / dpi, height / dpi, forward=False)
+        changed = self._draw(snapshot)
+        if isinstance(changed, Image.Image):
+            return RenderedImage(changed.width, changed.height, changed.tobytes(), snapshot.version)
+        if not (changed or resized):
+            return None
+
+        canvas = self._fig.canvas
+        canvas.draw()
+        width, height = canvas.get_width_height()
+        # Copy - the Agg buffer is overwritten by the next draw
+        return RenderedImage(width, height, bytes(canvas.buffer_rgba()), snapshot.version)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ChartImage(tk.Canvas):
+    """
+    Tk widget showing images produced by a RenderWorker.
+    Finished frames are handed over through a queue and picked up by a short
+    after() poll that runs only while a render is in flight.
+    """
+    POLL_MS = 15
+    RESIZE_MS = 150 # Re-render after the widget stopped resizing
+
+    def __init__(self, parent, worker, width, height, bg):
+        super().__init__(parent, width=width, height=height, bg=bg, highlightthickness=0, bd=0)
+        self.worker = worker
+        self._ready = queue.SimpleQueue()
+        self._photo = None
+        self._item = self.create_image(0, 0, anchor=tk.NW)
+        self._snapshot = None
+        self._requested_at = None
+        self._polling = False
+        self._resize_job = None
+        self.bind('<Configure>', self._on_configure)
+
+    def render(self, snapshot):
+        """Requests a frame for `snapshot` (returns at once)."""
+        self._snapshot = snapshot
+        width, height = self.winfo_width(), self.winfo_height()
+        if width < 2 or height < 2:
+            return # Not laid out yet - <Configure> renders it
+        self._requested_at = time.perf_counter()
+        self.worker.request(snapshot, (width, height), self._ready.put)
+        if not self._polling:
+            self._polling = True
+            self.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        image = None
+        while True:
+            try:
+                image = self._ready.get_nowait() # Keep only the newest frame
+            except queue.Empty:
+                break
+        if image is not None:
+            self._show(image)
+        if self.worker.busy or not self._ready.empty():
+            self.after(self.POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def _show(self, image):
+        t0 = time.perf_counter()
+        frame = Image.frombuffer('RGBA', (image.width, image.height), image.rgba, 'raw', 'RGBA', 0, 1)
+        if self._photo is not None and (self._photo.width(), self._photo.height()) == (image.width, image.height):
+            self._photo.paste(frame)
+        else:
+            self._photo = ImageTk.PhotoImage(frame)
+            self.itemconfigure(self._item, image=self._photo)
+        metrics.observe(f'gui.blit.{self.worker.name}', time.perf_counter() - t0)
+        if self._requested_at is not None:
+            metrics.observe(f'gui.render_latency.{self.worker.name}', time.perf_counter() - self._requested_at)
+
+    def _on_configure(self, event):
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(self.RESIZE_MS, self._on_resized)
+
+    def _on_resized(self):
+        self._resize_job = None
+        if self._snapshot is not None:
+            self.render(self._snapshot)
@@ -0,0 +1,150 @@
+"""
+GPW session calendar and the adaptive polling scheduler used by MarketDataFetcher.
+"""
+import datetime
+import random
+from zoneinfo import ZoneInfo
+
+WARSAW = ZoneInfo("Europe/Warsaw")
+
+# GPW Main Market session (equities, continuous trading system)
+PRE_OPEN = datetime.time(8, 30)         # Faza przed otwarciem
+OPEN = datetime.time(9, 0)              # Otwarcie -> notowania ciągłe
+CLOSING_AUCTION = datetime.time(16, 50) # Faza przed zamknięciem
+CLOSE = datetime.time(17, 0)            # Zamknięcie (fixing)
+POST_CLOSE_END = datetime.time(17, 5)   # Dogrywka
+
+PHASE_CLOSED = "closed"
+PHASE_PRE_OPEN = "pre_open"
+PHASE_CONTINUOUS = "continuous"
+PHASE_CLOSING_AUCTION = "closing_auction"
+PHASE_POST_CLOSE = "post_close"
+
+
+def easter_sunday(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+_holiday_cache = {}
+
+def gpw_holidays(year):
+    """Days without a session on GPW in a given year."""
+    if year not in _holiday_cache:
+        easter = easter_sunday(year)
+        _holiday_cache[year] = {
+            datetime.date(year, 1, 1),              # Nowy Rok
+            datetime.date(year, 1, 6),              # Trzech Króli
+            easter - datetime.timedelta(days=2),    # Wielki Piątek
+            easter + datetime.timedelta(days=1),    # Poniedziałek Wielkanocny
+            datetime.date(year, 5, 1),              # Święto Pracy
+            datetime.date(year, 5, 3),              # Święto Konstytucji 3 Maja
+            easter + datetime.timedelta(days=60),   # Boże Ciało
+            datetime.date(year, 8, 15),             # Wniebowzięcie NMP
+            datetime.date(year, 11, 1),             # Wszystkich Świętych
+            datetime.date(year, 11, 11),            # Święto Niepodległości
+            datetime.date(year, 12, 24),            # Wigilia
+            datetime.date(year, 12, 25),
+            datetime.date(year, 12, 26),
+            datetime.date(year, 12, 31),            # Sylwester
+        }
+    return _holiday_cache[year]
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in gpw_holidays(day.year)
+
+def to_warsaw(ts):
+    """Epoch seconds -> aware datetime in Warsaw time."""
+    return datetime.datetime.fromtimestamp(ts, tz=WARSAW)
+
+def session_phase(dt):
+    """Session phase for an aware datetime."""
+    dt = dt.astimezone(WARSAW)
+    if not is_trading_day(dt.date()):
+        return PHASE_CLOSED
+    t = dt.time()
+    if PRE_OPEN <= t < OPEN:
+        return PHASE_PRE_OPEN
+    if OPEN <= t < CLOSING_AUCTION:
+        return PHASE_CONTINUOUS
+    if CLOSING_AUCTION <= t < CLOSE:
+        return PHASE_CLOSING_AUCTION
+    if CLOSE <= t < POST_CLOSE_END:
+        return PHASE_POST_CLOSE
+    return PHASE_CLOSED
+
+def next_pre_open(dt):
+    """Aware datetime of the next pre-open phase strictly after dt."""
+    dt = dt.astimezone(WARSAW)
+    day = dt.date()
+    if dt.time() >= PRE_OPEN:
+        day += datetime.timedelta(days=1)
+    while not is_trading_day(day):
+        day += datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, PRE_OPEN, tzinfo=WARSAW)
+
+
+class PollingScheduler:
+    """
+    Decides how long MarketDataFetcher sleeps between cycles.
+    - Polls at `session_interval` during continuous trading, slower around it,
+      and sleeps until the next pre-open when the market is closed.
+    - Backs off exponentially (with jitter) on consecutive errors.
+    - Keeps the period above 2x the average fetch time, so slow fetches
+      never overlap and never take more than half of the time.
+    """
+    PHASE_FACTORS = {
+        PHASE_PRE_OPEN: 2.0,
+        PHASE_CONTINUOUS: 1.0,
+        PHASE_CLOSING_AUCTION: 1.0,
+        PHASE_POST_CLOSE: 2.0,
+    }
+    MIN_SLEEP = 1.0
+
+    def __init__(self, session_interval=30, max_backoff=600, max_closed_sleep=3600,
+                 market_hours=True):
+        self.session_interval = session_interval
+        self.max_backoff = max_backoff
+        # Re-check at least this often even when closed (clock changes, manual wake-ups)
+        self.max_closed_sleep = max_closed_sleep
+        self.market_hours = market_hours
+        self.failures = 0
+        self.avg_duration = None
+
+    def phase(self, now_ts):
+        if not self.market_hours:
+            return PHASE_CONTINUOUS
+        return session_phase(to_warsaw(now_ts))
+
+    def next_delay(self, duration, ok, now_ts):
+        """Seconds to sleep after a cycle that took `duration` seconds."""
+        # Moving average of the fetch duration
+        if self.avg_duration is None:
+            self.avg_duration = duration
+        else:
+            self.avg_duration = 0.7 * self.avg_duration + 0.3 * duration
+
+        if not ok:
+            self.failures += 1
+            backoff = min(self.max_backoff, self.session_interval * 2 ** (self.failures - 1))
+            # Full jitter - clients retrying in sync don't hammer the API together
+            return max(self.MIN_SLEEP, random.uniform(0.5, 1.0) * backoff)
+        self.failures = 0
+
+        phase = self.phase(now_ts)
+        if phase == PHASE_CLOSED:
+            wait = (next_pre_open(to_warsaw(now_ts)).timestamp() - now_ts)
+            return max(self.MIN_SLEEP, min(wait, self.max_closed_sleep))
+
+        period = max(self.session_interval * self.PHASE_FACTORS[phase], 2.0 * self.avg_duration)
+        # A single slow fetch still gets a breather of at least the average duration
+        return max(self.MIN_SLEEP, period - duration, self.avg_duration)
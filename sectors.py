@@ -1,132 +1,15 @@
 
+import datetime
+import hashlib
 import json
 import os
-import requests
+import random
+import threading
 import time
-from bs4 import BeautifulSoup
-from database import init_db, get_sector_from_db, save_sector_to_db
-
-# Upewniamy się, że tabela w bazie jest utworzona
-init_db()
-
-# Statyczna lista jako "seed" dla spółek, których API nie wykrywa
-STATIC_SECTORS = {
-    # Finanse / Bankowość / Inwestycje
-    "MENNICA": "Finanse",
-    "MCI": "Finanse",
-    "QUERCUS": "Finanse",
-    "VOTUM": "Finanse",
-    "BOS": "Bankowość",
-    "XTB": "Finanse",
-
-    # Nieruchomości / Deweloperzy
-    "ECHO": "Nieruchomości",
-    "MLPGROUP": "Nieruchomości",
-    "MURAPOL": "Nieruchomości",
-    "ARCHICOM": "Nieruchomości",
-    "ATAL": "Nieruchomości",
-    "DEVELIA": "Nieruchomości",
-    "GTC": "Nieruchomości",
-    "PHN": "Nieruchomości",
-
-    # Budownictwo
-    "TORPOL": "Budownictwo",
-    "POLIMEXMS": "Budownictwo",
-    "FERRO": "Budownictwo",
-    "DECORA": "Budownictwo",
-    "ELEKTROTI": "Budownictwo",
-    "SELENAFM": "Budownictwo",
-    "UNIBEP": "Budownictwo",
-    "MOSTALZAB": "Budownictwo",
-    "ERBUD": "Budownictwo",
-    "ONDE": "Budownictwo",
-    "MCR": "Budownictwo", 
-    "PEKABEX": "Budownictwo",
-    "TIM": "Budownictwo",
-    "SNIEZKA": "Budownictwo",  # Farby i lakiery
-
-    # Przemysł / Produkcja
-    "APATOR": "Przemysł",
-    "STALPROD": "Przemysł",
-    "GRENEVIA": "Przemysł",
-    "BORYSZEW": "Przemysł",
-    "FORTE": "Przemysł",
-    "AMICA": "Przemysł",
-    "COGNOR": "Przemysł",
-    "ARCTIC": "Przemysł",
-    "WIELTON": "Przemysł",
-    "MANGATA": "Przemysł",
-    "PCCROKITA": "Chemia",
-    "CLNPHARMA": "Medycyna",  # Pharma
-    
-    # Spożywczy
-    "WAWEL": "Spożywczy",
-    "TARCZYNSKI": "Spożywczy",
-    "AMBRA": "Spożywczy",
-    "ASTARTA": "Spożywczy",
-
-    # IT / Technologia
-    "CREOTECH": "Technologia",
-    "VIGOPHOTN": "Technologia",
-    "XTPL": "Technologia",
-    "ASSECOBS": "IT",
-    "COMP": "IT",
-    "SHOPER": "IT",
-    "DATAWALK": "IT",
-    "SYGNITY": "IT",
-    "AILLERON": "IT",
-    "R22": "IT",
-
-    # Medycyna / Bio
-    "SELVITA": "Medycyna",
-    "RYVU": "Medycyna",
-    "BIOCELTIX": "Medycyna",
-    "CAPTORTX": "Medycyna",
-    "SCPFL": "Medycyna",
-    "MEDICALG": "Medycyna",
-    "SNTVERSE": "Medycyna",
-    "BIOTON": "Medycyna",
-    "MERCATOR": "Medycyna",
-    "MABION": "Medycyna",
-    "MOLECURE": "Medycyna",
-
-    # Handel / E-commerce
-    "OPONEO.PL": "Handel",
-    "TOYA": "Handel",
-    "DADELO": "Handel",
-    "WITTCHEN": "Odzież",
-    "VRG": "Odzież",
-    "AGORA": "Media",  # Wydawnictwo/Media
-    
-    # Usługi / Inne
-    "ENTER": "Usługi",
-    "STALEXP": "Usługi",
-    "RAINBOW": "Usługi",
-    "BENEFIT": "Usługi", 
-    
-    # Gaming
-    "PLAYWAY": "Gaming",
-    "BLOOBER": "Gaming",
-    "CREEPYJAR": "Gaming",
-    "CIGAMES": "Gaming",
-    "11BIT": "Gaming",
-    "PCFGROUP": "Gaming",
-
-    # Energia / Paliwa / Górnictwo
-    "KOGENERA": "Energetyka",
-    "ZEPAK": "Energetyka",
-    "UNIMOT": "Paliwa",
-    "COLUMBUS": "Energetyka",
-    "MLSYSTEM": "Energetyka",
-    "BOGDANKA": "Górnictwo",
-    "BUMECH": "Górnictwo",
-    "GREENX": "Górnictwo",
-    "ACAUTOGAZ": "Paliwa",
-    
-    # Motoryzacja
-    "SANOK": "Motoryzacja",
-    "ARLEN": "Motoryzacja",
-}
+from concurrent.futures import ThreadPoolExecutor
+from database import save_sector_to_db, bulk_upsert_sectors, load_all_sectors, get_meta, set_meta
+from index_engine import UNKNOWN_SECTOR
+from symbols import symbol_master
 
 # Mapowanie indeksów sektorowych GPW na czytelne nazwy
 INDEX_TO_SECTOR = {
@@ -151,78 +34,208 @@ INDEX_TO_SECTOR = {
     "WIG-ESG": "Inne" # Zbyt ogólne
 }
 
+# --- Pobieranie live (Biznesradar) ---
+BIZNESRADAR_URL = "https://www.biznesradar.pl/notowania/{ticker}"
+
+# Udajemy przeglądarkę
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+ENRICH_WORKERS = 8          # Równoległe zapytania HTTP
+REQUESTS_PER_SECOND = 4.0   # Limit, żeby nie zbanowali IP przy masowym pobieraniu
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5          # Sekundy, podwajane przy każdej próbie
+HTTP_TIMEOUT = 5
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+    acquire() blocks until a token is available.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Wspólny limiter dla wszystkich wątków
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+
+_session_local = threading.local()
+
+def get_session():
+    """Returns this thread's keep-alive HTTP session (requests.Session isn't thread-safe)."""
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        import requests # Lazy - only needed when sectors are scraped
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ENRICH_WORKERS)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(HTTP_HEADERS)
+        _session_local.session = session
+    return session
+
+def parse_sector(html):
+    """Szuka w stronie Biznesradar przynależności do indeksów sektorowych."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    
+    # Szukamy sekcji "Udział w indeksach" lub linków zawierających "WIG-"
+    # Zazwyczaj są w divie o id lub klasie, ale prościej przeszukać wszystkie linki
+    links = soup.find_all("a", href=True)
+    
+    found_sectors = []
+    
+    for link in links:
+        href = link['href']
+        # Sprawdzamy czy link prowadzi do indeksu WIG
+        if "indeks:WIG-" in href or "indeks:WIG." in href:
+            # Wyciągamy nazwę indeksu np. WIG-GRY
+            parts = href.split("indeks:")
+            if len(parts) > 1:
+                idx_name = parts[1].split(",")[0].upper()
+                
+                # Sprawdzamy w naszej mapie
+                for key in INDEX_TO_SECTOR:
+                    if key in idx_name:
+                        found_sectors.append(INDEX_TO_SECTOR[key])
+                        
+    if found_sectors:
+        # Zwracamy najczęstszy lub pierwszy (priorytet: IT, Gaming, Banki)
+        # Prostym sposobem jest wzięcie pierwszego unikalnego
+        return found_sectors[0]
+        
+    # Fallback 2: Szukamy tekstu "Sektor" w treści (jeśli indeksy zawiodą)
+    # Np. "Sektor: Informatyka"
+    # To wymagałoby zaawansowanego parsowania tekstu, na razie pomijamy
+    return None
+
 def fetch_sector_live(ticker):
     """
     Pobiera stronę Biznesradar dla danego tickera i szuka przynależności do indeksów sektorowych.
     To jest ta 'Część AI' - dynamiczne wnioskowanie z sieci.
+    Zapytania idą przez wspólny limiter (token bucket) i są ponawiane z backoffem.
     """
-    url = f"https://www.biznesradar.pl/notowania/{ticker}"
-    try:
-        # Udajemy przeglądarkę
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        response = requests.get(url, headers=headers, timeout=5)
-        if response.status_code != 200:
+    import requests
+    url = BIZNESRADAR_URL.format(ticker=ticker)
+    for attempt in range(MAX_RETRIES):
+        rate_limiter.acquire()
+        try:
+            response = get_session().get(url, timeout=HTTP_TIMEOUT)
+            if response.status_code == 200:
+                return parse_sector(response.text)
+            if response.status_code != 429 and response.status_code < 500:
+                return None # 404 itp. - ponawianie nic nie da
+        except requests.RequestException as e:
+            if attempt == MAX_RETRIES - 1:
+                print(f"Błąd pobierania sektora dla {ticker}: {e}")
+        except Exception as e:
+            print(f"Błąd pobierania sektora dla {ticker}: {e}")
             return None
-        
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # Szukamy sekcji "Udział w indeksach" lub linków zawierających "WIG-"
-        # Zazwyczaj są w divie o id lub klasie, ale prościej przeszukać wszystkie linki
-        links = soup.find_all("a", href=True)
-        
-        found_sectors = []
-        
-        for link in links:
-            href = link['href']
-            # Sprawdzamy czy link prowadzi do indeksu WIG
-            if "indeks:WIG-" in href or "indeks:WIG." in href:
-                # Wyciągamy nazwę indeksu np. WIG-GRY
-                parts = href.split("indeks:")
-                if len(parts) > 1:
-                    idx_name = parts[1].split(",")[0].upper()
-                    
-                    # Sprawdzamy w naszej mapie
-                    for key in INDEX_TO_SECTOR:
-                        if key in idx_name:
-                            found_sectors.append(INDEX_TO_SECTOR[key])
-                            
-        if found_sectors:
-            # Zwracamy najczęstszy lub pierwszy (priorytet: IT, Gaming, Banki)
-            # Prostym sposobem jest wzięcie pierwszego unikalnego
-            return found_sectors[0]
-            
-        # Fallback 2: Szukamy tekstu "Sektor" w treści (jeśli indeksy zawiodą)
-        # Np. "Sektor: Informatyka"
-        # To wymagałoby zaawansowanego parsowania tekstu, na razie pomijamy
 
-    except Exception as e:
-        print(f"Błąd pobierania sektora dla {ticker}: {e}")
+        # Exponential backoff z jitterem (po ostatniej próbie nie ma na co czekać)
+        if attempt < MAX_RETRIES - 1:
+            time.sleep(BACKOFF_BASE * (2 ** attempt) * (0.5 + random.random()))
         
     return None
 
+# --- Cache sektorów ---
+SECTOR_TTL = datetime.timedelta(days=30)    # Po tym czasie sektor z sieci jest weryfikowany ponownie
+
+# Sektory ze słownika symboli (symbols.csv / import CSV) - wersja zmienia się
+# razem z ich treścią, wtedy baza wiedzy jest ponownie zasiewana
+STATIC_SECTORS_META_KEY = "static_sectors_version"
+
+def static_sectors_version(static):
+    return hashlib.sha1(json.dumps(static, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+class SectorCache:
+    """
+    Tiered sector lookup: symbol master sectors -> in-memory copy of `companies`.
+    The whole table is loaded with one query on first use; after that
+    lookups do no I/O. Static sectors are written to the DB only when their
+    version stamp changes.
+    """
+    def __init__(self, ttl=SECTOR_TTL):
+        self.ttl = ttl
+        self._sectors = {}  # ticker -> sector
+        self._updated = {}  # ticker -> datetime (None = unknown)
+        self._static = {}   # ticker -> sector from the symbol master
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            # Jednorazowe zasianie bazy danymi statycznymi
+            self._static = dict(symbol_master.static_sectors())
+            version = static_sectors_version(self._static)
+            if get_meta(STATIC_SECTORS_META_KEY) != version:
+                bulk_upsert_sectors(self._static)
+                set_meta(STATIC_SECTORS_META_KEY, version)
+
+            for ticker, (sector, updated_at) in load_all_sectors().items():
+                if sector:
+                    self._sectors[ticker] = sector
+                    self._updated[ticker] = updated_at
+            # Static overrides - ufamy im bezwarunkowo
+            self._sectors.update(self._static)
+            self._loaded = True
+
+    def get(self, ticker):
+        """Returns the cached sector or None."""
+        if not self._loaded:
+            self.load()
+        return self._sectors.get(ticker)
+
+    def put(self, ticker, sector):
+        """Updates memory only - the caller persists to DB."""
+        self._sectors[ticker] = sector
+        self._updated[ticker] = datetime.datetime.now()
+
+    def stale_tickers(self, tickers=None):
+        """Tickers (non-static) whose sector is older than the TTL and should be re-verified."""
+        if not self._loaded:
+            self.load()
+        cutoff = datetime.datetime.now() - self.ttl
+        candidates = tickers if tickers is not None else self._sectors.keys()
+        return [t for t in candidates
+                if t in self._sectors and t not in self._static
+                and (self._updated.get(t) is None or self._updated[t] < cutoff)]
+
+sector_cache = SectorCache()
+
 def get_sector(ticker):
     """
     Zwraca sektor. Priorytety:
     1. Static Map (najszybciej, nadpisuje wszystko)
-    2. Baza Danych (już znane)
+    2. Cache w pamięci (kopia bazy danych - bez I/O)
     3. Scraping online (AI/Live) -> Zapis do Bazy
     4. "Nieznany"
     """
     ticker = ticker.upper().strip()
     
-    # 0. Static overrides (fixing issues with unidentified sectors)
-    # Jeśli mamy zdefiniowane na sztywno - ufamy temu bezwarunkowo.
-    if ticker in STATIC_SECTORS:
-        # Zapisujemy do bazy, żeby sektor był dostępny przy kolejnym uruchomieniu
-        save_sector_to_db(ticker, STATIC_SECTORS[ticker]) 
-        return STATIC_SECTORS[ticker]
-
-    # 1. Sprawdzamy w bazie danych SQLite
-    db_sector = get_sector_from_db(ticker)
-    if db_sector:
-        return db_sector
+    # 0-1. Static overrides + baza (już w pamięci)
+    sector = sector_cache.get(ticker)
+    if sector:
+        return sector
     
     # 2. Live Scraping (tylko jeśli nie ma w bazie i nie ma w static)
     print(f"[AI] Rozpoznaję sektor dla nowej spółki: {ticker}...")
@@ -231,28 +244,49 @@ def get_sector(ticker):
     if sector:
         print(f" -> Znaleziono: {sector}")
         save_sector_to_db(ticker, sector)
-        # Małe opóźnienie żeby nie zbanowali IP przy masowym pobieraniu
-        time.sleep(0.5) 
+        sector_cache.put(ticker, sector)
         return sector
     
     # 3. Fallback
-    return "Inne / Nieznany"
+    return UNKNOWN_SECTOR
 
 def enrich_data_with_sectors(data_list):
     """
     Przebiega przez listę spółek i uzupełnia sektory.
+    Znane sektory są brane z cache, nieznane (oraz przeterminowane - TTL)
+    pobierane równolegle (pula wątków + limiter), a wynik zapisywany
+    jednym bulk upsertem.
     Wyświetla pasek postępu w konsoli.
     """
     print("\n--- [AI] Aktualizacja bazy wiedzy o sektorach (SQLite) ---")
-    
-    for i, company in enumerate(data_list):
-        ticker = company.get('ticker')
-        # Wywołanie get_sector automatycznie pobierze i zapisze do DB jeśli trzeba
-        sec = get_sector(ticker)
-        company['sector'] = sec
-        
-        if i % 20 == 0:
-            print(f"Przetworzono {i}/{len(data_list)}...")
+
+    tickers = sorted({c.get('ticker', '').upper().strip() for c in data_list if c.get('ticker')})
+
+    # 1. Cache (bez I/O) + lista do sprawdzenia w sieci
+    unknown = [t for t in tickers if not sector_cache.get(t)]
+    to_fetch = unknown + sector_cache.stale_tickers(tickers)
+    to_save = {}
+
+    # 2. Nieznane i przeterminowane - równolegle, z limitem zapytań
+    if to_fetch:
+        print(f"[AI] Rozpoznaję sektory dla {len(unknown)} nowych spółek "
+              f"(+{len(to_fetch) - len(unknown)} do weryfikacji)...")
+        with ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="sector") as pool:
+            for i, (ticker, sector) in enumerate(zip(to_fetch, pool.map(fetch_sector_live, to_fetch))):
+                # Jeśli weryfikacja się nie uda, zostaje stara wartość
+                if sector:
+                    to_save[ticker] = sector
+                if i % 20 == 0:
+                    print(f"Przetworzono {i}/{len(to_fetch)}...")
+
+    # 3. Jeden zapis do bazy
+    bulk_upsert_sectors(to_save)
+    for ticker, sector in to_save.items():
+        sector_cache.put(ticker, sector)
+
+    for company in data_list:
+        ticker = company.get('ticker', '').upper().strip()
+        company['sector'] = sector_cache.get(ticker) or UNKNOWN_SECTOR
             
     print("Zakończono analizę sektorową.\n")
     return data_list
@@ -0,0 +1,107 @@
+"""
+Intraday history of one universe as a columnar matrix for the heatmap
+replay: rows = bar timestamps of the session, columns = tickers, values =
+change % (forward-filled - a ticker without a new bar keeps its last value).
+State at time T is one searchsorted + one row slice.
+Read from the columnar bar store when it is up to date with SQLite, else from SQLite.
+"""
+import numpy as np
+
+from bar_store import BarStore, day_bounds
+from database import load_session_changes, get_last_tick_ts, get_last_bar_times
+
+
+def _store_complete(day, tickers, since, until):
+    """
+    True if the bar store has the newest bar SQLite has that day for every
+    ticker (it lags behind `ticks` e.g. after failed writes to bars/).
+    """
+    last = {t: ts for t, ts in get_last_bar_times(tickers, until_ts=until - 1).items() if ts >= since}
+    if not last:
+        return True
+    if any(t not in day.rows for t in last):
+        return False
+    close = day.field('close')
+    rows = np.fromiter((day.rows[t] for t in last), dtype=np.intp, count=len(last))
+    slots = np.fromiter((day.slot(ts) for ts in last.values()), dtype=np.intp, count=len(last))
+    return not np.isnan(close[rows, slots]).any()
+
+
+class SessionHistory:
+    """Per-bar change % of a set of tickers over one session (T x N float32 matrix)."""
+    def __init__(self, tickers, times, changes):
+        self.tickers = list(tickers)
+        self.times = np.asarray(times, dtype=np.int64)     # (T,) ascending bar ts
+        self.changes = changes                              # (T, N) float32, NaN = no bar yet
+        self._column = {t: i for i, t in enumerate(self.tickers)}
+
+    @classmethod
+    def from_rows(cls, tickers, rows):
+        """rows: (ticker, ts, change_pct) ordered by ts."""
+        tickers = list(tickers)
+        column = {t: i for i, t in enumerate(tickers)}
+        rows = [r for r in rows if r[0] in column]
+        times = np.unique(np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows)))
+        changes = np.full((len(times), len(tickers)), np.nan, dtype=np.float32)
+        if rows:
+            t_idx = np.searchsorted(times, [r[1] for r in rows])
+            c_idx = np.fromiter((column[r[0]] for r in rows), dtype=np.intp, count=len(rows))
+            changes[t_idx, c_idx] = np.array([np.nan if r[2] is None else r[2] for r in rows], dtype=np.float32)
+            changes = _forward_fill(changes)
+        return cls(tickers, times, changes)
+
+    @classmethod
+    def from_day(cls, tickers, day):
+        """Whole day of a bar_store.BarDay - one gather from the mapped change % matrix."""
+        tickers = list(tickers)
+        rows = np.array([day.rows.get(t, -1) for t in tickers], dtype=np.intp)
+        if not len(day.tickers) or not (rows >= 0).any():
+            return cls(tickers, [], np.empty((0, len(tickers)), dtype=np.float32))
+        picked = day.field('change_pct')[np.maximum(rows, 0)]    # (N, minutes) copy
+        picked[rows < 0] = np.nan
+        slots = np.flatnonzero(~np.isnan(picked).all(axis=0))   # Minutes with any bar
+        changes = np.ascontiguousarray(picked[:, slots].T)
+        return cls(tickers, day.times(slots), _forward_fill(changes))
+
+    @classmethod
+    def load(cls, tickers, ts=None):
+        """Session of the day containing ts (default: day of the newest stored bar)."""
+        tickers = list(tickers)
+        if ts is None:
+            ts = get_last_tick_ts(tickers)
+            if ts is None:
+                return cls(tickers, [], np.empty((0, len(tickers)), dtype=np.float32))
+        since, until = day_bounds(ts)
+        day = BarStore().day(ts)
+        if day is not None and _store_complete(day, tickers, since, until):
+            return cls.from_day(tickers, day)
+        return cls.from_rows(tickers, load_session_changes(tickers, since, until))
+
+    def __len__(self):
+        return len(self.times)
+
+    def index_at(self, ts):
+        """Row of the state at time ts (last bar at or before ts; 0 before the first bar)."""
+        return max(0, int(np.searchsorted(self.times, ts, side='right')) - 1)
+
+    def columns(self, tickers):
+        """Column indexes for a ticker order (-1 for tickers without history)."""
+        return np.array([self._column.get(t, -1) for t in tickers], dtype=np.intp)
+
+    def frame(self, i, columns):
+        """change % at row i in the order given by `columns` (from columns())."""
+        row = self.changes[i]
+        values = row[columns]
+        values[columns < 0] = np.nan
+        return values
+
+
+def _forward_fill(matrix):
+    """NaN cells take the last non-NaN value above them (per column)."""
+    valid = ~np.isnan(matrix)
+    idx = np.where(valid, np.arange(len(matrix))[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = matrix[idx, np.arange(matrix.shape[1])]
+    # Before a ticker's first bar there is nothing to carry forward
+    filled[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    return filled
@@ -0,0 +1,217 @@
+"""
+Symbol master: GPW name <-> Yahoo symbol <-> ISIN, plus static sector and
+index memberships. Stored in the `symbols` table (seeded from symbols.csv),
+loaded once into dict indexes - lookups in both directions are O(1) and
+no symbol strings are rebuilt per fetch cycle.
+"""
+import csv
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+from database import load_symbols, upsert_symbols, get_meta, set_meta
+
+SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "symbols.csv")
+SEED_META_KEY = "symbols_seed_version"
+YAHOO_SUFFIX = ".WA"
+INDEX_SEPARATOR = ";"
+
+# yahoo: full Yahoo symbol ("MUR.WA"); indices: tuple of index names
+Symbol = namedtuple('Symbol', ['gpw', 'yahoo', 'isin', 'sector', 'indices'])
+
+
+class SymbolConflictError(ValueError):
+    """Import rejected - the same symbol/ISIN would belong to two companies."""
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"{len(conflicts)} konflikt(y) w słowniku symboli:\n  " + "\n  ".join(conflicts))
+
+
+def default_yahoo(gpw):
+    return f"{gpw}{YAHOO_SUFFIX}"
+
+def make_symbol(gpw, yahoo=None, isin=None, sector=None, indices=None):
+    """Normalized Symbol. yahoo without a market suffix gets ".WA"; None = not given."""
+    gpw = (gpw or '').strip().upper()
+    if not gpw:
+        raise ValueError("Brak nazwy GPW")
+    yahoo = (yahoo or '').strip().upper() or None
+    if yahoo and '.' not in yahoo:
+        yahoo += YAHOO_SUFFIX
+    isin = (isin or '').strip().upper() or None
+    sector = (sector or '').strip() or None
+    if isinstance(indices, str):
+        indices = indices.split(INDEX_SEPARATOR)
+    indices = tuple(i.strip() for i in (indices or ()) if i and i.strip())
+    return Symbol(gpw, yahoo, isin, sector, indices)
+
+def to_row(e):
+    """Symbol -> DB row tuple (gpw, yahoo, isin, sector, indices)."""
+    return (e.gpw, e.yahoo, e.isin, e.sector, INDEX_SEPARATOR.join(e.indices) or None)
+
+def read_csv(path):
+    """Reads symbols from CSV with columns gpw, yahoo, isin, sector, indices (all but gpw optional)."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        if 'gpw' not in (reader.fieldnames or ()):
+            raise ValueError(f"{path}: brak kolumny 'gpw'")
+        return [make_symbol(r.get('gpw'), r.get('yahoo'), r.get('isin'), r.get('sector'), r.get('indices'))
+                for r in reader if (r.get('gpw') or '').strip()]
+
+def merge_existing(entries, by_gpw):
+    """Blank fields of imported entries keep the stored values (partial CSVs don't wipe data)."""
+    merged = []
+    for e in entries:
+        old = by_gpw.get(e.gpw)
+        if old is not None:
+            e = e._replace(**{f: getattr(old, f) for f in ('yahoo', 'isin', 'sector', 'indices') if not getattr(e, f)})
+        merged.append(e)
+    return merged
+
+def find_conflicts(entries, existing=()):
+    """
+    Conflicting entries as readable messages (empty list = OK):
+    - the same GPW name twice with different data,
+    - one Yahoo symbol or ISIN for two GPW names (in the import or against
+      existing entries that the import doesn't replace).
+    """
+    conflicts = []
+    incoming = {}
+    for e in entries:
+        if e.gpw in incoming and incoming[e.gpw] != e:
+            conflicts.append(f"{e.gpw}: dwa różne wpisy ({incoming[e.gpw].yahoo or '-'} / {e.yahoo or '-'})")
+        incoming[e.gpw] = e
+
+    kept = [e for e in existing if e.gpw not in incoming]
+    for field in ('yahoo', 'isin'):
+        owners = {}
+        for e in kept:
+            value = (e.yahoo or default_yahoo(e.gpw)) if field == 'yahoo' else e.isin
+            if value:
+                owners[value] = e.gpw
+        for e in incoming.values():
+            value = (e.yahoo or default_yahoo(e.gpw)) if field == 'yahoo' else e.isin
+            if not value:
+                continue
+            owner = owners.setdefault(value, e.gpw)
+            if owner != e.gpw:
+                conflicts.append(f"{field} {value}: {owner} i {e.gpw}")
+    return conflicts
+
+
+class SymbolMaster:
+    """In-memory symbol master with dict indexes by GPW name, Yahoo symbol, ISIN and index."""
+    def __init__(self, seed_file=SEED_FILE):
+        self.seed_file = seed_file
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._index({})
+
+    def _index(self, by_gpw):
+        # Indexes are rebuilt and swapped whole - readers never see a half-built state
+        yahoo = {e.gpw: e.yahoo or default_yahoo(e.gpw) for e in by_gpw.values()}
+        by_index = {}
+        for e in by_gpw.values():
+            for name in e.indices:
+                by_index.setdefault(name, []).append(e.gpw)
+        self._by_gpw = by_gpw
+        self._yahoo = yahoo
+        self._by_yahoo = {y: g for g, y in yahoo.items()}
+        self._by_isin = {e.isin: e.gpw for e in by_gpw.values() if e.isin}
+        self._by_index = by_index
+        self._sectors = {e.gpw: e.sector for e in by_gpw.values() if e.sector}
+
+    def load(self):
+        """Seeds the DB from symbols.csv when the file changed, then loads the table once."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._seed()
+            self._index({r['gpw']: make_symbol(**r) for r in load_symbols()})
+            self._loaded = True
+
+    def _seed(self):
+        if not os.path.exists(self.seed_file):
+            return
+        with open(self.seed_file, 'rb') as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:12]
+        if get_meta(SEED_META_KEY) == version:
+            return
+        existing = {r['gpw']: make_symbol(**r) for r in load_symbols()}
+        entries = merge_existing(read_csv(self.seed_file), existing)
+        conflicts = find_conflicts(entries, existing.values())
+        if conflicts:
+            # Wpisy użytkownika mają pierwszeństwo - seed pominięty
+            print(f"[Symbols] Pominięto {os.path.basename(self.seed_file)}: {SymbolConflictError(conflicts)}")
+            return
+        upsert_symbols([to_row(e) for e in entries])
+        set_meta(SEED_META_KEY, version)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def import_csv(self, path):
+        """
+        Bulk import (insert or update by GPW name, blank fields keep stored values).
+        Validated first - on any conflict nothing is written and SymbolConflictError is raised.
+        Returns the number of imported entries.
+        """
+        self._ensure_loaded()
+        entries = read_csv(path)
+        return self.import_entries(entries)
+
+    def import_entries(self, entries):
+        self._ensure_loaded()
+        entries = merge_existing(entries, self._by_gpw)
+        conflicts = find_conflicts(entries, self._by_gpw.values())
+        if conflicts:
+            raise SymbolConflictError(conflicts)
+        upsert_symbols([to_row(e) for e in entries])
+        with self._lock:
+            by_gpw = dict(self._by_gpw)
+            by_gpw.update((e.gpw, e) for e in entries)
+            self._index(by_gpw)
+        return len(entries)
+
+    # --- Lookups (O(1)) ---
+
+    def get(self, gpw):
+        """Symbol entry for a GPW name or None."""
+        self._ensure_loaded()
+        return self._by_gpw.get(gpw)
+
+    def yahoo(self, gpw):
+        """Yahoo symbol for a GPW name (default "<gpw>.WA" for unknown names)."""
+        self._ensure_loaded()
+        symbol = self._yahoo.get(gpw)
+        if symbol is None:
+            symbol = default_yahoo(gpw)
+        return symbol
+
+    def gpw(self, yahoo):
+        """GPW name for a Yahoo symbol (suffix stripped for unknown symbols)."""
+        self._ensure_loaded()
+        name = self._by_yahoo.get(yahoo)
+        if name is None and yahoo.endswith(YAHOO_SUFFIX):
+            name = yahoo[:-len(YAHOO_SUFFIX)]
+        return name
+
+    def by_isin(self, isin):
+        self._ensure_loaded()
+        return self._by_isin.get(isin)
+
+    def members(self, index):
+        """GPW names listed as members of an index."""
+        self._ensure_loaded()
+        return list(self._by_index.get(index, ()))
+
+    def static_sectors(self):
+        """{gpw: sector} for entries with a fixed sector - trusted over scraping."""
+        self._ensure_loaded()
+        return self._sectors
+
+
+# Shared instance
+symbol_master = SymbolMaster()
@@ -1,168 +1,191 @@
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import squarify
-from matplotlib.colors import Normalize
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import threading
+import time
 import tkinter as tk
+from collections import namedtuple
 from tkinter import ttk
-import time
 
-# Import database functions to read buffer
-from database import load_portfolio_from_db
+# Shared in-memory market state (SQLite only for cold start)
+from market_state import get_market_snapshot
+# Rendering itself lives in charts.py (no Tk), on a worker thread (render_worker.py)
+from charts import BG_COLOR, HeatMapRenderer, get_color, change_colors, new_heatmap_figure
+from render_worker import RenderWorker, ChartImage
+
+REPLAY_FPS = 30
+
+# Render job for one replay frame: row `index` of a SessionHistory.
+# snapshot gives the tile layout (composition/shares) the history is drawn on.
+ReplayFrame = namedtuple('ReplayFrame', ['history', 'index', 'snapshot', 'version'])
+
+def heatmap_setup():
+    """RenderWorker setup: heatmap Figure + draw(job) on the render thread."""
+    fig, ax = new_heatmap_figure(figsize=(12, 8))
+    renderer = HeatMapRenderer(fig, ax)
+    def draw(job):
+        if isinstance(job, ReplayFrame):
+            if not renderer.tickers and not renderer.render(job.snapshot.portfolio):
+                return False # Nothing to lay out yet
+            # Recolor only - layout, text and background are cached images
+            values = job.history.frame(job.index, job.history.columns(renderer.tickers))
+            stamp = time.strftime("%H:%M", time.localtime(int(job.history.times[job.index])))
+            return renderer.replay_frame(change_colors(values), f"Powtórka: {stamp}")
+        # Time of the data, not of the redraw - views only redraw on new versions
+        stamp = time.strftime("%H:%M:%S", time.localtime(job.published_at or time.time()))
+        if not renderer.render(job.portfolio, timestamp=stamp):
+            return False
+        # Tiles and text over the cached background - no full figure draw
+        return renderer.frame()
+    return fig, draw
 
 class HeatMapVisualizer(ttk.Frame):
     def __init__(self, parent):
         super().__init__(parent)
         self.pack(fill=tk.BOTH, expand=True)
-        
-        # Create Figure
-        self.fig, self.ax = plt.subplots(figsize=(12, 8))
-        self.fig.patch.set_facecolor('#2b2b2b')
-        self.ax.set_facecolor('#2b2b2b')
-        
-        # Adjust margins to maximize map size
-        # title space at top=0.94, date space at bottom=0.02
-        self.fig.subplots_adjust(left=0.00, right=1.00, top=0.94, bottom=0.00)
-        
-        # Embed in Tkinter
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self)
-        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        
+
+        # Replay of the stored session (replay_index None = live view)
+        self.history = None
+        self.replay_index = None
+        self.playing = False
+        self._loading = False
+        self._history_universe = None
+        self._moving_slider = False # set() runs the slider command - ignore our own moves
+        self._build_replay_controls() # Packed first - the chart takes the rest
+
+        # Figure lives on the render thread - Tk only shows finished frames
+        self.chart = ChartImage(self, RenderWorker('heatmap', heatmap_setup), width=1200, height=800, bg=BG_COLOR)
+        self.chart.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
         # Initial draw
         self.update_plot()
 
+    def _build_replay_controls(self):
+        bar = tk.Frame(self, bg=BG_COLOR)
+        bar.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=5)
+        self.play_button = ttk.Button(bar, text="▶ Odtwórz", width=12, command=self.toggle_play)
+        self.play_button.pack(side=tk.LEFT)
+        self.slider = ttk.Scale(bar, from_=0, to=1, orient=tk.HORIZONTAL, command=self._on_slider)
+        self.slider.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+        self.time_label = tk.Label(bar, text="Na żywo", width=16, bg=BG_COLOR, fg="white", font=('Helvetica', 10, 'bold'))
+        self.time_label.pack(side=tk.LEFT)
+        ttk.Button(bar, text="● Na żywo", command=self.go_live).pack(side=tk.LEFT, padx=(10, 0))
+
     def get_color(self, value):
-        """
-        Returns hex color based on percentage change (Finviz style).
-        """
-        if value is None:
-            return "#4b4b4b" 
-        if value == 0:
-            return "#4b4b4b"
-            
-        if value > 0:
-            if value >= 3.0: return "#1a9641" # Bright Green
-            elif value >= 2.0: return "#35b758"
-            elif value >= 1.0: return "#397d49"
-            else: return "#285233"
-        else:
-            if value <= -3.0: return "#d7191c" # Bright Red
-            elif value <= -2.0: return "#bd3336"
-            elif value <= -1.0: return "#962f32"
-            else: return "#5e2628"
+        return get_color(value)
 
     def update_plot(self):
         """
-        Reads data and draws a HIERARCHICAL Treemap (Sector -> Company).
+        Requests a redraw of the Treemap for the latest snapshot (returns at once).
+        Only colors and labels change between cycles - no full re-layout.
         """
-        data = load_portfolio_from_db()
-        if not data:
+        snap = get_market_snapshot()
+        if not snap.rows:
+            return
+        if self.replay_index is not None:
+            if snap.universe == self._history_universe:
+                return # Replaying - live updates wait for go_live()
+            self.go_live() # Universe switched - the history doesn't match any more
+            return
+        self.chart.render(snap)
+
+    # --- Replay (time travel over the stored session) ---
+
+    def _ensure_history(self, then):
+        """Loads the session matrix in the background, then calls then() on the Tk thread."""
+        if self.history is not None:
+            then()
+            return
+        if self._loading:
+            return
+        self._loading = True
+        snap = get_market_snapshot()
+        self._history_universe = snap.universe
+        self.time_label.config(text="Wczytywanie...")
+        result = {}
+
+        def load():
+            from session_history import SessionHistory
+            try:
+                result['history'] = SessionHistory.load(snap.portfolio.tickers)
+            except Exception as e:
+                result['error'] = e
+        loader = threading.Thread(target=load, daemon=True, name="ReplayLoad")
+        loader.start()
+
+        def wait():
+            if loader.is_alive():
+                self.after(50, wait)
+                return
+            self._loading = False
+            history = result.get('history')
+            if history is None or not len(history):
+                if 'error' in result:
+                    print(f"[Replay] Błąd wczytywania historii: {result['error']}")
+                self.time_label.config(text="Brak historii")
+                return
+            self.history = history
+            self.slider.configure(to=max(1, len(history) - 1))
+            then()
+        self.after(50, wait)
+
+    def show_frame(self, index):
+        """Shows the state at row `index` of the session history."""
+        index = max(0, min(int(index), len(self.history) - 1))
+        self.replay_index = index
+        self._set_slider(index)
+        self.time_label.config(text=time.strftime("%H:%M", time.localtime(int(self.history.times[index]))))
+        snap = get_market_snapshot()
+        self.chart.render(ReplayFrame(self.history, index, snap, snap.version))
+
+    def _set_slider(self, index):
+        if int(float(self.slider.get())) != index:
+            self._moving_slider = True
+            try:
+                self.slider.set(index)
+            finally:
+                self._moving_slider = False
+
+    def _on_slider(self, value):
+        if self._moving_slider:
+            return
+        index = int(float(value))
+        if self.history is None:
+            self._ensure_history(lambda: self.show_frame(index))
+        elif index != self.replay_index:
+            self.show_frame(index)
+
+    def toggle_play(self):
+        if self.playing:
+            self.pause()
+            return
+
+        def start():
+            if self.replay_index is None or self.replay_index >= len(self.history) - 1:
+                self.show_frame(0)
+            self.playing = True
+            self.play_button.config(text="⏸ Pauza")
+            self.after(int(1000 / REPLAY_FPS), self._play_step)
+        self._ensure_history(start)
+
+    def pause(self):
+        self.playing = False
+        self.play_button.config(text="▶ Odtwórz")
+
+    def _play_step(self):
+        if not self.playing:
+            return
+        if not self.winfo_viewable() or self.replay_index >= len(self.history) - 1:
+            self.pause() # Tab hidden or end of the session
             return
+        # One bar per frame; frames the renderer can't keep up with are coalesced
+        self.show_frame(self.replay_index + 1)
+        self.after(int(1000 / REPLAY_FPS), self._play_step)
 
-        # 1. Filter and Prepare
-        data = [c for c in data if c.get('share', 0) > 0]
-        
-        # 2. Group by Sector
-        sectors = {}
-        for c in data:
-            sec = c.get('sector', 'Inne')
-            if sec not in sectors:
-                sectors[sec] = []
-            sectors[sec].append(c)
-            
-        # 3. Calculate Sector Totals and Sort
-        sector_list = [] # List of tuples (name, total_share, companies_list)
-        for sec_name, comps in sectors.items():
-            total = sum(c.get('share', 0) for c in comps)
-            # Sort companies within sector by share descending
-            comps.sort(key=lambda x: x.get('share', 0), reverse=True)
-            sector_list.append({'name': sec_name, 'total': total, 'companies': comps})
-            
-        # Sort sectors by total share descending
-        sector_list.sort(key=lambda x: x['total'], reverse=True)
-        
-        # 4. Layout Calculation
-        
-        # Canvas dimensions (0..100, 0..100)
-        X, Y, DX, DY = 0, 0, 100, 100
-        
-        # Calculate Level 1 (Sectors)
-        sector_shares = [s['total'] for s in sector_list]
-        # Normalize to cover full canvas
-        normed_sectors = squarify.normalize_sizes(sector_shares, DX, DY)
-        sector_rects = squarify.squarify(normed_sectors, X, Y, DX, DY)
-        
-        # 5. Drawing
-        self.ax.clear()
-        self.ax.set_facecolor('#2b2b2b')
-        self.ax.axis('off')
-        
-        # Set limits manually since manual patches depend on it
-        self.ax.set_xlim(0, 100)
-        self.ax.set_ylim(0, 100)
-        
-        for i, rect in enumerate(sector_rects):
-            sec_data = sector_list[i]
-            x, y, dx, dy = rect['x'], rect['y'], rect['dx'], rect['dy']
-            
-            # Draw Sector Border (optional, mainly just space for nested items)
-            # We can draw a subtle border for the sector
-            self.ax.add_patch(
-                patches.Rectangle((x, y), dx, dy, linewidth=2, edgecolor='#1a1a1a', facecolor='none', zorder=10)
-            )
-            
-            # --- Draw Sector Label (Top Left) ---
-            # dynamic font size based on sector size
-            # --- Draw Sector Label (Top Left) ---
-            # dynamic font size based on sector size
-            # Show label even if smaller, just scale font or clip
-            if dx > 1 or dy > 1: # Practically always
-                # Calculate reasonable font size
-                lbl_size = min(12, int(dx/2)) 
-                lbl_size = max(8, lbl_size)
-                
-                self.ax.text(x + 0.5, y + dy - 0.5, sec_data['name'], 
-                             color='white', fontsize=lbl_size, fontweight='bold', ha='left', va='top', zorder=20,
-                             bbox=dict(facecolor='black', alpha=0.4, edgecolor='none', pad=2))
-            
-            # Level 2 (Companies within Sector)
-            comps = sec_data['companies']
-            comp_shares = [c.get('share', 0) for c in comps]
-            
-            # Squarify inside the sector rectangle
-            # Normalize for the sub-rectangle
-            normed_comps = squarify.normalize_sizes(comp_shares, dx, dy)
-            comp_rects = squarify.squarify(normed_comps, x, y, dx, dy)
-            
-            for j, crect in enumerate(comp_rects):
-                comp = comps[j]
-                cx, cy, cdx, cdy = crect['x'], crect['y'], crect['dx'], crect['dy']
-                
-                # Color
-                pct = comp.get('change_pct', 0.0)
-                color = self.get_color(pct)
-                
-                # Draw Box
-                self.ax.add_patch(
-                    patches.Rectangle((cx, cy), cdx, cdy, linewidth=1, edgecolor='#2b2b2b', facecolor=color)
-                )
-                
-                # Label
-                if cdx > 3 and cdy > 3:
-                    fsize = 8 if cdx < 6 else 10
-                    lbl = f"{comp['ticker']}\n{pct:+.1f}%"
-                    self.ax.text(cx + cdx/2, cy + cdy/2, lbl, 
-                                 color='white', fontsize=fsize, fontweight='bold', ha='center', va='center')
-
-        # Static Title Top Center
-        self.ax.set_title("sWIG80tr Map", fontsize=16, color='white', fontweight='bold', pad=10)
-        
-        # Dynamic Timestamp Bottom Right (using Axes coordinates 0..1)
-        # 1.0, 0.0 is bottom right. We offset slightly up.
-        last_update_str = time.strftime("%H:%M:%S")
-        self.ax.text(0.99, 0.01, f"Aktualizacja: {last_update_str}", 
-                     transform=self.ax.transAxes,
-                     color='#aaaaaa', fontsize=10, ha='right', va='bottom',
-                     bbox=dict(facecolor='black', alpha=0.5, edgecolor='none', pad=2))
-
-        self.canvas.draw()
+    def go_live(self):
+        """Back to the live view; the next replay loads a fresh history."""
+        self.pause()
+        self.replay_index = None
+        self.history = None
+        self.time_label.config(text="Na żywo")
+        self._set_slider(0)
+        snap = get_market_snapshot()
+        if snap.rows:
+            self.chart.render(snap)